@@ -0,0 +1,61 @@
+"""Add catalog_version counter
+
+Revision ID: 2c8984882912
+Revises: 609a7179366e
+Create Date: 2025-05-14 18:02:37.540913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2c8984882912"
+down_revision: Union[str, None] = "609a7179366e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "catalog_version",
+        sa.Column("id", sa.INTEGER(), primary_key=True),
+        sa.Column("version", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+    )
+    op.execute("INSERT INTO catalog_version (id, version) VALUES (1, 0)")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # any change to the recipes themselves
+    op.execute("""
+        CREATE TRIGGER potion_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE ON potion_catalog
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version()
+    """)
+
+    # potions rows appearing/disappearing or being (de)activated, but not the
+    # quantity updates the bottler makes on every delivery
+    op.execute("""
+        CREATE TRIGGER potions_catalog_version
+        AFTER INSERT OR DELETE OR UPDATE OF active ON potions
+        FOR EACH ROW EXECUTE FUNCTION bump_catalog_version()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS potions_catalog_version ON potions")
+    op.execute("DROP TRIGGER IF EXISTS potion_catalog_version ON potion_catalog")
+    op.execute("DROP FUNCTION IF EXISTS bump_catalog_version()")
+    op.drop_table("catalog_version")
@@ -0,0 +1,58 @@
+"""Add ledger checkpoints and archive for compaction
+
+Revision ID: 4f8dddd69be5
+Revises: b58c7b78a1f5
+Create Date: 2025-05-19 09:12:03.551870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4f8dddd69be5"
+down_revision: Union[str, None] = "b58c7b78a1f5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # one row per (category, sub_type): the sum of every archived entry.
+    # sub_type is '' rather than NULL so it can be part of the key.
+    op.create_table(
+        "ledger_checkpoints",
+        sa.Column("category", sa.TEXT(), nullable=False),
+        sa.Column("sub_type", sa.TEXT(), server_default=sa.text("''"), nullable=False),
+        sa.Column("quantity", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column("entries", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "last_ledger_id", sa.INTEGER(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column(
+            "compacted_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("category", "sub_type"),
+    )
+
+    # same columns, in the same order, as ledger_entries so compaction can
+    # move rows with INSERT ... SELECT *; no defaults, the ids are kept
+    op.execute("CREATE TABLE ledger_entries_archive (LIKE ledger_entries)")
+    op.create_index(
+        "ix_ledger_entries_archive_id", "ledger_entries_archive", ["id"], unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # put archived rows back so balances survive the downgrade
+    op.execute("INSERT INTO ledger_entries SELECT * FROM ledger_entries_archive")
+    op.drop_index("ix_ledger_entries_archive_id", table_name="ledger_entries_archive")
+    op.drop_table("ledger_entries_archive")
+    op.drop_table("ledger_checkpoints")
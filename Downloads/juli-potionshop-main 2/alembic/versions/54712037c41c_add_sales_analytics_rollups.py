@@ -0,0 +1,82 @@
+"""Add checkout instrumentation and hourly analytics rollups
+
+Revision ID: 54712037c41c
+Revises: f730640af0f3
+Create Date: 2025-05-22 16:48:12.903377
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "54712037c41c"
+down_revision: Union[str, None] = "f730640af0f3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("carts", sa.Column("character_class", sa.TEXT(), nullable=True))
+    op.add_column("carts", sa.Column("checked_out_at", sa.TIMESTAMP(), nullable=True))
+
+    op.create_table(
+        "failed_checkouts",
+        sa.Column("id", sa.INTEGER(), sa.Identity(), primary_key=True),
+        sa.Column("cart_id", sa.INTEGER(), nullable=True),
+        sa.Column("potion_sku", sa.TEXT(), nullable=False),
+        sa.Column("reason", sa.TEXT(), nullable=False),
+        sa.Column(
+            "timestamp", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=False
+        ),
+    )
+
+    # rollups keyed by the hour they cover; character_class is '' for carts
+    # created before it was recorded
+    op.create_table(
+        "sales_hourly",
+        sa.Column("hour", sa.TIMESTAMP(), nullable=False),
+        sa.Column("character_class", sa.TEXT(), nullable=False),
+        sa.Column("potion_sku", sa.TEXT(), nullable=False),
+        sa.Column("potions", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column("gold", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column("orders", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("hour", "character_class", "potion_sku"),
+    )
+    op.create_table(
+        "failed_checkouts_hourly",
+        sa.Column("hour", sa.TIMESTAMP(), nullable=False),
+        sa.Column("potion_sku", sa.TEXT(), nullable=False),
+        sa.Column("reason", sa.TEXT(), nullable=False),
+        sa.Column("failures", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("hour", "potion_sku", "reason"),
+    )
+    op.create_table(
+        "cart_activity_hourly",
+        sa.Column("hour", sa.TIMESTAMP(), nullable=False),
+        sa.Column("character_class", sa.TEXT(), nullable=False),
+        sa.Column(
+            "carts_created", sa.BIGINT(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column(
+            "carts_checked_out",
+            sa.BIGINT(),
+            server_default=sa.text("0"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("hour", "character_class"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("cart_activity_hourly")
+    op.drop_table("failed_checkouts_hourly")
+    op.drop_table("sales_hourly")
+    op.drop_table("failed_checkouts")
+    op.drop_column("carts", "checked_out_at")
+    op.drop_column("carts", "character_class")
@@ -0,0 +1,32 @@
+"""Add pg_trgm index on carts.customer_name
+
+Revision ID: 54c30b76db95
+Revises: b568a699b081
+Create Date: 2025-05-18 15:21:44.906517
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "54c30b76db95"
+down_revision: Union[str, None] = "b568a699b081"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_carts_customer_name_trgm
+        ON carts USING gin (customer_name gin_trgm_ops)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_carts_customer_name_trgm")
@@ -0,0 +1,102 @@
+"""Fold inventory_summary from appended deltas
+
+Revision ID: 59ccbdb0cdaa
+Revises: 8f14fd5f19a7
+Create Date: 2025-05-25 10:12:41.530917
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "59ccbdb0cdaa"
+down_revision: Union[str, None] = "8f14fd5f19a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SUMMARIZED = {
+    "liquid_inventory": (
+        "total_ml",
+        "{row}.red_ml + {row}.green_ml + {row}.blue_ml + {row}.dark_ml",
+    ),
+    "potion_inventory": ("total_potions", "{row}.quantity"),
+    "gold_inventory": ("gold", "{row}.amount"),
+}
+
+
+def delta_function(table: str) -> str:
+    column, value = SUMMARIZED[table]
+    return f"""
+        CREATE OR REPLACE FUNCTION summarize_{table}() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO inventory_summary_deltas ({column}) VALUES (
+                CASE WHEN TG_OP <> 'DELETE'
+                     THEN {value.format(row="NEW")} ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT'
+                       THEN {value.format(row="OLD")} ELSE 0 END
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def summary_function(table: str) -> str:
+    # as of 8f14fd5f19a7
+    column, value = SUMMARIZED[table]
+    return f"""
+        CREATE OR REPLACE FUNCTION summarize_{table}() RETURNS trigger AS $$
+        BEGIN
+            UPDATE inventory_summary SET {column} = {column}
+                + CASE WHEN TG_OP <> 'DELETE'
+                       THEN {value.format(row="NEW")} ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT'
+                       THEN {value.format(row="OLD")} ELSE 0 END
+                , version = version + 1
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the triggers only append here, so an inventory write no longer locks
+    # the one summary row in the middle of its own row locks; deltas are
+    # folded into inventory_summary by a background task
+    op.create_table(
+        "inventory_summary_deltas",
+        sa.Column("id", sa.BIGINT(), sa.Identity(), primary_key=True),
+        sa.Column("total_ml", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "total_potions", sa.BIGINT(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column("gold", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+    )
+    for table in SUMMARIZED:
+        op.execute(delta_function(table))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in SUMMARIZED:
+        op.execute(summary_function(table))
+    op.execute("""
+        WITH folded AS (
+            DELETE FROM inventory_summary_deltas
+            RETURNING total_ml, total_potions, gold
+        )
+        UPDATE inventory_summary SET
+            total_ml = total_ml + (SELECT COALESCE(SUM(total_ml), 0) FROM folded),
+            total_potions = total_potions
+                + (SELECT COALESCE(SUM(total_potions), 0) FROM folded),
+            gold = gold + (SELECT COALESCE(SUM(gold), 0) FROM folded),
+            version = version + (SELECT COUNT(*) FROM folded)
+        WHERE id = 1
+    """)
+    op.drop_table("inventory_summary_deltas")
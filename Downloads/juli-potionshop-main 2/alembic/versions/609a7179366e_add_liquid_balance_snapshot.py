@@ -0,0 +1,55 @@
+"""Add liquid_balance_snapshot table
+
+Revision ID: 609a7179366e
+Revises: 4f49bbb06611
+Create Date: 2025-05-12 10:14:52.118402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "609a7179366e"
+down_revision: Union[str, None] = "4f49bbb06611"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "liquid_balance_snapshot",
+        sa.Column("id", sa.INTEGER(), primary_key=True),
+        sa.Column("red_ml", sa.INTEGER(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "green_ml", sa.INTEGER(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column("blue_ml", sa.INTEGER(), server_default=sa.text("0"), nullable=False),
+        sa.Column("dark_ml", sa.INTEGER(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "last_ledger_id", sa.INTEGER(), server_default=sa.text("0"), nullable=False
+        ),
+    )
+
+    # seed the single snapshot row from whatever is already in the ledger
+    op.execute("""
+        INSERT INTO liquid_balance_snapshot
+            (id, red_ml, green_ml, blue_ml, dark_ml, last_ledger_id)
+        SELECT
+            1,
+            COALESCE(SUM(CASE WHEN category = 'liquid' AND sub_type = 'red_ml' THEN quantity END), 0),
+            COALESCE(SUM(CASE WHEN category = 'liquid' AND sub_type = 'green_ml' THEN quantity END), 0),
+            COALESCE(SUM(CASE WHEN category = 'liquid' AND sub_type = 'blue_ml' THEN quantity END), 0),
+            COALESCE(SUM(CASE WHEN category = 'liquid' AND sub_type = 'dark_ml' THEN quantity END), 0),
+            COALESCE(MAX(id), 0)
+        FROM ledger_entries
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("liquid_balance_snapshot")
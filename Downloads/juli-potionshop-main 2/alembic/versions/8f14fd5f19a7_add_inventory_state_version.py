@@ -0,0 +1,66 @@
+"""Add a state version to inventory_summary
+
+Revision ID: 8f14fd5f19a7
+Revises: d61d34eb88da
+Create Date: 2025-05-24 09:33:58.117402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8f14fd5f19a7"
+down_revision: Union[str, None] = "d61d34eb88da"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SUMMARIZED = {
+    "liquid_inventory": (
+        "total_ml",
+        "{row}.red_ml + {row}.green_ml + {row}.blue_ml + {row}.dark_ml",
+    ),
+    "potion_inventory": ("total_potions", "{row}.quantity"),
+    "gold_inventory": ("gold", "{row}.amount"),
+}
+
+
+def summary_function(table: str, bump_version: bool) -> str:
+    column, value = SUMMARIZED[table]
+    bump = ", version = version + 1" if bump_version else ""
+    return f"""
+        CREATE OR REPLACE FUNCTION summarize_{table}() RETURNS trigger AS $$
+        BEGIN
+            UPDATE inventory_summary SET {column} = {column}
+                + CASE WHEN TG_OP <> 'DELETE'
+                       THEN {value.format(row="NEW")} ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT'
+                       THEN {value.format(row="OLD")} ELSE 0 END
+                {bump}
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # moves on every change to the inventory the planners read, so a plan
+    # computed at one version is still right for as long as it stays put
+    op.add_column(
+        "inventory_summary",
+        sa.Column("version", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+    )
+    for table in SUMMARIZED:
+        op.execute(summary_function(table, bump_version=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in SUMMARIZED:
+        op.execute(summary_function(table, bump_version=False))
+    op.drop_column("inventory_summary", "version")
@@ -0,0 +1,37 @@
+"""Add indexes for keyset paging on /carts/search
+
+Revision ID: b568a699b081
+Revises: 2c8984882912
+Create Date: 2025-05-16 11:47:05.223187
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b568a699b081"
+down_revision: Union[str, None] = "2c8984882912"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # item_sku cursors are (potion_sku, id) on cart_items itself
+    op.create_index("ix_cart_items_potion_sku_id", "cart_items", ["potion_sku", "id"])
+    # lets a cart's line items come back in id order inside the join
+    op.create_index("ix_cart_items_cart_id_id", "cart_items", ["cart_id", "id"])
+    # customer_name and timestamp cursors walk carts in key order, then items
+    op.create_index("ix_carts_customer_name_id", "carts", ["customer_name", "id"])
+    op.create_index("ix_carts_timestamp_id", "carts", ["timestamp", "id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_carts_timestamp_id", table_name="carts")
+    op.drop_index("ix_carts_customer_name_id", table_name="carts")
+    op.drop_index("ix_cart_items_cart_id_id", table_name="cart_items")
+    op.drop_index("ix_cart_items_potion_sku_id", table_name="cart_items")
@@ -0,0 +1,45 @@
+"""Store responses and creation time on processed_requests
+
+Revision ID: b58c7b78a1f5
+Revises: 54c30b76db95
+Create Date: 2025-05-18 10:21:44.918302
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b58c7b78a1f5"
+down_revision: Union[str, None] = "54c30b76db95"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # some databases got a NOT NULL json response column from an early
+    # migration, others have only order_id; end up with the same shape
+    op.execute("ALTER TABLE processed_requests ADD COLUMN IF NOT EXISTS response JSONB")
+    op.execute("ALTER TABLE processed_requests ALTER COLUMN response DROP NOT NULL")
+    op.execute("""
+        ALTER TABLE processed_requests
+        ALTER COLUMN response TYPE JSONB USING response::jsonb
+    """)
+    op.execute("""
+        ALTER TABLE processed_requests
+        ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    """)
+    # the pruning job deletes oldest-first
+    op.create_index(
+        "ix_processed_requests_created_at", "processed_requests", ["created_at"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_processed_requests_created_at", table_name="processed_requests")
+    op.execute("ALTER TABLE processed_requests DROP COLUMN IF EXISTS created_at")
+    op.execute("ALTER TABLE processed_requests DROP COLUMN IF EXISTS response")
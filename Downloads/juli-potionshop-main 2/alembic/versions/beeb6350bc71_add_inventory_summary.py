@@ -0,0 +1,97 @@
+"""Add inventory_summary maintained by triggers
+
+Revision ID: beeb6350bc71
+Revises: 4f8dddd69be5
+Create Date: 2025-05-20 14:37:29.104215
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "beeb6350bc71"
+down_revision: Union[str, None] = "4f8dddd69be5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "inventory_summary",
+        sa.Column("id", sa.INTEGER(), primary_key=True),
+        sa.Column("total_ml", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "total_potions", sa.BIGINT(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.Column("gold", sa.BIGINT(), server_default=sa.text("0"), nullable=False),
+    )
+
+    # seed the single summary row from whatever is in the raw tables now
+    op.execute("""
+        INSERT INTO inventory_summary (id, total_ml, total_potions, gold)
+        SELECT
+            1,
+            (SELECT COALESCE(SUM(red_ml + green_ml + blue_ml + dark_ml), 0)
+             FROM liquid_inventory),
+            (SELECT COALESCE(SUM(quantity), 0) FROM potion_inventory),
+            (SELECT COALESCE(SUM(amount), 0) FROM gold_inventory)
+    """)
+
+    # each trigger adds the row's new value and takes away its old one, so
+    # the summary moves in the same transaction as the change behind it
+    op.execute("""
+        CREATE OR REPLACE FUNCTION summarize_liquid_inventory() RETURNS trigger AS $$
+        BEGIN
+            UPDATE inventory_summary SET total_ml = total_ml
+                + CASE WHEN TG_OP <> 'DELETE'
+                       THEN NEW.red_ml + NEW.green_ml + NEW.blue_ml + NEW.dark_ml
+                       ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT'
+                       THEN OLD.red_ml + OLD.green_ml + OLD.blue_ml + OLD.dark_ml
+                       ELSE 0 END
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION summarize_potion_inventory() RETURNS trigger AS $$
+        BEGIN
+            UPDATE inventory_summary SET total_potions = total_potions
+                + CASE WHEN TG_OP <> 'DELETE' THEN NEW.quantity ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT' THEN OLD.quantity ELSE 0 END
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION summarize_gold_inventory() RETURNS trigger AS $$
+        BEGIN
+            UPDATE inventory_summary SET gold = gold
+                + CASE WHEN TG_OP <> 'DELETE' THEN NEW.amount ELSE 0 END
+                - CASE WHEN TG_OP <> 'INSERT' THEN OLD.amount ELSE 0 END
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in ("liquid_inventory", "potion_inventory", "gold_inventory"):
+        op.execute(f"""
+            CREATE TRIGGER {table}_summary
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION summarize_{table}()
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("liquid_inventory", "potion_inventory", "gold_inventory"):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_summary ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS summarize_{table}()")
+    op.drop_table("inventory_summary")
@@ -0,0 +1,44 @@
+"""Add abandoned_at and a partial index for the abandoned cart sweep
+
+Revision ID: d61d34eb88da
+Revises: 54712037c41c
+Create Date: 2025-05-23 11:20:37.640518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d61d34eb88da"
+down_revision: Union[str, None] = "54712037c41c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("carts", sa.Column("abandoned_at", sa.TIMESTAMP(), nullable=True))
+
+    # only carts still waiting to be checked out or swept; once marked they
+    # leave the index, so it stays the size of the open carts, not the table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_carts_open_timestamp",
+            "carts",
+            ["timestamp"],
+            postgresql_where=sa.text("checked_out = FALSE AND abandoned_at IS NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_carts_open_timestamp", table_name="carts", postgresql_concurrently=True
+        )
+    op.drop_column("carts", "abandoned_at")
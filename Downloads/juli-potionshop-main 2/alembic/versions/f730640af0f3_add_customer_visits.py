@@ -0,0 +1,47 @@
+"""Add customer_visits
+
+Revision ID: f730640af0f3
+Revises: beeb6350bc71
+Create Date: 2025-05-21 10:04:51.218734
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f730640af0f3"
+down_revision: Union[str, None] = "beeb6350bc71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # one row per customer per visit; (visit_id, position) makes a replayed
+    # visit batch a no-op
+    op.create_table(
+        "customer_visits",
+        sa.Column("visit_id", sa.BIGINT(), nullable=False),
+        sa.Column("position", sa.INTEGER(), nullable=False),
+        sa.Column("customer_id", sa.TEXT(), nullable=False),
+        sa.Column("customer_name", sa.TEXT(), nullable=False),
+        sa.Column("character_class", sa.TEXT(), nullable=False),
+        sa.Column("level", sa.INTEGER(), nullable=False),
+        sa.Column("visited_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("visit_id", "position"),
+    )
+    op.create_index(
+        "ix_customer_visits_class_visited_at",
+        "customer_visits",
+        ["character_class", "visited_at"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_customer_visits_class_visited_at", table_name="customer_visits")
+    op.drop_table("customer_visits")
@@ -0,0 +1,137 @@
+"""
+Load comparison of the blocking (threadpool) and async database paths.
+
+For each DB_ASYNC setting a uvicorn server is started on the database in
+POSTGRES_URI, then N concurrent clients each loop over a fixed mix of
+database-bound requests (cart search, cart creation, inventory audit) for
+DURATION seconds. /catalog/ is left out because it is served from cache.
+
+Creates carts named load_* which are not cleaned up; run against a scratch
+database.
+
+    uv run python -m benchmarks.async_load [clients ...]
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import List
+import httpx
+from src import config
+
+CLIENTS = [int(n) for n in sys.argv[1:]] or [50, 200, 1000]
+DURATION = 15.0
+PORT = 3099
+BASE_URL = f"http://127.0.0.1:{PORT}"
+HEADERS = {"access_token": config.get_settings().API_KEY or ""}
+
+
+async def client_loop(
+    client: httpx.AsyncClient, worker: int, deadline: float, latencies: List[float]
+) -> int:
+    errors = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        start = time.perf_counter()
+        try:
+            match i % 3:
+                case 0:
+                    response = await client.get(
+                        "/carts/search/", params={"customer_name": f"load_{worker}"}
+                    )
+                case 1:
+                    response = await client.post(
+                        "/carts/",
+                        json={
+                            "customer_id": str(worker),
+                            "customer_name": f"load_{worker}",
+                            "character_class": "Rogue",
+                            "level": 1,
+                        },
+                    )
+                case _:
+                    response = await client.get("/inventory/audit")
+        except httpx.TransportError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+    return errors
+
+
+async def run_load(clients: int) -> dict:
+    latencies: List[float] = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(
+        base_url=BASE_URL, headers=HEADERS, limits=limits, timeout=60.0
+    ) as client:
+        start = time.perf_counter()
+        deadline = start + DURATION
+        errors = await asyncio.gather(
+            *(client_loop(client, w, deadline, latencies) for w in range(clients))
+        )
+        # requests in flight at the deadline still finish and are counted
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": sum(errors),
+    }
+
+
+def wait_until_up(server: subprocess.Popen) -> None:
+    for _ in range(100):
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            httpx.get(BASE_URL + "/", timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main() -> None:
+    print(
+        f"{'mode':>6} {'clients':>7} {'req/s':>8} {'p50':>9} {'p99':>9} {'errors':>6}"
+    )
+    for db_async in ("false", "true"):
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "src.api.server:app",
+                "--port",
+                str(PORT),
+                "--log-level",
+                "warning",
+                "--no-access-log",
+            ],
+            env={**os.environ, "DB_ASYNC": db_async},
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(server)
+            mode = "async" if db_async == "true" else "sync"
+            for clients in CLIENTS:
+                result = asyncio.run(run_load(clients))
+                print(
+                    f"{mode:>6} {clients:>7} {result['rps']:>8.0f} "
+                    f"{result['p50']:>7.1f}ms {result['p99']:>7.1f}ms "
+                    f"{result['errors']:>6}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Time to parse a /barrels/plan or /barrels/deliver body of 10 to 10,000
+barrels, the way FastAPI did it and through the bulk path.
+
+before: json.loads, then List[Barrel] validated with one Python
+        validate_potion_type call per barrel (FastAPI's body handling)
+after:  parse_body: pydantic-core parses the bytes directly and the ratio
+        sums are checked in one NumPy pass
+
+Both give the same barrels; that is checked before timing. No database or
+server is needed.
+
+    uv run python -m benchmarks.barrel_parsing
+"""
+
+import json
+import random
+import time
+from typing import Callable, List
+from src.api.barrels import Barrel, barrel_list, parse_body
+
+SIZES = [10, 100, 1_000, 10_000]
+# parses per size are scaled so each size takes about as long
+WORK = 200_000
+
+
+def random_catalog(n: int, rng: random.Random) -> bytes:
+    catalog = []
+    for i in range(n):
+        if i % 3:
+            ratios = [0.0, 0.0, 0.0, 0.0]
+            ratios[rng.randrange(4)] = 1.0
+        else:
+            ratios = [0.25, 0.25, 0.25, 0.25]
+        catalog.append(
+            {
+                "sku": f"BARREL_{i}",
+                "ml_per_barrel": rng.choice([500, 2500, 10000]),
+                "potion_type": ratios,
+                "price": rng.randint(10, 500),
+                "quantity": rng.randint(1, 30),
+            }
+        )
+    return json.dumps(catalog).encode()
+
+
+def before(body: bytes) -> List[Barrel]:
+    return barrel_list.validate_python(json.loads(body))
+
+
+def time_per_call(
+    fn: Callable[[bytes], List[Barrel]], body: bytes, rounds: int
+) -> float:
+    fn(body)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    return (time.perf_counter() - start) / rounds
+
+
+def main() -> None:
+    rng = random.Random(7)
+    print(f"{'barrels':>8} {'before':>10} {'after':>10} {'speedup':>8}")
+    for n in SIZES:
+        body = random_catalog(n, rng)
+        assert before(body) == parse_body(body), f"{n}: barrels differ"
+        rounds = max(5, WORK // n)
+        slow = time_per_call(before, body, rounds)
+        fast = time_per_call(parse_body, body, rounds)
+        print(f"{n:>8} {slow * 1e3:>8.2f}ms {fast * 1e3:>8.2f}ms {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Greedy vs optimal barrel planner on random wholesale catalogs of 10 to
+10,000 barrels. For each size a handful of shop states (gold, capacity,
+current ml) are planned with both, and reported as useful ml bought (ml that
+brings a color towards its target share of capacity), gold spent, useful ml
+per gold and solve time.
+
+Pure Python and NumPy only; no database is needed.
+
+    uv run python -m benchmarks.barrel_planner
+"""
+
+import random
+import time
+from typing import List, Tuple
+import numpy as np
+from src.api.barrels import (
+    TARGET_RATIOS,
+    Barrel,
+    BarrelOrder,
+    BarrelPlanner,
+    create_barrel_plan,
+    create_optimal_barrel_plan,
+)
+
+SIZES = [10, 100, 1000, 10000]
+STATES = 5
+MIXES = [
+    [0.5, 0.5, 0.0, 0.0],
+    [0.0, 0.5, 0.5, 0.0],
+    [0.5, 0.0, 0.0, 0.5],
+    [0.25, 0.25, 0.25, 0.25],
+]
+PURE = [[1.0 if i == c else 0.0 for i in range(4)] for c in range(4)]
+SIZES_ML = [200, 500, 2500, 10000]
+
+
+def random_catalog(rng: random.Random, size: int) -> List[Barrel]:
+    catalog = []
+    for i in range(size):
+        ml = rng.choice(SIZES_ML)
+        catalog.append(
+            Barrel(
+                sku=f"BARREL_{i}",
+                ml_per_barrel=ml,
+                potion_type=rng.choice(PURE)
+                if rng.random() < 0.7
+                else rng.choice(MIXES),
+                # bigger barrels are cheaper per ml, with noise
+                price=max(1, int(ml * rng.uniform(0.05, 0.4) * (1.2 - ml / 25000))),
+                quantity=rng.randint(1, 20),
+            )
+        )
+    return catalog
+
+
+def useful_ml(
+    plan: List[BarrelOrder], catalog: List[Barrel], current: List[int], capacity: int
+) -> tuple:
+    by_sku = {b.sku: b for b in catalog}
+    added = np.zeros(4)
+    gold = 0
+    for order in plan:
+        barrel = by_sku[order.sku]
+        added += np.array(barrel.potion_type) * barrel.ml_per_barrel * order.quantity
+        gold += barrel.price * order.quantity
+    deficit = np.maximum(np.array(TARGET_RATIOS) * capacity - np.array(current), 0)
+    return float(np.minimum(added, deficit).sum()), gold
+
+
+def main() -> None:
+    rng = random.Random(42)
+    print(
+        f"{'barrels':>7} {'planner':>8} {'useful ml':>10} {'gold':>7} "
+        f"{'ml/gold':>8} {'solve':>9}"
+    )
+    for size in SIZES:
+        catalog = random_catalog(rng, size)
+        totals = {"greedy": [0.0, 0, 0.0], "optimal": [0.0, 0, 0.0]}
+        for _ in range(STATES):
+            capacity = rng.choice([10000, 20000, 50000])
+            # the greedy plan only buys for a color under 50 ml, so leave
+            # about half of them nearly empty
+            current = [
+                rng.randint(0, 49)
+                if rng.random() < 0.5
+                else rng.randint(0, capacity // 4)
+                for _ in range(4)
+            ]
+            gold = rng.randint(100, 5000)
+            red, green, blue, dark = current
+            planners: List[Tuple[str, BarrelPlanner]] = [
+                ("greedy", create_barrel_plan),
+                ("optimal", create_optimal_barrel_plan),
+            ]
+            for name, planner in planners:
+                start = time.perf_counter()
+                plan = planner(gold, capacity, red, green, blue, dark, catalog)
+                elapsed = time.perf_counter() - start
+                ml, spent = useful_ml(plan, catalog, current, capacity)
+                totals[name][0] += ml
+                totals[name][1] += spent
+                totals[name][2] += elapsed
+
+        for name, (ml, spent, elapsed) in totals.items():
+            per_gold = ml / spent if spent else 0.0
+            print(
+                f"{size:>7} {name:>8} {ml / STATES:>10.0f} {spent / STATES:>7.0f} "
+                f"{per_gold:>8.2f} {elapsed / STATES * 1000:>7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Statement count and wall time of /bottler/deliver for 1, 10 and 100 mixes,
+comparing the old per-mix loop against the bulk delivery path.
+
+Runs against the database in POSTGRES_URI. Everything happens inside a
+transaction that is rolled back, so no data is left behind.
+
+    uv run python -m benchmarks.bottler_deliver
+"""
+
+import time
+from typing import List
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from src import database as db
+from src.api.bottler import PotionMixes, deliver_bottles
+
+MIX_COUNTS = [1, 10, 100]
+REPEATS = 5
+
+statement_count = 0
+
+
+@event.listens_for(db.engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statement_count
+    statement_count += 1
+
+
+def deliver_bottles_per_mix(
+    connection: Connection, potions_delivered: List[PotionMixes], order_id: str
+) -> None:
+    """The delivery loop as it was before the bulk path: ~9 statements per mix."""
+    liquid = (
+        connection.execute(
+            sqlalchemy.text(
+                "SELECT red_ml, green_ml, blue_ml, dark_ml FROM liquid_inventory"
+            )
+        )
+        .mappings()
+        .first()
+    )
+    for potion in potions_delivered:
+        r, g, b, d = potion.potion_type
+        qty = potion.quantity
+        used = [r * qty, g * qty, b * qty, d * qty]
+        recipe = (
+            connection.execute(
+                sqlalchemy.text("""
+                    SELECT sku, r, g, b, d, price, name, active
+                    FROM potion_catalog
+                    WHERE r = :r AND g = :g AND b = :b AND d = :d
+                    LIMIT 1
+                """),
+                {"r": r, "g": g, "b": b, "d": d},
+            )
+            .mappings()
+            .first()
+        )
+        if not recipe or not liquid:
+            continue
+        for color, amount in zip(["red_ml", "green_ml", "blue_ml", "dark_ml"], used):
+            if amount > 0:
+                connection.execute(
+                    sqlalchemy.text("""
+                        INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
+                        VALUES ('liquid', :sub_type, :quantity, :order_id, 'bottler')
+                    """),
+                    {"sub_type": color, "quantity": -amount, "order_id": order_id},
+                )
+        connection.execute(
+            sqlalchemy.text("""
+                UPDATE liquid_inventory
+                SET red_ml = red_ml - :r, green_ml = green_ml - :g,
+                    blue_ml = blue_ml - :b, dark_ml = dark_ml - :d
+            """),
+            dict(zip("rgbd", used)),
+        )
+        connection.execute(
+            sqlalchemy.text("""
+                INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
+                VALUES ('potion', :sku, :qty, :order_id, 'bottler')
+            """),
+            {"sku": recipe["sku"], "qty": qty, "order_id": order_id},
+        )
+        connection.execute(
+            sqlalchemy.text("""
+                INSERT INTO potions (sku, name, price, quantity, r, g, b, d, active)
+                VALUES (:sku, :name, :price, 0, :r, :g, :b, :d, :active)
+                ON CONFLICT (sku) DO NOTHING
+            """),
+            dict(recipe),
+        )
+        connection.execute(
+            sqlalchemy.text(
+                "UPDATE potions SET quantity = quantity + :qty WHERE sku = :sku"
+            ),
+            {"qty": qty, "sku": recipe["sku"]},
+        )
+        connection.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_inventory (sku, quantity)
+                VALUES (:sku, :qty)
+                ON CONFLICT (sku) DO UPDATE
+                SET quantity = potion_inventory.quantity + :qty
+            """),
+            {"sku": recipe["sku"], "qty": qty},
+        )
+
+
+def seed(connection: Connection) -> None:
+    for i in range(max(MIX_COUNTS)):
+        connection.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_catalog (sku, name, r, g, b, d, price, active)
+                VALUES (:sku, :sku, :r, :g, 0, 0, 50, TRUE)
+            """),
+            {"sku": f"BENCH_{i}", "r": i, "g": 100 - i},
+        )
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE liquid_inventory SET red_ml = 100000000, green_ml = 100000000
+        """)
+    )
+
+
+def measure(connection: Connection, deliver, mixes: List[PotionMixes]):
+    global statement_count
+    timings = []
+    statements = 0
+    for _ in range(REPEATS):
+        savepoint = connection.begin_nested()
+        statement_count = 0
+        start = time.perf_counter()
+        deliver(connection, mixes, "bench-order")
+        timings.append(time.perf_counter() - start)
+        statements = statement_count
+        savepoint.rollback()
+    return statements, min(timings) * 1000
+
+
+def main() -> None:
+    print(f"{'mixes':>6} {'path':>9} {'statements':>11} {'best ms':>9}")
+    with db.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            seed(connection)
+            for count in MIX_COUNTS:
+                mixes = [
+                    PotionMixes(potion_type=[i, 100 - i, 0, 0], quantity=1)
+                    for i in range(count)
+                ]
+                for name, deliver in [
+                    ("per-mix", deliver_bottles_per_mix),
+                    ("bulk", deliver_bottles),
+                ]:
+                    statements, best_ms = measure(connection, deliver, mixes)
+                    print(f"{count:>6} {name:>9} {statements:>11} {best_ms:>9.2f}")
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Load generator for a running shop. N concurrent asyncio workers pick
+operations from a weighted traffic mix until the duration is up:
+
+    catalog   GET /catalog/
+    cart      POST /carts/, then POST /carts/{cart_id}/items/{item_sku}
+    checkout  POST /carts/{cart_id}/checkout on a cart made earlier
+    search    GET /carts/search/
+    barrels   POST /barrels/plan, then POST /barrels/deliver/{order_id}
+
+Every order id is a fresh uuid, so idempotency never replays a request.
+The report is JSON with throughput, p50/p95/p99 latency and error rate per
+endpoint (by route template) and overall, plus the run's settings and git
+commit so two runs can be diffed.
+
+Creates carts named load_*; point it at a scratch database.
+
+    uv run python -m benchmarks.load --url http://127.0.0.1:3000 \\
+        --mix catalog=70,cart=15,checkout=10,search=5 --concurrency 50 \\
+        --duration 30 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import httpx
+
+DEFAULT_MIX = "catalog=70,cart=15,checkout=10,search=5"
+CLASSES = ["Warrior", "Rogue", "Wizard", "Cleric", "Ranger", "Druid", "Bard"]
+WHOLESALE_CATALOG = [
+    {
+        "sku": "SMALL_RED_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [1.0, 0.0, 0.0, 0.0],
+        "price": 100,
+        "quantity": 10,
+    },
+    {
+        "sku": "SMALL_GREEN_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [0.0, 1.0, 0.0, 0.0],
+        "price": 100,
+        "quantity": 10,
+    },
+]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'catalog=70,cart=15' -> {operation: weight}"""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix has no weight")
+    return mix
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument(
+        "--api-key", help="sent as the access_token header (default: API_KEY)"
+    )
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+    if args.api_key is None:
+        # only needed for the default key; a remote run with --api-key
+        # doesn't need this repo's .env
+        from src import config
+
+        args.api_key = config.get_settings().API_KEY or ""
+    return args
+
+
+class Recorder:
+    """Latencies and error counts per endpoint (method + route template)."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    async def call(
+        self,
+        client: httpx.AsyncClient,
+        endpoint: str,
+        method: str,
+        url: str,
+        **kwargs,
+    ) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = str(response.status_code)
+        except httpx.TransportError as e:
+            response = None
+            status = type(e).__name__
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[status] = statuses.get(status, 0) + 1
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        return response
+
+
+class Shop:
+    """State the operations share: open carts and the last catalog seen."""
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self.open_carts: Deque[int] = deque()
+        self.skus: List[Dict[str, Any]] = []
+        self.customers = 0
+
+
+async def catalog(client, recorder: Recorder, shop: Shop) -> None:
+    response = await recorder.call(client, "GET /catalog/", "GET", "/catalog/")
+    if response is not None:
+        shop.skus = response.json()
+
+
+async def cart(client, recorder: Recorder, shop: Shop) -> None:
+    shop.customers += 1
+    n = shop.customers
+    response = await recorder.call(
+        client,
+        "POST /carts/",
+        "POST",
+        "/carts/",
+        json={
+            "customer_id": f"load-{uuid.uuid4()}",
+            "customer_name": f"load_{n}",
+            "character_class": shop.rng.choice(CLASSES),
+            "level": shop.rng.randint(1, 20),
+        },
+    )
+    if response is None:
+        return
+    cart_id = response.json()["cart_id"]
+    if shop.skus:
+        item = shop.rng.choice(shop.skus)
+        await recorder.call(
+            client,
+            "POST /carts/{cart_id}/items/{item_sku}",
+            "POST",
+            f"/carts/{cart_id}/items/{item['sku']}",
+            json={"quantity": 1},
+        )
+    shop.open_carts.append(cart_id)
+
+
+async def checkout(client, recorder: Recorder, shop: Shop) -> None:
+    if not shop.open_carts:
+        await cart(client, recorder, shop)
+    if not shop.open_carts:
+        return
+    cart_id = shop.open_carts.popleft()
+    await recorder.call(
+        client,
+        "POST /carts/{cart_id}/checkout",
+        "POST",
+        f"/carts/{cart_id}/checkout",
+        json={"payment": "gold"},
+    )
+
+
+async def search(client, recorder: Recorder, shop: Shop) -> None:
+    params = {"customer_name": f"load_{shop.rng.randint(1, max(shop.customers, 1))}"}
+    if shop.skus and shop.rng.random() < 0.5:
+        params["potion_sku"] = shop.rng.choice(shop.skus)["sku"]
+    await recorder.call(
+        client, "GET /carts/search/", "GET", "/carts/search/", params=params
+    )
+
+
+async def barrels(client, recorder: Recorder, shop: Shop) -> None:
+    response = await recorder.call(
+        client, "POST /barrels/plan", "POST", "/barrels/plan", json=WHOLESALE_CATALOG
+    )
+    if response is None:
+        return
+    by_sku = {barrel["sku"]: barrel for barrel in WHOLESALE_CATALOG}
+    delivered = [
+        by_sku[order["sku"]] | {"quantity": order["quantity"]}
+        for order in response.json()
+        if order["sku"] in by_sku
+    ]
+    await recorder.call(
+        client,
+        "POST /barrels/deliver/{order_id}",
+        "POST",
+        f"/barrels/deliver/{uuid.uuid4()}",
+        json=delivered,
+    )
+
+
+OPERATIONS = {
+    "catalog": catalog,
+    "cart": cart,
+    "checkout": checkout,
+    "search": search,
+    "barrels": barrels,
+}
+
+
+async def worker(client, recorder: Recorder, shop: Shop, mix, deadline) -> None:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        name = shop.rng.choices(names, weights)[0]
+        await OPERATIONS[name](client, recorder, shop)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "errors": errors,
+        "error_rate": round(errors / len(ordered), 4),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    recorder = Recorder()
+    shop = Shop(random.Random(args.seed))
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"access_token": args.api_key},
+        limits=limits,
+        timeout=60.0,
+    ) as client:
+        # one catalog read up front so carts have skus to add
+        await catalog(client, recorder, shop)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(
+                worker(client, recorder, shop, args.mix, deadline)
+                for _ in range(args.concurrency)
+            )
+        )
+        # requests in flight at the deadline still finish and are counted
+        elapsed = time.perf_counter() - start
+
+    all_latencies = [t for ts in recorder.latencies.values() for t in ts]
+    return {
+        "commit": git_commit(),
+        "url": args.url,
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "total": summarize(all_latencies, sum(recorder.errors.values()), elapsed),
+        "endpoints": {
+            endpoint: summarize(latencies, recorder.errors.get(endpoint, 0), elapsed)
+            | {"statuses": recorder.statuses[endpoint]}
+            for endpoint, latencies in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Per-request cost of MetricsMiddleware and the per-statement cost of the
+cursor hooks, measured in-process without a server or network.
+
+The middleware is timed around a bare ASGI app that answers immediately. The
+hooks are timed by running SELECT 1 on an instrumented and a plain engine.
+
+    uv run python -m benchmarks.metrics_overhead
+"""
+
+import asyncio
+import time
+import sqlalchemy
+from sqlalchemy import create_engine
+from src import database as db
+from src import metrics
+
+REQUESTS = 100_000
+STATEMENTS = 5_000
+
+
+class Route:
+    path = "/bench/{id}"
+
+
+async def bare_app(scope, receive, send) -> None:
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message) -> None:
+    pass
+
+
+async def time_requests(app) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/bench/1"}
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / REQUESTS
+
+
+def time_statements(engine) -> float:
+    with engine.connect() as connection:
+        query = sqlalchemy.text("SELECT 1")
+        for _ in range(100):
+            connection.execute(query)
+        start = time.perf_counter()
+        for _ in range(STATEMENTS):
+            connection.execute(query)
+        return (time.perf_counter() - start) / STATEMENTS
+
+
+def main() -> None:
+    bare = asyncio.run(time_requests(bare_app))
+    wrapped = asyncio.run(time_requests(metrics.MetricsMiddleware(bare_app)))
+    print(f"request, bare app:          {bare * 1e6:7.2f}us")
+    print(f"request, with middleware:   {wrapped * 1e6:7.2f}us")
+    print(f"middleware overhead:        {(wrapped - bare) * 1e6:7.2f}us")
+
+    plain = time_statements(create_engine(db.connection_url))
+    hooked = time_statements(db.engine)
+    print(f"SELECT 1, plain engine:     {plain * 1e6:7.2f}us")
+    print(f"SELECT 1, with hooks:       {hooked * 1e6:7.2f}us")
+    print(f"hook overhead (noisy):      {(hooked - plain) * 1e6:7.2f}us")
+
+
+if __name__ == "__main__":
+    main()
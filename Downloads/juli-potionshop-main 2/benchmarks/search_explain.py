@@ -0,0 +1,132 @@
+"""
+EXPLAIN ANALYZE of the /carts/search customer_name filter on 1M synthetic
+carts, before and after the pg_trgm index.
+
+"before" is the old query shape (":customer_name = '' OR ... ILIKE ...") with
+the trigram index dropped; "after" is the current filter with the index in
+place. Everything, including the DROP INDEX, is rolled back at the end.
+
+The "after" plan for searches of 3+ characters needs migration 54c30b76db95,
+and so the pg_trgm extension (postgresql-contrib). Without it the script still
+prints the "before" plans and the short-search "after" plan.
+
+    uv run python -m benchmarks.search_explain [carts]
+"""
+
+import sys
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+from src.api.carts import customer_name_filter, escape_like
+
+CARTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+SEARCHES = ["bench_customer_4242", "12"]
+
+OLD_QUERY = """
+    SELECT ci.id AS line_item_id, ci.potion_sku AS item_sku, c.customer_name,
+           ci.quantity * pc.price AS line_item_total
+    FROM cart_items ci
+    JOIN carts c ON ci.cart_id = c.id
+    JOIN potion_catalog pc ON ci.potion_sku = pc.sku
+    WHERE (:customer_name = '' OR c.customer_name ILIKE :customer_name_like)
+      AND (:potion_sku = '' OR ci.potion_sku = :potion_sku)
+    ORDER BY c.timestamp DESC, ci.id DESC
+    LIMIT 51 OFFSET 0
+"""
+
+NEW_QUERY = """
+    SELECT ci.id AS line_item_id, ci.potion_sku AS item_sku, c.customer_name,
+           ci.quantity * pc.price AS line_item_total
+    FROM cart_items ci
+    JOIN carts c ON ci.cart_id = c.id
+    JOIN potion_catalog pc ON ci.potion_sku = pc.sku
+    WHERE TRUE
+      AND {name_filter}
+    ORDER BY c.timestamp DESC, ci.id DESC
+    LIMIT 51 OFFSET 0
+"""
+
+
+def seed(connection: Connection) -> None:
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO potion_catalog (sku, name, r, g, b, d, price, active)
+            VALUES ('SEARCH_BENCH', 'Search Bench', 100, 0, 0, 0, 10, TRUE)
+            ON CONFLICT (sku) DO NOTHING
+        """)
+    )
+    first_cart = (
+        connection.execute(sqlalchemy.text("SELECT MAX(id) FROM carts")).scalar() or 0
+    )
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO carts (customer_name, timestamp)
+            SELECT 'bench_customer_' || g, now() - make_interval(secs => g)
+            FROM generate_series(1, :carts) AS g
+        """),
+        {"carts": CARTS},
+    )
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_items (cart_id, potion_sku, quantity)
+            SELECT id, 'SEARCH_BENCH', 1 FROM carts WHERE id > :first_cart
+        """),
+        {"first_cart": first_cart},
+    )
+    connection.execute(sqlalchemy.text("ANALYZE carts"))
+    connection.execute(sqlalchemy.text("ANALYZE cart_items"))
+
+
+def explain(connection: Connection, query: str, params: dict) -> None:
+    plan = connection.execute(
+        sqlalchemy.text(f"EXPLAIN (ANALYZE, COSTS OFF) {query}"), params
+    ).fetchall()
+    for row in plan:
+        print("    " + row[0])
+
+
+def main() -> None:
+    with db.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            has_trgm = connection.execute(
+                sqlalchemy.text("""
+                    SELECT 1 FROM pg_indexes
+                    WHERE indexname = 'ix_carts_customer_name_trgm'
+                """)
+            ).first()
+
+            seed(connection)
+            for search in SEARCHES:
+                params = {
+                    "customer_name": search,
+                    "customer_name_like": f"%{escape_like(search)}%",
+                    "potion_sku": "",
+                }
+
+                savepoint = connection.begin_nested()
+                if has_trgm:
+                    connection.execute(
+                        sqlalchemy.text("DROP INDEX ix_carts_customer_name_trgm")
+                    )
+                print(f"\n-- before: customer_name={search!r}")
+                explain(connection, OLD_QUERY, params)
+                savepoint.rollback()
+
+                print(f"\n-- after: customer_name={search!r}")
+                if not has_trgm and len(search) >= 3:
+                    # without the index this is the before plan again
+                    print(
+                        "    ix_carts_customer_name_trgm is missing: migration"
+                        " 54c30b76db95 needs the pg_trgm extension"
+                        " (postgresql-contrib)"
+                    )
+                    continue
+                name_filter = customer_name_filter(search)
+                explain(connection, NEW_QUERY.format(name_filter=name_filter), params)
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Page 1 vs page 1000 of /carts/search on a synthetic cart_items table, using
+offset paging and keyset (cursor) paging for every sort column.
+
+Runs against the database in POSTGRES_URI. The synthetic carts and line
+items are written inside a transaction that is rolled back at the end.
+
+    uv run python -m benchmarks.search_pagination [line_items]
+"""
+
+import sys
+import time
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+from src.api.carts import SearchSortOptions, SearchSortOrder, run_search
+
+LINE_ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+ITEMS_PER_CART = 5
+SKUS = 20
+REPEATS = 3
+
+
+def seed(connection: Connection) -> None:
+    for i in range(SKUS):
+        connection.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_catalog (sku, name, r, g, b, d, price, active)
+                VALUES (:sku, :sku, 100, 0, 0, 0, :price, TRUE)
+                ON CONFLICT (sku) DO NOTHING
+            """),
+            {"sku": f"SEARCH_BENCH_{i}", "price": 10 + i},
+        )
+
+    first_cart = (
+        connection.execute(sqlalchemy.text("SELECT MAX(id) FROM carts")).scalar() or 0
+    )
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO carts (customer_name, timestamp)
+            SELECT 'bench_customer_' || (g % 50000),
+                   now() - make_interval(secs => g)
+            FROM generate_series(1, :carts) AS g
+        """),
+        {"carts": LINE_ITEMS // ITEMS_PER_CART},
+    )
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_items (cart_id, potion_sku, quantity)
+            SELECT c.id,
+                   'SEARCH_BENCH_' || ((c.id * 7 + s) % :skus),
+                   1 + (c.id + s) % 5
+            FROM carts c
+            CROSS JOIN generate_series(0, :per_cart - 1) AS s
+            WHERE c.id > :first_cart
+        """),
+        {"skus": SKUS, "per_cart": ITEMS_PER_CART, "first_cart": first_cart},
+    )
+    connection.execute(sqlalchemy.text("ANALYZE carts"))
+    connection.execute(sqlalchemy.text("ANALYZE cart_items"))
+
+
+def best_ms(connection: Connection, search_page: str, sort_col, sort_order) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run_search(connection, "", "", search_page, sort_col, sort_order)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main() -> None:
+    with db.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            start = time.perf_counter()
+            seed(connection)
+            print(
+                f"seeded {LINE_ITEMS:,} line items in {time.perf_counter() - start:.1f}s"
+            )
+            print(
+                f"{'sort':>16} {'order':>5} {'p1 offset':>10} "
+                f"{'p1000 offset':>13} {'p1000 keyset':>13}"
+            )
+            for sort_col in SearchSortOptions:
+                for sort_order in SearchSortOrder:
+                    # the next cursor of page 999 points at the start of page 1000
+                    cursor = run_search(
+                        connection, "", "", "998", sort_col, sort_order
+                    ).next
+                    assert cursor is not None
+                    print(
+                        f"{sort_col.value:>16} {sort_order.value:>5} "
+                        f"{best_ms(connection, '0', sort_col, sort_order):>8.1f}ms "
+                        f"{best_ms(connection, '999', sort_col, sort_order):>11.1f}ms "
+                        f"{best_ms(connection, cursor, sort_col, sort_order):>11.1f}ms"
+                    )
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Time to turn one page of database rows into a JSON response body, the old way
+and the fast way, for /carts/search/ (50 line items) and /catalog/ (6 items).
+
+before: models built with validation, then FastAPI's response_model pass
+        (validate again, dump to Python, JSONResponse's json.dumps)
+after:  the page validated in one TypeAdapter call and dumped to bytes by
+        pydantic-core, as the endpoints now do
+
+Both produce the same bytes; that is checked before timing. No database or
+server is needed.
+
+    uv run python -m benchmarks.serialization
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List, cast
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from src.api.carts import LineItem, SearchResponse, search_adapter
+from src.api.catalog import CatalogItem, catalog_adapter
+
+ROUNDS = 5_000
+
+SEARCH_ROWS = [
+    SimpleNamespace(
+        line_item_id=100_000 + i,
+        item_sku=f"POTION_{i % 12}",
+        customer_name=f"Customer Number {i}",
+        line_item_total=(1 + i % 5) * 35,
+    )
+    for i in range(50)
+]
+
+CATALOG_ROWS = [
+    SimpleNamespace(
+        sku=f"POTION_{i}",
+        name=f"Potion {i}",
+        price=30 + i,
+        quantity=10 + i,
+        potion_type=[100 - 20 * i, 20 * i, 0, 0],
+    )
+    for i in range(6)
+]
+
+
+async def render(field, content: Any) -> bytes:
+    """What FastAPI does with a handler's return value and a response_model."""
+    serialized = await serialize_response(field=field, response_content=content)
+    return cast(bytes, JSONResponse(serialized).body)
+
+
+search_field = create_model_field("search", SearchResponse, mode="serialization")
+catalog_field = create_model_field("catalog", List[CatalogItem], mode="serialization")
+
+
+async def search_before() -> bytes:
+    page = SearchResponse(
+        next="token",
+        results=[
+            LineItem(
+                line_item_id=row.line_item_id,
+                item_sku=row.item_sku,
+                customer_name=row.customer_name,
+                line_item_total=row.line_item_total,
+            )
+            for row in SEARCH_ROWS
+        ],
+    )
+    return await render(search_field, page)
+
+
+def search_after() -> bytes:
+    page = search_adapter.validate_python(
+        {
+            "previous": None,
+            "next": "token",
+            "results": [
+                {
+                    "line_item_id": row.line_item_id,
+                    "item_sku": row.item_sku,
+                    "customer_name": row.customer_name,
+                    "line_item_total": row.line_item_total,
+                }
+                for row in SEARCH_ROWS
+            ],
+        }
+    )
+    return search_adapter.dump_json(page)
+
+
+async def catalog_before() -> bytes:
+    items = [
+        CatalogItem(
+            sku=row.sku,
+            name=row.name,
+            price=row.price,
+            quantity=row.quantity,
+            potion_type=list(row.potion_type),
+        )
+        for row in CATALOG_ROWS
+    ]
+    return await render(catalog_field, items)
+
+
+def catalog_after() -> bytes:
+    items = catalog_adapter.validate_python(
+        [
+            {
+                "sku": row.sku,
+                "name": row.name,
+                "price": row.price,
+                "quantity": row.quantity,
+                "potion_type": list(row.potion_type),
+            }
+            for row in CATALOG_ROWS
+        ]
+    )
+    return catalog_adapter.dump_json(items)
+
+
+async def time_per_call(fn: Callable[[], Any], rounds: int) -> float:
+    """Seconds per call; fn may be a coroutine function, awaited in one loop."""
+    is_async = asyncio.iscoroutinefunction(fn)
+    for _ in range(100):
+        await fn() if is_async else fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn() if is_async else fn()
+    return (time.perf_counter() - start) / rounds
+
+
+async def run() -> None:
+    cases = [
+        ("search, 50 rows", search_before, search_after),
+        ("catalog, 6 rows", catalog_before, catalog_after),
+    ]
+    print(f"{'':<18} {'before':>10} {'after':>10} {'speedup':>8}")
+    for name, before, after in cases:
+        assert await before() == after(), f"{name}: bodies differ"
+        slow = await time_per_call(before, ROUNDS)
+        fast = await time_per_call(after, ROUNDS)
+        print(
+            f"{name:<18} {slow * 1e6:>8.1f}us {fast * 1e6:>8.1f}us {slow / fast:>7.1f}x"
+        )
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Offline game-tick simulator. Drives the app in-process (httpx over ASGI, no
+server or network) the way the game does, one tick at a time:
+
+    /info/current_time
+    /barrels/plan -> /barrels/deliver/{order_id}
+    /bottler/plan -> /bottler/deliver/{order_id}
+    customers arrive (Poisson) -> /catalog/ -> /carts/ -> items -> checkout
+    /inventory/audit
+
+and reports gold over time, per-route latency and SQL statements per request
+from src.metrics, so strategy and performance regressions both show up.
+
+Resets the game state in POSTGRES_URI first; run against a scratch database.
+
+    uv run python -m benchmarks.simulator --ticks 2000 --arrivals 4
+    uv run python -m benchmarks.simulator --ticks 84 --json week.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+import httpx
+from src import config, metrics
+from src.api.server import app
+
+DAYS = [
+    "Edgeday",
+    "Bloomday",
+    "Arcanaday",
+    "Hearthday",
+    "Crownday",
+    "Blesseday",
+    "Soulday",
+]
+HOURS_PER_TICK = 2
+CLASSES = ["Warrior", "Rogue", "Wizard", "Cleric", "Ranger", "Druid", "Bard"]
+
+WHOLESALE_CATALOG = [
+    {"sku": f"{size}_{color.upper()}_BARREL", "ml_per_barrel": ml, "price": price}
+    | {
+        "potion_type": [
+            1.0 if c == color else 0.0 for c in ("red", "green", "blue", "dark")
+        ]
+    }
+    | {"quantity": 10}
+    for color in ("red", "green", "blue", "dark")
+    for size, ml, price in (
+        ("MINI", 200, 60),
+        ("SMALL", 500, 100),
+        ("MEDIUM", 2500, 250),
+        ("LARGE", 10000, 500),
+    )
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ticks", type=int, default=84, help="84 ticks = 1 week")
+    parser.add_argument(
+        "--arrivals", type=float, default=3.0, help="mean customers per tick"
+    )
+    parser.add_argument(
+        "--night-arrivals",
+        type=float,
+        default=None,
+        help="mean customers per tick from 22:00 to 06:00 (default: --arrivals)",
+    )
+    parser.add_argument(
+        "--buy-chance",
+        type=float,
+        default=0.7,
+        help="chance an arriving customer puts something in a cart and pays",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--report-every", type=int, default=12, help="ticks between progress lines"
+    )
+    parser.add_argument("--json", help="also write the full report to this file")
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="level for the app's own logs, which share stdout with the report",
+    )
+    return parser.parse_args()
+
+
+def poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method; arrival means per tick are small
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+class Simulator:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.customers = 0
+        self.errors: Dict[str, int] = {}
+        self.timeline: List[Dict[str, Any]] = []
+
+    async def call(self, method: str, url: str, **kwargs) -> httpx.Response:
+        response = await self.client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            route = url.split("?")[0]
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    async def tick(self, tick: int) -> None:
+        hour = (tick * HOURS_PER_TICK) % 24
+        day = DAYS[(tick * HOURS_PER_TICK // 24) % len(DAYS)]
+        await self.call("POST", "/info/current_time", json={"day": day, "hour": hour})
+
+        orders = (
+            await self.call("POST", "/barrels/plan", json=WHOLESALE_CATALOG)
+        ).json()
+        by_sku = {barrel["sku"]: barrel for barrel in WHOLESALE_CATALOG}
+        delivered = [
+            by_sku[order["sku"]] | {"quantity": order["quantity"]}
+            for order in orders or []
+            if order.get("sku") in by_sku
+        ]
+        if delivered:
+            await self.call("POST", f"/barrels/deliver/{uuid.uuid4()}", json=delivered)
+
+        mixes = (await self.call("POST", "/bottler/plan")).json()
+        if mixes:
+            await self.call("POST", f"/bottler/deliver/{uuid.uuid4()}", json=mixes)
+
+        night = hour >= 22 or hour < 6
+        mean = self.args.arrivals
+        if night and self.args.night_arrivals is not None:
+            mean = self.args.night_arrivals
+        arrivals = poisson(self.rng, mean)
+        if arrivals:
+            catalog = (await self.call("GET", "/catalog/")).json()
+            for _ in range(arrivals):
+                await self.customer(catalog)
+
+        audit = (await self.call("GET", "/inventory/audit")).json()
+        self.timeline.append(
+            {
+                "tick": tick,
+                "day": day,
+                "hour": hour,
+                "gold": audit.get("gold"),
+                "potions": audit.get("number_of_potions"),
+                "ml": audit.get("ml_in_barrels"),
+                "customers": arrivals,
+            }
+        )
+
+    async def customer(self, catalog: List[Dict[str, Any]]) -> None:
+        self.customers += 1
+        if not catalog or self.rng.random() >= self.args.buy_chance:
+            return
+        n = self.customers
+        cart = await self.call(
+            "POST",
+            "/carts/",
+            json={
+                "customer_id": str(n),
+                "customer_name": f"sim_{n}",
+                "character_class": self.rng.choice(CLASSES),
+                "level": self.rng.randint(1, 20),
+            },
+        )
+        if cart.status_code >= 400:
+            return
+        cart_id = cart.json()["cart_id"]
+        item = self.rng.choice(catalog)
+        quantity = self.rng.randint(1, min(item["quantity"], 3))
+        await self.call(
+            "POST",
+            f"/carts/{cart_id}/items/{item['sku']}",
+            json={"quantity": quantity},
+        )
+        await self.call("POST", f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+
+def route_report() -> List[Dict[str, Any]]:
+    """Count, mean and p99 latency, and mean SQL statements per route."""
+    report = []
+    for r in sorted(metrics.routes.values(), key=lambda r: r.labels):
+        count = sum(r.duration[:-1])
+        if not count:
+            continue
+        report.append(
+            {
+                "route": f"{r.labels[0][1]} {r.labels[1][1]}",
+                "requests": int(count),
+                "mean_ms": r.duration[-1] / count * 1000,
+                "p99_ms": bucket_percentile(r.duration, 0.99) * 1000,
+                "statements": r.statements[-1] / count,
+                "db_ms": r.db_seconds[-1] / count * 1000,
+            }
+        )
+    return report
+
+
+def bucket_percentile(series: List[float], p: float) -> float:
+    """Upper bound of the latency bucket holding the p-th request."""
+    target = sum(series[:-1]) * p
+    seen = 0.0
+    for bound, count in zip(metrics.LATENCY_BUCKETS, series):
+        seen += count
+        if seen >= target:
+            return bound
+    return math.inf
+
+
+async def simulate(args: argparse.Namespace) -> Dict[str, Any]:
+    headers = {"access_token": config.get_settings().API_KEY or ""}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://simulator", headers=headers
+    ) as client:
+        sim = Simulator(client, args)
+        await sim.call("POST", "/admin/reset")
+        metrics.routes.clear()
+
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            await sim.tick(tick)
+            if args.report_every and (tick + 1) % args.report_every == 0:
+                point = sim.timeline[-1]
+                print(
+                    f"tick {tick + 1:>6} {point['day']:>9} {point['hour']:02d}:00 "
+                    f"gold {point['gold']:>7} potions {point['potions']:>5} "
+                    f"ml {point['ml']:>6}"
+                )
+        elapsed = time.perf_counter() - start
+
+    return {
+        "ticks": args.ticks,
+        "seconds": elapsed,
+        "ticks_per_minute": args.ticks / elapsed * 60,
+        "customers": sim.customers,
+        "final_gold": sim.timeline[-1]["gold"] if sim.timeline else None,
+        "errors": sim.errors,
+        "routes": route_report(),
+        "timeline": sim.timeline,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    logging.getLogger("src").setLevel(args.log_level.upper())
+    report = asyncio.run(simulate(args))
+
+    print(
+        f"\n{report['ticks']} ticks in {report['seconds']:.1f}s "
+        f"({report['ticks_per_minute']:.0f} ticks/min), "
+        f"{report['customers']} customers, final gold {report['final_gold']}"
+    )
+    print(
+        f"\n{'route':<38} {'requests':>8} {'mean':>9} {'p99 <=':>9} "
+        f"{'stmts':>6} {'db':>9}"
+    )
+    for r in report["routes"]:
+        print(
+            f"{r['route']:<38} {r['requests']:>8} {r['mean_ms']:>7.2f}ms "
+            f"{r['p99_ms']:>7.1f}ms {r['statements']:>6.1f} {r['db_ms']:>7.2f}ms"
+        )
+    if report["errors"]:
+        print(f"\nerror responses: {report['errors']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from time import perf_counter
+import asyncio
+import logging
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# strategy.md's definition of an abandoned cart
+ABANDONED_AFTER = "6 hours"
+SWEEP_INTERVAL = 300.0
+SWEEP_BATCH = 500
+
+
+def sweep(connection: Connection, older_than: str = ABANDONED_AFTER) -> int:
+    """
+    Marks up to SWEEP_BATCH open carts older than older_than as abandoned,
+    oldest first, and returns how many. Walks ix_carts_open_timestamp, which
+    only holds carts not yet checked out or swept. A checkout locks its
+    carts row first, so carts with a checkout in progress are skipped rather
+    than waited on; a later sweep sees them again if the checkout fails.
+    """
+    return connection.execute(
+        sqlalchemy.text("""
+            UPDATE carts SET abandoned_at = now()
+            WHERE id IN (
+                SELECT id FROM carts
+                WHERE checked_out = FALSE
+                  AND abandoned_at IS NULL
+                  AND "timestamp" < now() - CAST(:older_than AS INTERVAL)
+                ORDER BY "timestamp"
+                LIMIT :batch
+                FOR UPDATE SKIP LOCKED
+            )
+        """),
+        {"older_than": older_than, "batch": SWEEP_BATCH},
+    ).rowcount
+
+
+async def sweep_batch(older_than: str = ABANDONED_AFTER) -> int:
+    """One sweep transaction, timed and counted."""
+    start = perf_counter()
+    swept = await db.run(sweep, older_than)
+    metrics.sweep_batch.observe((), perf_counter() - start)
+    metrics.carts_swept.inc((), swept)
+    return swept
+
+
+async def sweep_forever() -> None:
+    """Background task: sweep abandoned carts every SWEEP_INTERVAL seconds."""
+    while True:
+        try:
+            swept = SWEEP_BATCH
+            total = 0
+            # one batch per transaction keeps each one's row locks bounded
+            while swept == SWEEP_BATCH:
+                swept = await sweep_batch()
+                total += swept
+            if total:
+                logger.info("swept abandoned carts", extra={"swept": total})
+        except Exception:
+            logger.exception("sweeping abandoned carts failed")
+        await asyncio.sleep(SWEEP_INTERVAL)
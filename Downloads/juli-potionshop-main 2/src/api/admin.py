@@ -1,7 +1,14 @@
 from fastapi import APIRouter, Depends, status
+from pydantic import BaseModel
+from typing import Dict, List
 import sqlalchemy
+from sqlalchemy.engine import Connection
 from src.api import auth
+from src.api.catalog import cache as catalog_cache
+from src.api.inventory import InventoryAudit, audit_inventory, recompute_inventory
 from src import database as db
+from src import idempotency
+from src import ledger
 
 router = APIRouter(
     prefix="/admin",
@@ -11,34 +18,148 @@ router = APIRouter(
 
 
 @router.post("/reset", status_code=status.HTTP_204_NO_CONTENT)
-def reset():
+async def reset():
     """
     Reset the game state:
     - Gold set to 100
     - All potion ml types reset to 0
     - All potion inventory cleared
     - Capacity reset to 1 for potions and liquid
-    - Ledger and processed requests cleared
-    """
-    with db.engine.begin() as connection:
-        # clear state tables
-        connection.execute(sqlalchemy.text("DELETE FROM ledger_entries"))
-        connection.execute(sqlalchemy.text("DELETE FROM processed_requests"))
-        connection.execute(sqlalchemy.text("DELETE FROM potion_inventory"))
-        connection.execute(sqlalchemy.text("DELETE FROM capacity_inventory"))
-
-        # insert starting gold into ledger
-        connection.execute(
-            sqlalchemy.text("""
-            INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
-            VALUES ('gold', 'initial', 100, 'reset', 'admin')
-        """)
-        )
+    - Ledger, its checkpoints and archive, and processed requests cleared
+    - Liquid balance snapshot zeroed
+    """
+    await db.run(reset_game_state)
+    catalog_cache.invalidate()
+    idempotency.recent.clear()
+
+
+def reset_game_state(connection: Connection) -> None:
+    # clear state tables
+    connection.execute(sqlalchemy.text("DELETE FROM ledger_entries"))
+    connection.execute(sqlalchemy.text("DELETE FROM processed_requests"))
+    connection.execute(sqlalchemy.text("DELETE FROM potion_inventory"))
+    connection.execute(sqlalchemy.text("DELETE FROM capacity_inventory"))
+    ledger.reset_checkpoints(connection)
+    ledger.reset_liquid_snapshot(connection)
+
+    # starting gold in the ledger
+    ledger.writer(connection).append(
+        ledger.LedgerEntry("gold", "initial", 100, "reset", "admin")
+    )
+
+    # the running totals the endpoints read and update
+    connection.execute(sqlalchemy.text("UPDATE gold_inventory SET amount = 100"))
+    connection.execute(
+        sqlalchemy.text("""
+        UPDATE liquid_inventory
+        SET red_ml = 0, green_ml = 0, blue_ml = 0, dark_ml = 0
+    """)
+    )
+
+    # initialize capacity
+    connection.execute(
+        sqlalchemy.text("""
+        INSERT INTO capacity_inventory (ml_capacity, potion_capacity)
+        VALUES (1, 1)
+    """)
+    )
+
+
+class LiquidReconciliation(BaseModel):
+    snapshot: Dict[str, int]
+    recomputed: Dict[str, int]
+    matches: bool
+
+
+@router.get("/reconcile/liquid", response_model=LiquidReconciliation)
+async def reconcile_liquid():
+    """
+    Compares the liquid balance snapshot (plus its ledger tail) against a
+    full recompute over every liquid ledger entry.
+    """
+    return await db.run(reconcile_liquid_balances)
+
+
+def reconcile_liquid_balances(connection: Connection) -> LiquidReconciliation:
+    snapshot = ledger.get_liquid_balances(connection)
+    recomputed = ledger.recompute_liquid_balances(connection)
+
+    return LiquidReconciliation(
+        snapshot=snapshot,
+        recomputed=recomputed,
+        matches=snapshot == recomputed,
+    )
+
+
+class CheckpointReconciliation(BaseModel):
+    category: str
+    sub_type: str
+    checkpoint_quantity: int
+    archived_quantity: int
+    checkpoint_entries: int
+    archived_entries: int
+    matches: bool
 
-        # initialize capacity
-        connection.execute(
-            sqlalchemy.text("""
-            INSERT INTO capacity_inventory (ml_capacity, potion_capacity)
-            VALUES (1, 1)
-        """)
+
+class LedgerReconciliation(BaseModel):
+    checkpoints: List[CheckpointReconciliation]
+    double_entries: int
+    matches: bool
+
+
+@router.get("/reconcile/ledger", response_model=LedgerReconciliation)
+async def reconcile_ledger():
+    """
+    Checks ledger compaction: every checkpoint must equal the sum and count
+    of the archived entries folded into it, and no entry may be both live
+    and archived.
+    """
+    return await db.run(reconcile_ledger_checkpoints)
+
+
+def reconcile_ledger_checkpoints(connection: Connection) -> LedgerReconciliation:
+    checkpoints = [
+        CheckpointReconciliation(
+            category=check.category,
+            sub_type=check.sub_type,
+            checkpoint_quantity=check.checkpoint_quantity,
+            archived_quantity=check.archived_quantity,
+            checkpoint_entries=check.checkpoint_entries,
+            archived_entries=check.archived_entries,
+            matches=check.matches,
         )
+        for check in ledger.verify_checkpoints(connection)
+    ]
+    double_entries = ledger.count_double_entries(connection)
+
+    return LedgerReconciliation(
+        checkpoints=checkpoints,
+        double_entries=double_entries,
+        matches=double_entries == 0 and all(c.matches for c in checkpoints),
+    )
+
+
+class InventoryReconciliation(BaseModel):
+    summary: InventoryAudit
+    recomputed: InventoryAudit
+    matches: bool
+
+
+@router.get("/reconcile/inventory", response_model=InventoryReconciliation)
+async def reconcile_inventory():
+    """
+    Compares the delta-maintained inventory summary that /inventory/audit
+    reads against totals summed from the raw inventory tables.
+    """
+    return await db.run(reconcile_inventory_summary)
+
+
+def reconcile_inventory_summary(connection: Connection) -> InventoryReconciliation:
+    summary = audit_inventory(connection)
+    recomputed = recompute_inventory(connection)
+
+    return InventoryReconciliation(
+        summary=summary,
+        recomputed=recomputed,
+        matches=summary == recomputed,
+    )
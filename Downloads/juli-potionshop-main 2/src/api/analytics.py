@@ -0,0 +1,59 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from typing import List
+from src.api import auth
+from src import database as db
+from src import rollups
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+    dependencies=[Depends(auth.get_api_key)],
+)
+
+# every query reads hourly rollup rows, so a month is at most ~720 per key
+Hours = Query(24, ge=1, le=24 * 30, description="How many hours back to cover")
+
+
+class ClassSales(BaseModel):
+    character_class: str
+    potion_sku: str
+    potions: int
+    gold: int
+    orders: int
+
+
+class FailedCheckouts(BaseModel):
+    potion_sku: str
+    reason: str
+    failures: int
+
+
+class CartActivity(BaseModel):
+    hour: datetime
+    character_class: str
+    carts_created: int
+    carts_checked_out: int
+
+
+@router.get("/sales", response_model=List[ClassSales])
+async def get_sales_by_class(hours: int = Hours):
+    """Potions, gold and orders per customer class and sku, best sellers first."""
+    return await db.run(rollups.sales_by_class, f"{hours} hours")
+
+
+@router.get("/failed-checkouts", response_model=List[FailedCheckouts])
+async def get_failed_checkouts(hours: int = Hours):
+    """Checkouts stopped per sku and reason (out_of_stock, missing_price)."""
+    return await db.run(rollups.failed_checkouts_by_sku, f"{hours} hours")
+
+
+@router.get("/carts", response_model=List[CartActivity])
+async def get_cart_activity(hours: int = Hours):
+    """
+    Carts created and checked out per hour of creation and customer class.
+    Recent hours are refreshed every minute; once an hour is older than six
+    hours, its created minus checked-out carts are the abandoned ones.
+    """
+    return await db.run(rollups.cart_activity, f"{hours} hours")
@@ -1,11 +1,36 @@
-from fastapi import APIRouter, Depends, status
-from pydantic import BaseModel, Field, field_validator
-from typing import List, Union
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import (
+    BaseModel,
+    Field,
+    TypeAdapter,
+    ValidationError,
+    ValidationInfo,
+    field_validator,
+)
+from typing import List, Protocol, Sequence, Tuple
+from itertools import chain
+import json
+import logging
+import numpy as np
 import sqlalchemy
-from sqlalchemy.engine import RowMapping
+from sqlalchemy.engine import Connection
 from dataclasses import dataclass
 from src.api import auth
+from src import config
 from src import database as db
+from src import ledger
+from src import plan_cache
+from src.idempotency import IdempotencyKey, order_key
+
+logger = logging.getLogger(__name__)
+
+# share of max_barrel_capacity each color [r, g, b, d] is topped up to
+TARGET_RATIOS = (0.25, 0.25, 0.25, 0.25)
+# best single barrels tried as a forced first pick before the greedy fill
+SEED_CANDIDATES = 8
+# validation context key: the potion_type sums are checked by parse_barrels
+RATIOS_CHECKED_IN_BULK = "ratios_checked_in_bulk"
 
 router = APIRouter(
     prefix="/barrels",
@@ -28,19 +53,142 @@ class Barrel(BaseModel):
 
     @field_validator("potion_type")
     @classmethod
-    def validate_potion_type(cls, potion_type: List[float]) -> List[float]:
+    def validate_potion_type(
+        cls, potion_type: List[float], info: ValidationInfo
+    ) -> List[float]:
         if len(potion_type) != 4:
             raise ValueError("potion_type must have exactly 4 elements: [r, g, b, d]")
+        if info.context and info.context.get(RATIOS_CHECKED_IN_BULK):
+            return potion_type
         if not abs(sum(potion_type) - 1.0) < 1e-6:
             raise ValueError("Sum of potion_type values must be exactly 1.0")
         return potion_type
 
 
+barrel_list = TypeAdapter(List[Barrel])
+
+# OpenAPI for the endpoints that read their body with parse_barrels, which
+# FastAPI can't see through: the List[Barrel] body and its 422
+BARRELS_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {"type": "array", "items": Barrel.model_json_schema()}
+            }
+        },
+    },
+    "responses": {
+        "422": {
+            "description": "Validation Error",
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/HTTPValidationError"}
+                }
+            },
+        }
+    },
+}
+
+
+def ratios_sum_to_one(barrels: List[Barrel]) -> bool:
+    """validate_potion_type's sum check for every barrel, in one NumPy pass."""
+    ratios = np.fromiter(
+        chain.from_iterable(b.potion_type for b in barrels),
+        dtype=np.float64,
+        count=4 * len(barrels),
+    ).reshape(-1, 4)
+    # added left to right like sum(), so a barrel on the 1e-6 edge gets the
+    # same answer either way
+    sums = ratios[:, 0] + ratios[:, 1] + ratios[:, 2] + ratios[:, 3]
+    return bool(np.all(np.abs(sums - 1.0) < 1e-6))
+
+
+def validate_body(body: bytes) -> List[Barrel]:
+    """
+    FastAPI's own handling of a List[Barrel] body: json.loads, then one
+    validator call per barrel. Raises the same RequestValidationError.
+    """
+    try:
+        data = json.loads(body) if body else None
+    except json.JSONDecodeError as e:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "json_invalid",
+                    "loc": ("body", e.pos),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": e.msg},
+                }
+            ],
+            body=body,
+        )
+    if data is None:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "missing",
+                    "loc": ("body",),
+                    "msg": "Field required",
+                    "input": None,
+                }
+            ]
+        )
+
+    try:
+        return barrel_list.validate_python(data)
+    except ValidationError as e:
+        errors = [
+            {**error, "loc": ("body", *error["loc"])}
+            for error in e.errors(include_url=False)
+        ]
+        raise RequestValidationError(errors, body=data)
+
+
+def parse_body(body: bytes) -> List[Barrel]:
+    """
+    pydantic-core parses the raw bytes straight into Barrels, with the ratio
+    sums left to one NumPy pass over the whole list. Anything that fails is
+    parsed again the slow way, so 422 responses are exactly what FastAPI
+    would give.
+    """
+    try:
+        barrels = barrel_list.validate_json(
+            body, context={RATIOS_CHECKED_IN_BULK: True}
+        )
+    except ValidationError:
+        return validate_body(body)
+    if not ratios_sum_to_one(barrels):
+        return validate_body(body)
+    return barrels
+
+
+async def parse_barrels(request: Request) -> List[Barrel]:
+    """Request body of /barrels/plan and /barrels/deliver."""
+    return parse_body(await request.body())
+
+
 class BarrelOrder(BaseModel):
     sku: str
     quantity: int = Field(gt=0, description="Quantity must be greater than 0")
 
 
+class BarrelPlanner(Protocol):
+    """What create_barrel_plan and create_optimal_barrel_plan both accept."""
+
+    def __call__(
+        self,
+        gold: int,
+        max_barrel_capacity: int,
+        current_red_ml: int,
+        current_green_ml: int,
+        current_blue_ml: int,
+        current_dark_ml: int,
+        wholesale_catalog: List[Barrel],
+    ) -> List[BarrelOrder]: ...
+
+
 @dataclass
 class BarrelSummary:
     gold_paid: int
@@ -50,105 +198,97 @@ def calculate_barrel_summary(barrels: List[Barrel]) -> BarrelSummary:
     return BarrelSummary(gold_paid=sum(b.price * b.quantity for b in barrels))
 
 
-@router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
-def post_deliver_barrels(barrels_delivered: List[Barrel], order_id: str):
-    with db.engine.begin() as connection:
-        # check if the order_id was already processed
-        already = connection.execute(
-            sqlalchemy.text("""
-                SELECT 1 FROM processed_requests WHERE order_id = :order_id
-            """),
-            {"order_id": order_id},
-        ).first()
-
-        if already:
-            print(f"Skipping order {order_id} (already processed)")
-            return
-
-        # it's safe to insert
+@router.post(
+    "/deliver/{order_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    openapi_extra=BARRELS_BODY,
+)
+async def post_deliver_barrels(
+    order_id: str,
+    barrels_delivered: List[Barrel] = Depends(parse_barrels),
+    key: IdempotencyKey = Depends(order_key),
+):
+    await key.run(record_barrel_delivery, barrels_delivered, order_id)
+    if key.replayed:
+        logger.info("skipping already processed order", extra={"order_id": order_id})
+
+
+def record_barrel_delivery(
+    connection: Connection, barrels_delivered: List[Barrel], order_id: str
+) -> None:
+    gold: int = (
         connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO processed_requests (order_id)
-                VALUES (:order_id)
-            """),
-            {"order_id": order_id},
-        )
+            sqlalchemy.text("SELECT amount FROM gold_inventory")
+        ).scalar()
+        or 0
+    )
 
-        gold: int = (
-            connection.execute(
-                sqlalchemy.text("SELECT amount FROM gold_inventory")
-            ).scalar()
-            or 0
+    total_cost = sum(b.price * b.quantity for b in barrels_delivered)
+    if gold < total_cost:
+        logger.warning(
+            "not enough gold for barrels",
+            extra={"order_id": order_id, "gold": gold, "total_cost": total_cost},
         )
+        return
 
-        total_cost = sum(b.price * b.quantity for b in barrels_delivered)
-        if gold < total_cost:
-            print(f"[SKIPPED] Not enough gold ({gold}) for total cost {total_cost}")
-            return
+    ml_updates = {
+        "red_ml": 0,
+        "green_ml": 0,
+        "blue_ml": 0,
+        "dark_ml": 0,
+    }
 
-        ml_updates = {
-            "red_ml": 0,
-            "green_ml": 0,
-            "blue_ml": 0,
-            "dark_ml": 0,
-        }
+    for barrel in barrels_delivered:
+        total_ml = barrel.ml_per_barrel * barrel.quantity
+        for ratio, color in zip(barrel.potion_type, ml_updates):
+            added = int(ratio * total_ml)
+            ml_updates[color] += added
+
+    logger.debug(
+        "barrel delivery totals",
+        extra={
+            "order_id": order_id,
+            "ml_updates": ml_updates,
+            "total_cost": total_cost,
+        },
+    )
 
-        for barrel in barrels_delivered:
-            total_ml = barrel.ml_per_barrel * barrel.quantity
-            for ratio, color in zip(barrel.potion_type, ml_updates):
-                added = int(ratio * total_ml)
-                ml_updates[color] += added
-
-        print("[DEBUG] ML Updates:", ml_updates)
-        print("[DEBUG] Total Cost:", total_cost)
-
-        # update liquid ledger
-        for color, amount in ml_updates.items():
-            if amount > 0:
-                connection.execute(
-                    sqlalchemy.text("""
-                        INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
-                        VALUES ('liquid', :sub_type, :quantity, :order_id, 'barrels')
-                    """),
-                    {"sub_type": color, "quantity": amount, "order_id": order_id},
-                )
-
-        # update liquid_inventory
-        connection.execute(
-            sqlalchemy.text("""
-                UPDATE liquid_inventory
-                SET red_ml = red_ml + :r,
-                    green_ml = green_ml + :g,
-                    blue_ml = blue_ml + :b,
-                    dark_ml = dark_ml + :d
-                WHERE id = 1
-            """),
-            {
-                "r": ml_updates["red_ml"],
-                "g": ml_updates["green_ml"],
-                "b": ml_updates["blue_ml"],
-                "d": ml_updates["dark_ml"],
-            },
-        )
+    # the gold entry goes out in the same INSERT as the liquid rows
+    ledger.writer(connection).append(
+        ledger.LedgerEntry("gold", None, -total_cost, order_id, "barrels")
+    )
 
-        # log and deduct gold
-        connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO ledger_entries (category, quantity, order_id, source)
-                VALUES ('gold', :amount, :order_id, 'barrels')
-            """),
-            {"amount": -total_cost, "order_id": order_id},
-        )
+    # update liquid ledger and balance snapshot
+    ledger.record_liquid(connection, ml_updates, order_id, "barrels")
+
+    # update liquid_inventory
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE liquid_inventory
+            SET red_ml = red_ml + :r,
+                green_ml = green_ml + :g,
+                blue_ml = blue_ml + :b,
+                dark_ml = dark_ml + :d
+            WHERE id = 1
+        """),
+        {
+            "r": ml_updates["red_ml"],
+            "g": ml_updates["green_ml"],
+            "b": ml_updates["blue_ml"],
+            "d": ml_updates["dark_ml"],
+        },
+    )
 
-        connection.execute(
-            sqlalchemy.text("""
-                UPDATE gold_inventory
-                SET amount = amount - :cost
-            """),
-            {"cost": total_cost},
-        )
+    # deduct gold
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE gold_inventory
+            SET amount = amount - :cost
+        """),
+        {"cost": total_cost},
+    )
 
-        print(f"[SUCCESS] Delivered barrels for order {order_id}")
+    logger.info("delivered barrels", extra={"order_id": order_id})
 
 
 def create_barrel_plan(
@@ -196,46 +336,182 @@ def create_barrel_plan(
     return [BarrelOrder(sku=best_barrel.sku, quantity=1)]
 
 
-@router.post("/plan", response_model=List[BarrelOrder])
-def get_wholesale_purchase_plan(wholesale_catalog: List[Barrel]):
-    with db.engine.begin() as connection:
-        gold: int = (
-            connection.execute(
-                sqlalchemy.text("SELECT amount FROM gold_inventory")
-            ).scalar()
-            or 0
+def create_optimal_barrel_plan(
+    gold: int,
+    max_barrel_capacity: int,
+    current_red_ml: int,
+    current_green_ml: int,
+    current_blue_ml: int,
+    current_dark_ml: int,
+    wholesale_catalog: List[Barrel],
+    target_ratios: Sequence[float] = TARGET_RATIOS,
+) -> List[BarrelOrder]:
+    """
+    Picks quantities of any barrels in the catalog to maximize useful ml,
+    within gold, the ml room left under max_barrel_capacity and each
+    barrel's stock. Useful ml is ml that brings a color up towards
+    target_ratio * max_barrel_capacity; anything past that counts for nothing,
+    so the value is capped per color and not a plain knapsack.
+
+    Every candidate is scored at once with NumPy. The fill is greedy on
+    useful ml per gold, taking as many units of the best barrel as it can
+    before a color it feeds fills up. It is rerun with each of the
+    SEED_CANDIDATES best single barrels bought first, which catches the case
+    where one large barrel beats a run of cheap small ones, and the best run
+    wins (ties go to the cheaper plan).
+    """
+    current = np.array(
+        [
+            current_red_ml or 0,
+            current_green_ml or 0,
+            current_blue_ml or 0,
+            current_dark_ml or 0,
+        ],
+        dtype=np.float64,
+    )
+    deficit = np.maximum(
+        np.asarray(target_ratios, dtype=np.float64) * max_barrel_capacity - current,
+        0.0,
+    )
+    room = max_barrel_capacity - current.sum()
+    if not wholesale_catalog or gold <= 0 or room <= 0 or not deficit.any():
+        return []
+
+    ml = np.array([b.ml_per_barrel for b in wholesale_catalog], dtype=np.float64)
+    price = np.array([b.price for b in wholesale_catalog], dtype=np.float64)
+    stock = np.array([b.quantity for b in wholesale_catalog], dtype=np.int64)
+    color_ml = (
+        np.array([b.potion_type for b in wholesale_catalog], dtype=np.float64)
+        * ml[:, None]
+    )
+
+    # free barrels sort first instead of dividing by zero
+    cost = np.maximum(price, 1e-9)
+    first_gain = np.minimum(color_ml, deficit).sum(axis=1)
+    usable = (first_gain > 0) & (price <= gold) & (ml <= room) & (stock > 0)
+    if not usable.any():
+        return []
+
+    seeds: List[int | None] = [None]
+    order = np.argsort(-np.where(usable, first_gain / cost, -1.0), kind="stable")
+    seeds += [int(i) for i in order[: min(SEED_CANDIDATES, int(usable.sum()))]]
+
+    best_units = None
+    best_key = (0.0, 0.0)
+    for seed in seeds:
+        units = np.zeros(len(wholesale_catalog), dtype=np.int64)
+        if seed is not None:
+            units[seed] = 1
+        units, useful, spent = fill_barrels(
+            units, color_ml, ml, price, cost, stock, deficit, gold, room
         )
+        key = (useful, -spent)
+        if best_units is None or key > best_key:
+            best_units, best_key = units, key
+
+    if best_units is None or best_key[0] <= 0:
+        return []
+    return [
+        BarrelOrder(sku=wholesale_catalog[i].sku, quantity=int(best_units[i]))
+        for i in np.flatnonzero(best_units)
+    ]
 
-        result: Union[RowMapping, dict[str, int]] = (
-            connection.execute(
-                sqlalchemy.text("""
-                    SELECT
-                        SUM(CASE WHEN sub_type = 'red_ml' THEN quantity ELSE 0 END) AS red_ml,
-                        SUM(CASE WHEN sub_type = 'green_ml' THEN quantity ELSE 0 END) AS green_ml,
-                        SUM(CASE WHEN sub_type = 'blue_ml' THEN quantity ELSE 0 END) AS blue_ml,
-                        SUM(CASE WHEN sub_type = 'dark_ml' THEN quantity ELSE 0 END) AS dark_ml
-                    FROM ledger_entries
-                    WHERE category = 'liquid'
-                """)
+
+def fill_barrels(
+    units: np.ndarray,
+    color_ml: np.ndarray,
+    ml: np.ndarray,
+    price: np.ndarray,
+    cost: np.ndarray,
+    stock: np.ndarray,
+    deficit: np.ndarray,
+    gold: float,
+    room: float,
+) -> Tuple[np.ndarray, float, float]:
+    """
+    Greedy fill on top of the units already chosen. Returns the units, the
+    useful ml they add and the gold they cost.
+    """
+    bought = units.astype(np.float64)
+    gold -= float(bought @ price)
+    room -= float(bought @ ml)
+    remaining = np.maximum(deficit - bought @ color_ml, 0.0)
+    if gold < 0 or room < 0:
+        return units, 0.0, 0.0
+
+    while True:
+        gain = np.minimum(color_ml, remaining).sum(axis=1)
+        fits = (price <= gold) & (ml <= room) & (units < stock) & (gain > 0)
+        if not fits.any():
+            break
+        i = int(np.argmax(np.where(fits, gain / cost, -1.0)))
+
+        # each unit keeps adding its full ml until one of its colors fills up
+        feeds = color_ml[i] > 0
+        count = int(np.floor(remaining[feeds] / color_ml[i][feeds]).min())
+        count = max(count, 1)
+        count = min(count, int(stock[i] - units[i]), int(room // ml[i]))
+        if price[i] > 0:
+            count = min(count, int(gold // price[i]))
+
+        units[i] += count
+        gold -= count * price[i]
+        room -= count * ml[i]
+        remaining = np.maximum(remaining - count * color_ml[i], 0.0)
+
+    useful = float(deficit.sum() - remaining.sum())
+    return units, useful, float(units @ price)
+
+
+@router.post("/plan", response_model=List[BarrelOrder], openapi_extra=BARRELS_BODY)
+async def get_wholesale_purchase_plan(
+    wholesale_catalog: List[Barrel] = Depends(parse_barrels),
+):
+    return await db.run(plan_barrel_purchase, wholesale_catalog)
+
+
+def plan_barrel_purchase(
+    connection: Connection, wholesale_catalog: List[Barrel]
+) -> List[BarrelOrder]:
+    planner = config.get_settings().BARREL_PLANNER
+    key = (
+        "barrels",
+        planner,
+        plan_cache.read_version(connection),
+        plan_cache.digest(
+            *(
+                (b.sku, b.ml_per_barrel, tuple(b.potion_type), b.price, b.quantity)
+                for b in wholesale_catalog
             )
-            .mappings()
-            .first()
-            or {}
-        )
+        ),
+    )
+    cached = plan_cache.lookup("barrels", key)
+    if cached is not None:
+        return list(cached)
 
-        ml_result: dict[str, int] = {
-            "red_ml": result.get("red_ml", 0),
-            "green_ml": result.get("green_ml", 0),
-            "blue_ml": result.get("blue_ml", 0),
-            "dark_ml": result.get("dark_ml", 0),
-        }
+    gold: int = (
+        connection.execute(
+            sqlalchemy.text("SELECT amount FROM gold_inventory")
+        ).scalar()
+        or 0
+    )
 
-        return create_barrel_plan(
-            gold=gold,
-            max_barrel_capacity=10000,
-            current_red_ml=ml_result["red_ml"],
-            current_green_ml=ml_result["green_ml"],
-            current_blue_ml=ml_result["blue_ml"],
-            current_dark_ml=ml_result["dark_ml"],
-            wholesale_catalog=wholesale_catalog,
-        )
+    ml_result = ledger.get_liquid_balances(connection)
+
+    plan: BarrelPlanner
+    if planner == "optimal":
+        plan = create_optimal_barrel_plan
+    else:
+        plan = create_barrel_plan
+
+    orders = plan(
+        gold=gold,
+        max_barrel_capacity=10000,
+        current_red_ml=ml_result["red_ml"],
+        current_green_ml=ml_result["green_ml"],
+        current_blue_ml=ml_result["blue_ml"],
+        current_dark_ml=ml_result["dark_ml"],
+        wholesale_catalog=wholesale_catalog,
+    )
+    plan_cache.plans.put(key, orders)
+    return list(orders)
@@ -1,9 +1,26 @@
 from fastapi import APIRouter, Depends, status
 from pydantic import BaseModel, Field, field_validator
-from typing import List
+from typing import Any, Dict, List
+from dataclasses import dataclass
+import asyncio
+import logging
+import numpy as np
 import sqlalchemy
+from sqlalchemy.engine import Connection
 from src.api import auth
+from src import config
 from src import database as db
+from src import ledger
+from src import plan_cache
+from src.api.catalog import cache as catalog_cache
+from src.idempotency import IdempotencyKey, order_key
+from src.catalog_registry import CatalogPotion, registry as catalog_registry
+
+logger = logging.getLogger(__name__)
+
+# share of a recipe's feasible units the revenue planner commits to per
+# step before rescoring; smaller steps share scarce liquid more evenly
+REVENUE_STEP_FRACTIONS = (1.0, 0.5, 0.25)
 
 router = APIRouter(
     prefix="/bottler",
@@ -29,176 +46,232 @@ class PotionMixes(BaseModel):
         return potion_type
 
 
-@router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
-def post_deliver_bottles(potions_delivered: List[PotionMixes], order_id: str):
-    with db.engine.begin() as connection:
-        try:
-            connection.execute(
-                sqlalchemy.text(
-                    "INSERT INTO processed_requests (order_id) VALUES (:order_id)"
-                ),
-                {"order_id": order_id},
+@dataclass
+class BottleDelivery:
+    ml_used: Dict[str, int]
+    potions: Dict[str, int]  # sku -> quantity bottled
+    recipes: Dict[str, CatalogPotion]
+
+
+def plan_bottle_delivery(
+    potions_delivered: List[PotionMixes],
+    recipes: Dict[tuple[int, int, int, int], CatalogPotion],
+    liquid: Dict[str, int],
+) -> BottleDelivery:
+    """
+    Works out what a delivery actually bottles. Mixes without a catalog recipe,
+    or that need more liquid than is left after the earlier mixes in the
+    batch, are skipped.
+    """
+    available = {color: liquid.get(color) or 0 for color in ledger.LIQUID_TYPES}
+    delivery = BottleDelivery(
+        ml_used={color: 0 for color in ledger.LIQUID_TYPES}, potions={}, recipes={}
+    )
+
+    for potion in potions_delivered:
+        r, g, b, d = potion.potion_type
+        qty = potion.quantity
+        needed = dict(zip(ledger.LIQUID_TYPES, (r * qty, g * qty, b * qty, d * qty)))
+
+        recipe = recipes.get((r, g, b, d))
+        if not recipe:
+            logger.debug(
+                "skipping mix with no recipe",
+                extra={"potion_type": [r, g, b, d], "sample_every": 100},
             )
-        except sqlalchemy.exc.IntegrityError:
-            return  # Already processed
-
-        # Get available liquid
-        result = (
-            connection.execute(
-                sqlalchemy.text("""
-                SELECT
-                    red_ml, green_ml, blue_ml, dark_ml
+            continue
+
+        if any(available[color] < needed[color] for color in ledger.LIQUID_TYPES):
+            logger.debug(
+                "skipping mix, not enough liquid",
+                extra={"potion_type": [r, g, b, d], "sample_every": 100},
+            )
+            continue
+
+        for color in ledger.LIQUID_TYPES:
+            available[color] -= needed[color]
+            delivery.ml_used[color] += needed[color]
+
+        sku = recipe.sku
+        delivery.potions[sku] = delivery.potions.get(sku, 0) + qty
+        delivery.recipes[sku] = recipe
+
+    return delivery
+
+
+def deliver_bottles(
+    connection: Connection, potions_delivered: List[PotionMixes], order_id: str
+) -> BottleDelivery:
+    """
+    Applies a bottler delivery with a fixed number of statements regardless of
+    how many mixes are in it: recipes come from the catalog registry, then one
+    liquid read and one multi-row write per table.
+    """
+    # Get available liquid
+    result = (
+        connection.execute(
+            sqlalchemy.text("""
+                SELECT red_ml, green_ml, blue_ml, dark_ml
                 FROM liquid_inventory
                 WHERE TRUE
+                FOR UPDATE
             """)
-            )
-            .mappings()
-            .first()
         )
+        .mappings()
+        .first()
+    )
+    liquid = {k: (v if v is not None else 0) for k, v in (result or {}).items()}
+
+    recipes = catalog_registry.get(connection).by_type
+    delivery = plan_bottle_delivery(potions_delivered, recipes, liquid)
+    if not delivery.potions:
+        return delivery
+
+    # Potions go into the ledger in the same INSERT as the liquid deduction
+    ledger.writer(connection).extend(
+        [
+            ledger.LedgerEntry("potion", sku, qty, order_id, "bottler")
+            for sku, qty in delivery.potions.items()
+        ]
+    )
 
-        liquid = {k: (v if v is not None else 0) for k, v in (result or {}).items()}
-
-        for potion in potions_delivered:
-            r, g, b, d = potion.potion_type
-            qty = potion.quantity
-            red_ml, green_ml, blue_ml, dark_ml = r * qty, g * qty, b * qty, d * qty
-
-            recipe = (
-                connection.execute(
-                    sqlalchemy.text("""
-                    SELECT sku, r, g, b, d, price, name, active
-                    FROM potion_catalog
-                    WHERE r = :r AND g = :g AND b = :b AND d = :d
-                    LIMIT 1
-                """),
-                    {"r": r, "g": g, "b": b, "d": d},
-                )
-                .mappings()
-                .first()
-            )
+    # Deduct liquid in ledger
+    ledger.record_liquid(
+        connection,
+        {color: -used for color, used in delivery.ml_used.items()},
+        order_id,
+        "bottler",
+    )
 
-            if not recipe:
-                print(f"Skipping: No matching recipe for potion {r, g, b, d}")
-                continue
-
-            if (
-                liquid["red_ml"] < red_ml
-                or liquid["green_ml"] < green_ml
-                or liquid["blue_ml"] < blue_ml
-                or liquid["dark_ml"] < dark_ml
-            ):
-                print(f"Skipping: Not enough liquid for potion {r, g, b, d}")
-                continue
-
-            # Deduct liquid in ledger
-            for color, used in zip(
-                ["red_ml", "green_ml", "blue_ml", "dark_ml"],
-                [red_ml, green_ml, blue_ml, dark_ml],
-            ):
-                if used > 0:
-                    connection.execute(
-                        sqlalchemy.text("""
-                            INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
-                            VALUES ('liquid', :sub_type, :quantity, :order_id, 'bottler')
-                        """),
-                        {"sub_type": color, "quantity": -used, "order_id": order_id},
-                    )
-
-            # Deduct liquid in inventory
-            connection.execute(
-                sqlalchemy.text("""
-                    UPDATE liquid_inventory
-                    SET red_ml = red_ml - :r,
-                        green_ml = green_ml - :g,
-                        blue_ml = blue_ml - :b,
-                        dark_ml = dark_ml - :d
-                """),
-                {"r": red_ml, "g": green_ml, "b": blue_ml, "d": dark_ml},
-            )
+    # Deduct liquid in inventory
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE liquid_inventory
+            SET red_ml = red_ml - :r,
+                green_ml = green_ml - :g,
+                blue_ml = blue_ml - :b,
+                dark_ml = dark_ml - :d
+        """),
+        {
+            "r": delivery.ml_used["red_ml"],
+            "g": delivery.ml_used["green_ml"],
+            "b": delivery.ml_used["blue_ml"],
+            "d": delivery.ml_used["dark_ml"],
+        },
+    )
 
-            # Insert potion into ledger
-            connection.execute(
-                sqlalchemy.text("""
-                    INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
-                    VALUES ('potion', :sku, :qty, :order_id, 'bottler')
-                """),
-                {"sku": recipe["sku"], "qty": qty, "order_id": order_id},
-            )
+    potion_values = []
+    inventory_values = []
+    potion_params: Dict[str, Any] = {}
+    for i, (sku, qty) in enumerate(delivery.potions.items()):
+        recipe = delivery.recipes[sku]
+        potion_values.append(
+            f"(:sku_{i}, :name_{i}, :price_{i}, :qty_{i}, "
+            f":r_{i}, :g_{i}, :b_{i}, :d_{i}, :active_{i})"
+        )
+        inventory_values.append(f"(:sku_{i}, :qty_{i})")
+        potion_params.update(
+            {
+                f"sku_{i}": sku,
+                f"name_{i}": recipe.name,
+                f"price_{i}": recipe.price,
+                f"qty_{i}": qty,
+                f"r_{i}": recipe.r,
+                f"g_{i}": recipe.g,
+                f"b_{i}": recipe.b,
+                f"d_{i}": recipe.d,
+                f"active_{i}": recipe.active,
+            }
+        )
 
-            # Ensure potion exists in potions table
-            connection.execute(
-                sqlalchemy.text("""
-                    INSERT INTO potions (sku, name, price, quantity, r, g, b, d, active)
-                    VALUES (:sku, :name, :price, 0, :r, :g, :b, :d, :active)
-                    ON CONFLICT (sku) DO NOTHING
-                """),
-                {
-                    "sku": recipe["sku"],
-                    "name": recipe["name"],
-                    "price": recipe["price"],
-                    "r": recipe["r"],
-                    "g": recipe["g"],
-                    "b": recipe["b"],
-                    "d": recipe["d"],
-                    "active": recipe["active"],
-                },
-            )
+    # first bottling of a sku creates its potions row, which changes the catalog
+    if any(recipe.listed is None for recipe in delivery.recipes.values()):
+        catalog_registry.wrote(connection)
+
+    # Ensure potions exist in potions table and update their count
+    connection.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO potions (sku, name, price, quantity, r, g, b, d, active)
+            VALUES {", ".join(potion_values)}
+            ON CONFLICT (sku) DO UPDATE
+            SET quantity = potions.quantity + EXCLUDED.quantity
+        """),
+        potion_params,
+    )
 
-            # Update potion count
-            connection.execute(
-                sqlalchemy.text("""
-                    UPDATE potions
-                    SET quantity = quantity + :qty
-                    WHERE sku = :sku
-                """),
-                {"qty": qty, "sku": recipe["sku"]},
-            )
+    # Update inventory table
+    connection.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO potion_inventory (sku, quantity)
+            VALUES {", ".join(inventory_values)}
+            ON CONFLICT (sku) DO UPDATE
+            SET quantity = potion_inventory.quantity + EXCLUDED.quantity
+        """),
+        potion_params,
+    )
 
-            # Update inventory table
-            connection.execute(
-                sqlalchemy.text("""
-                    INSERT INTO potion_inventory (sku, quantity)
-                    VALUES (:sku, :qty)
-                    ON CONFLICT (sku) DO UPDATE
-                    SET quantity = potion_inventory.quantity + :qty
-                """),
-                {"sku": recipe["sku"], "qty": qty},
-            )
+    return delivery
+
+
+@router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def post_deliver_bottles(
+    potions_delivered: List[PotionMixes],
+    order_id: str,
+    key: IdempotencyKey = Depends(order_key),
+):
+    await key.run(
+        deliver_bottles, potions_delivered, order_id, respond=lambda delivery: None
+    )
+    if key.replayed:
+        return  # Already processed
+
+    catalog_cache.invalidate()
 
 
 @router.post("/plan", response_model=List[PotionMixes])
-def get_bottle_plan():
-    with db.engine.begin() as connection:
-        result = (
-            connection.execute(
-                sqlalchemy.text("""
-                SELECT red_ml, green_ml, blue_ml, dark_ml
-                FROM liquid_inventory
-                WHERE TRUE
-                """)
-            )
-            .mappings()
-            .first()
+async def get_bottle_plan():
+    return await db.run(plan_bottles)
+
+
+def plan_bottles(connection: Connection) -> List[PotionMixes]:
+    planner = config.get_settings().BOTTLE_PLANNER
+    # recipes come from the registry snapshot, so its version is the one
+    # that describes them
+    potions = catalog_registry.get(connection)
+    key = (
+        "bottler",
+        planner,
+        plan_cache.read_version(connection),
+        potions.version,
+    )
+    cached = plan_cache.lookup("bottler", key)
+    if cached is not None:
+        return list(cached)
+
+    result = (
+        connection.execute(
+            sqlalchemy.text("""
+            SELECT red_ml, green_ml, blue_ml, dark_ml
+            FROM liquid_inventory
+            WHERE TRUE
+            """)
         )
+        .mappings()
+        .first()
+    )
 
-        liquid = {k: (v if v is not None else 0) for k, v in (result or {}).items()}
+    liquid = {k: (v if v is not None else 0) for k, v in (result or {}).items()}
 
-        current_potion_count = (
-            connection.execute(
-                sqlalchemy.text("""
-                SELECT SUM(quantity) FROM ledger_entries WHERE category = 'potion'
-                """)
-            ).scalar()
-            or 0
-        )
+    current_potion_count = ledger.get_balance(connection, "potion")
 
-        potions = connection.execute(
-            sqlalchemy.text("SELECT r, g, b, d, price FROM potion_catalog")
-        ).fetchall()
+    catalog = [(p.r, p.g, p.b, p.d, p.price) for p in potions.by_sku.values()]
 
-        catalog = [(p.r, p.g, p.b, p.d, p.price) for p in potions]
+    if planner == "revenue":
+        plan = create_revenue_bottle_plan
+    else:
+        plan = create_bottle_plan
 
-    return create_bottle_plan(
+    mixes = plan(
         red_ml=liquid.get("red_ml", 0),
         green_ml=liquid.get("green_ml", 0),
         blue_ml=liquid.get("blue_ml", 0),
@@ -207,6 +280,8 @@ def get_bottle_plan():
         current_potion_count=current_potion_count,
         potion_catalog=catalog,
     )
+    plan_cache.plans.put(key, mixes)
+    return list(mixes)
 
 
 def create_bottle_plan(
@@ -218,7 +293,14 @@ def create_bottle_plan(
     current_potion_count: int,
     potion_catalog: List[tuple[int, int, int, int, int]],
 ) -> List[PotionMixes]:
-    print(f"red_ml: {red_ml}, potion_catalog: {potion_catalog}")
+    logger.debug(
+        "bottle plan inputs",
+        extra={
+            "liquid": [red_ml, green_ml, blue_ml, dark_ml],
+            "recipes": len(potion_catalog),
+            "sample_every": 10,
+        },
+    )
     plan = []
     available = {
         k: int(v) if v is not None else 0
@@ -258,5 +340,105 @@ def create_bottle_plan(
     return plan
 
 
+def create_revenue_bottle_plan(
+    red_ml: int,
+    green_ml: int,
+    blue_ml: int,
+    dark_ml: int,
+    maximum_potion_capacity: int,
+    current_potion_count: int,
+    potion_catalog: List[tuple[int, int, int, int, int]],
+) -> List[PotionMixes]:
+    """
+    Same inputs and output as create_bottle_plan, but picks quantities to
+    maximize the sum of price * quantity over the catalog.
+
+    Each step scores every recipe at once by price per share of what is
+    left: a unit's ml of each color over the ml remaining, plus one over
+    the potion slots remaining. The best recipe gets a fraction of the units
+    it could still make, then everything is rescored. The fill runs for each
+    of REVENUE_STEP_FRACTIONS and the greedy create_bottle_plan is scored
+    too, so the result never earns less than the greedy plan.
+    """
+    slots = maximum_potion_capacity - current_potion_count
+    if slots <= 0:
+        return []
+
+    available = np.array(
+        [int(v) if v is not None else 0 for v in (red_ml, green_ml, blue_ml, dark_ml)],
+        dtype=np.int64,
+    )
+    # one row per distinct recipe, keeping the best price if it repeats
+    best_price: Dict[tuple[int, int, int, int], int] = {}
+    for r, g, b, d, price in potion_catalog:
+        recipe = (int(r), int(g), int(b), int(d))
+        if sum(recipe) > 0:
+            best_price[recipe] = max(price, best_price.get(recipe, price))
+    if not best_price:
+        return []
+
+    recipes = np.array(list(best_price), dtype=np.int64)
+    prices = np.array(list(best_price.values()), dtype=np.float64)
+
+    best_units = np.zeros(len(recipes), dtype=np.int64)
+    greedy = create_bottle_plan(
+        red_ml,
+        green_ml,
+        blue_ml,
+        dark_ml,
+        maximum_potion_capacity,
+        current_potion_count,
+        potion_catalog,
+    )
+    index = {recipe: i for i, recipe in enumerate(best_price)}
+    for mix in greedy:
+        r, g, b, d = mix.potion_type
+        best_units[index[(r, g, b, d)]] += mix.quantity
+    best_revenue = float(best_units @ prices)
+
+    for fraction in REVENUE_STEP_FRACTIONS:
+        units = fill_by_revenue(recipes, prices, available, slots, fraction)
+        revenue = float(units @ prices)
+        if revenue > best_revenue:
+            best_units, best_revenue = units, revenue
+
+    return [
+        PotionMixes(potion_type=recipes[i].tolist(), quantity=int(best_units[i]))
+        for i in np.flatnonzero(best_units)
+    ]
+
+
+def fill_by_revenue(
+    recipes: np.ndarray,
+    prices: np.ndarray,
+    available: np.ndarray,
+    slots: int,
+    fraction: float,
+) -> np.ndarray:
+    units = np.zeros(len(recipes), dtype=np.int64)
+    remaining = available.copy()
+    uses = recipes > 0
+    # per-color divisor that can't be zero; colors a recipe doesn't use are
+    # masked out below
+    per_unit = np.where(uses, recipes, 1)
+
+    while slots > 0:
+        can_make = np.where(uses, remaining // per_unit, np.iinfo(np.int64).max)
+        can_make = np.minimum(can_make.min(axis=1), slots)
+        fits = (can_make > 0) & (prices > 0)
+        if not fits.any():
+            break
+
+        share = (recipes / np.maximum(remaining, 1)).sum(axis=1) + 1.0 / slots
+        i = int(np.argmax(np.where(fits, prices / share, -1.0)))
+
+        count = max(1, int(can_make[i] * fraction))
+        units[i] += count
+        remaining -= recipes[i] * count
+        slots -= count
+
+    return units
+
+
 if __name__ == "__main__":
-    print(get_bottle_plan())
+    print(asyncio.run(get_bottle_plan()))
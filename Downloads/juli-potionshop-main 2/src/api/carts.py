@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, status, HTTPException
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Path, Response, status, HTTPException
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Any, List, Optional
 from enum import Enum
+from dataclasses import dataclass
+from datetime import datetime
+import base64
+import json
+import logging
 import sqlalchemy
-from sqlalchemy import bindparam
+from sqlalchemy.engine import Connection
 
 from src.api import auth
 from src import database as db
+from src import ledger
+from src import rollups
+from src import visits
+from src.api.catalog import cache as catalog_cache
+from src.idempotency import IdempotencyKey
+from src.catalog_registry import registry as catalog_registry
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/carts",
@@ -40,45 +53,231 @@ class SearchResponse(BaseModel):
     results: List[LineItem]
 
 
+# builds and serializes search pages in pydantic-core; search_orders returns
+# the bytes itself, skipping FastAPI's second response_model validation and
+# its jsonable_encoder pass
+search_adapter = TypeAdapter(SearchResponse)
+
+
+# sort expression for each column; ties are always broken by line item id
+SORT_EXPRESSIONS = {
+    SearchSortOptions.customer_name: "c.customer_name",
+    SearchSortOptions.item_sku: "ci.potion_sku",
+    SearchSortOptions.line_item_total: "ci.quantity * pc.price",
+    SearchSortOptions.timestamp: "c.timestamp",
+}
+
+
+@dataclass
+class SearchCursor:
+    sort_col: SearchSortOptions
+    sort_order: SearchSortOrder
+    sort_key: Any
+    line_item_id: int
+    backwards: bool = False
+
+
+def encode_cursor(cursor: SearchCursor) -> str:
+    sort_key = cursor.sort_key
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat()
+    payload = json.dumps(
+        [
+            cursor.sort_col.value,
+            cursor.sort_order.value,
+            sort_key,
+            cursor.line_item_id,
+            cursor.backwards,
+        ],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> SearchCursor:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_col, sort_order, sort_key, line_item_id, backwards = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        cursor = SearchCursor(
+            sort_col=SearchSortOptions(sort_col),
+            sort_order=SearchSortOrder(sort_order),
+            sort_key=sort_key,
+            line_item_id=int(line_item_id),
+            backwards=bool(backwards),
+        )
+        if cursor.sort_col == SearchSortOptions.timestamp and sort_key is not None:
+            cursor.sort_key = datetime.fromisoformat(sort_key)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid search_page cursor")
+    return cursor
+
+
+# pg_trgm can't extract a trigram from fewer than 3 characters, so shorter
+# searches would turn the trigram index into a full index scan
+TRIGRAM_MIN_LENGTH = 3
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def customer_name_filter(customer_name: str) -> str:
+    """
+    Case-insensitive substring match on carts.customer_name.
+
+    Searches of 3+ characters use the bare column so the planner can use the
+    pg_trgm GIN index. Shorter ones match most carts anyway, so the column is
+    wrapped to keep that index out of the plan; the planner then walks the
+    sort-order index and stops after one page.
+    """
+    if len(customer_name) >= TRIGRAM_MIN_LENGTH:
+        return "c.customer_name ILIKE :customer_name_like ESCAPE '\\'"
+    return "(c.customer_name || '') ILIKE :customer_name_like ESCAPE '\\'"
+
+
 @router.get("/search/", response_model=SearchResponse, tags=["search"])
-def search_orders(
+async def search_orders(
     customer_name: str = "",
     potion_sku: str = "",
-    search_page: int = 0,
+    search_page: str = "",
     sort_col: SearchSortOptions = SearchSortOptions.timestamp,
     sort_order: SearchSortOrder = SearchSortOrder.desc,
 ):
+    """
+    Search line items. search_page takes the opaque previous/next tokens from
+    an earlier response (keyset paging); a plain page number still works and
+    falls back to offset paging.
+    """
+    response = await db.run(
+        run_search, customer_name, potion_sku, search_page, sort_col, sort_order
+    )
+    # response_model above still documents the shape
+    return Response(
+        content=search_adapter.dump_json(response), media_type="application/json"
+    )
+
+
+def run_search(
+    connection: Connection,
+    customer_name: str,
+    potion_sku: str,
+    search_page: str,
+    sort_col: SearchSortOptions,
+    sort_order: SearchSortOrder,
+) -> SearchResponse:
     limit = 50
-    offset = search_page * limit
+    sort_expr = SORT_EXPRESSIONS[sort_col]
+
+    cursor: Optional[SearchCursor] = None
+    offset = 0
+    if search_page.isdigit():
+        offset = int(search_page) * limit
+    elif search_page:
+        cursor = decode_cursor(search_page)
+        if cursor.sort_col != sort_col or cursor.sort_order != sort_order:
+            raise HTTPException(
+                status_code=400, detail="Cursor does not match sort_col/sort_order"
+            )
+
+    # walking backwards flips both the comparison and the order, and the page
+    # is reversed again once fetched
+    backwards = cursor is not None and cursor.backwards
+    descending = (sort_order == SearchSortOrder.desc) != backwards
+    direction = "DESC" if descending else "ASC"
+    # NULL keys (a cart without a customer_name or timestamp) sort after
+    # every value ascending and before every value descending: Postgres's
+    # default, so the sort-order indexes still apply, spelled out for SQLite
+    nulls = "NULLS FIRST" if descending else "NULLS LAST"
+
+    keyset = ""
+    if cursor is not None:
+        if cursor.sort_key is None and descending:
+            keyset = f"AND ({sort_expr} IS NOT NULL OR ci.id < :line_item_id)"
+        elif cursor.sort_key is None:
+            keyset = f"AND {sort_expr} IS NULL AND ci.id > :line_item_id"
+        elif descending:
+            keyset = f"""
+              AND {sort_expr} <= :sort_key
+              AND ({sort_expr} < :sort_key OR ci.id < :line_item_id)
+            """
+        else:
+            keyset = f"""
+              AND ({sort_expr} >= :sort_key OR {sort_expr} IS NULL)
+              AND ({sort_expr} > :sort_key OR {sort_expr} IS NULL
+                   OR ci.id > :line_item_id)
+            """
+
+    # filters are only added when set, so each search gets a plan for the
+    # predicates it actually has rather than a generic ":x = '' OR ..." plan
+    filters = ""
+    if customer_name:
+        filters += f"AND {customer_name_filter(customer_name)}\n"
+    if potion_sku:
+        filters += "AND ci.potion_sku = :potion_sku\n"
 
     query = f"""
-        SELECT ci.id AS line_item_id, ci.potion_sku AS item_sku, c.customer_name, 
-               ci.quantity * pc.price AS line_item_total
+        SELECT ci.id AS line_item_id, ci.potion_sku AS item_sku,
+               COALESCE(c.customer_name, '') AS customer_name,
+               ci.quantity * pc.price AS line_item_total,
+               {sort_expr} AS sort_key
         FROM cart_items ci
         JOIN carts c ON ci.cart_id = c.id
         JOIN potion_catalog pc ON ci.potion_sku = pc.sku
-        WHERE (:customer_name = '' OR c.customer_name ILIKE :customer_name_like)
-          AND (:potion_sku = '' OR ci.potion_sku = :potion_sku)
-        ORDER BY {sort_col.value} {sort_order.value}
+        WHERE TRUE
+          {filters}
+          {keyset}
+        ORDER BY {sort_expr} {direction} {nulls}, ci.id {direction}
         LIMIT :limit OFFSET :offset
     """
 
-    with db.engine.begin() as connection:
-        results = connection.execute(
-            sqlalchemy.text(query),
-            {
-                "customer_name": customer_name,
-                "customer_name_like": f"%{customer_name}%",
-                "potion_sku": potion_sku,
-                "limit": limit,
-                "offset": offset,
-            },
-        ).fetchall()
-
-    return SearchResponse(
-        previous=str(search_page - 1) if search_page > 0 else None,
-        next=str(search_page + 1) if len(results) == limit else None,
-        results=[LineItem(**row._mapping) for row in results],
+    results = connection.execute(
+        sqlalchemy.text(query),
+        {
+            "customer_name_like": f"%{escape_like(customer_name)}%",
+            "potion_sku": potion_sku,
+            "sort_key": cursor.sort_key if cursor else None,
+            "line_item_id": cursor.line_item_id if cursor else None,
+            "limit": limit + 1,
+            "offset": offset,
+        },
+    ).fetchall()
+
+    # one extra row tells us whether there is more in the direction we walked
+    has_more = len(results) > limit
+    results = results[:limit]
+    if backwards:
+        results = list(reversed(results))
+
+    def cursor_for(row, backwards: bool) -> str:
+        return encode_cursor(
+            SearchCursor(
+                sort_col, sort_order, row.sort_key, row.line_item_id, backwards
+            )
+        )
+
+    has_next = has_more if not backwards else cursor is not None
+    has_previous = has_more if backwards else (cursor is not None or offset > 0)
+
+    # the whole page is validated in one pydantic-core call rather than one
+    # LineItem(...) per row
+    return search_adapter.validate_python(
+        {
+            "previous": (
+                cursor_for(results[0], True) if results and has_previous else None
+            ),
+            "next": cursor_for(results[-1], False) if results and has_next else None,
+            "results": [
+                {
+                    "line_item_id": row.line_item_id,
+                    "item_sku": row.item_sku,
+                    "customer_name": row.customer_name,
+                    "line_item_total": row.line_item_total,
+                }
+                for row in results
+            ],
+        }
     )
 
 
@@ -90,9 +289,23 @@ class Customer(BaseModel):
 
 
 @router.post("/visits/{visit_id}", status_code=status.HTTP_204_NO_CONTENT)
-def post_visits(visit_id: int, customers: List[Customer]):
-    print(customers)
-    pass
+async def post_visits(
+    customers: List[Customer],
+    visit_id: int = Path(ge=0, le=visits.MAX_VISIT_ID),
+):
+    """
+    Records which customers visited. The batch is queued and written to
+    customer_visits by a background flusher; replaying a visit_id is a no-op.
+    """
+    logger.debug(
+        "visit",
+        extra={"visit_id": visit_id, "customers": len(customers), "sample_every": 10},
+    )
+    if not visits.enqueue(visit_id, customers):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Visit queue is full, retry later",
+        )
 
 
 class CartCreateResponse(BaseModel):
@@ -100,17 +313,23 @@ class CartCreateResponse(BaseModel):
 
 
 @router.post("/", response_model=CartCreateResponse)
-def create_cart(new_cart: Customer):
-    with db.engine.begin() as connection:
-        result = connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO carts (customer_name)
-                VALUES (:customer_name)
-                RETURNING id
-            """),
-            {"customer_name": new_cart.customer_name},
-        )
-        return CartCreateResponse(cart_id=result.scalar_one())
+async def create_cart(new_cart: Customer):
+    return await db.run(insert_cart, new_cart)
+
+
+def insert_cart(connection: Connection, new_cart: Customer) -> CartCreateResponse:
+    result = connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO carts (customer_name, character_class)
+            VALUES (:customer_name, :character_class)
+            RETURNING id
+        """),
+        {
+            "customer_name": new_cart.customer_name,
+            "character_class": new_cart.character_class,
+        },
+    )
+    return CartCreateResponse(cart_id=result.scalar_one())
 
 
 class CartItem(BaseModel):
@@ -118,17 +337,22 @@ class CartItem(BaseModel):
 
 
 @router.post("/{cart_id}/items/{item_sku}", status_code=status.HTTP_204_NO_CONTENT)
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO cart_items (cart_id, potion_sku, quantity)
-                VALUES (:cart_id, :item_sku, :quantity)
-                ON CONFLICT (cart_id, potion_sku)
-                DO UPDATE SET quantity = :quantity
-            """),
-            {"cart_id": cart_id, "item_sku": item_sku, "quantity": cart_item.quantity},
-        )
+async def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+    await db.run(upsert_cart_item, cart_id, item_sku, cart_item)
+
+
+def upsert_cart_item(
+    connection: Connection, cart_id: int, item_sku: str, cart_item: CartItem
+) -> None:
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_items (cart_id, potion_sku, quantity)
+            VALUES (:cart_id, :item_sku, :quantity)
+            ON CONFLICT (cart_id, potion_sku)
+            DO UPDATE SET quantity = :quantity
+        """),
+        {"cart_id": cart_id, "item_sku": item_sku, "quantity": cart_item.quantity},
+    )
 
 
 class CheckoutResponse(BaseModel):
@@ -140,106 +364,140 @@ class CartCheckout(BaseModel):
     payment: str
 
 
+class CheckoutFailed(HTTPException):
+    """A checkout stopped by one sku; recorded for the analytics rollups."""
+
+    def __init__(self, potion_sku: str, reason: str, detail: str) -> None:
+        super().__init__(status_code=400, detail=detail)
+        self.potion_sku = potion_sku
+        self.reason = reason
+
+
+def checkout_key(cart_id: int) -> IdempotencyKey:
+    return IdempotencyKey(f"checkout-{cart_id}")
+
+
 @router.post("/{cart_id}/checkout", response_model=CheckoutResponse)
-def checkout(cart_id: int, cart_checkout: CartCheckout):
+async def checkout(
+    cart_id: int,
+    cart_checkout: CartCheckout,
+    key: IdempotencyKey = Depends(checkout_key),
+):
+    try:
+        response = await key.run(checkout_cart, cart_id)
+    except CheckoutFailed as failure:
+        # the checkout's own transaction rolled back, so log it in a new one
+        await db.run(
+            rollups.record_failed_checkout, cart_id, failure.potion_sku, failure.reason
+        )
+        raise
+    if key.replayed:
+        # checkouts recorded before responses were stored replay as zeros
+        return response or CheckoutResponse(total_potions_bought=0, total_gold_paid=0)
+
+    catalog_cache.invalidate()
+    return response
+
+
+def checkout_cart(connection: Connection, cart_id: int) -> CheckoutResponse:
     order_id = f"checkout-{cart_id}"
 
-    with db.engine.begin() as connection:
-        try:
-            connection.execute(
-                sqlalchemy.text(
-                    "INSERT INTO processed_requests (order_id) VALUES (:order_id)"
-                ),
-                {"order_id": order_id},
-            )
-        except sqlalchemy.exc.IntegrityError:
-            return CheckoutResponse(total_potions_bought=0, total_gold_paid=0)
+    # the cart row before its items: the abandoned cart sweep locks carts
+    # (SKIP LOCKED), so while a checkout holds its cart the sweep passes it
+    # over, and a sweep that got there first is undone below
+    connection.execute(
+        sqlalchemy.text("SELECT id FROM carts WHERE id = :cart_id FOR UPDATE"),
+        {"cart_id": cart_id},
+    )
 
-        cart_items = connection.execute(
-            sqlalchemy.text("""
-                SELECT potion_sku, quantity FROM cart_items WHERE cart_id = :cart_id
-            """),
-            {"cart_id": cart_id},
-        ).fetchall()
+    cart_items = connection.execute(
+        sqlalchemy.text("""
+            SELECT potion_sku, quantity FROM cart_items
+            WHERE cart_id = :cart_id
+            ORDER BY potion_sku
+            FOR UPDATE
+        """),
+        {"cart_id": cart_id},
+    ).fetchall()
+
+    if not cart_items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    catalog = catalog_registry.get(connection).by_sku
+
+    total_gold_paid = 0
+    total_potions_bought = 0
+
+    for item in cart_items:
+        if item.potion_sku not in catalog:
+            raise CheckoutFailed(
+                item.potion_sku,
+                rollups.MISSING_PRICE,
+                f"Missing price for {item.potion_sku}",
+            )
 
-        if not cart_items:
-            raise HTTPException(status_code=400, detail="Cart is empty")
+        total_gold_paid += item.quantity * catalog[item.potion_sku].price
+        total_potions_bought += item.quantity
 
-        potion_prices = connection.execute(
+    # decrement stock only if there is enough of it; skus are taken in a
+    # fixed order so concurrent checkouts can't deadlock on each other.
+    # any shortfall raises and rolls back the whole cart.
+    for item in cart_items:
+        remaining = connection.execute(
             sqlalchemy.text("""
-                SELECT sku, price FROM potion_catalog
-                WHERE sku IN :sku_list
-            """).bindparams(bindparam("sku_list", expanding=True)),
-            {"sku_list": [item.potion_sku for item in cart_items]},
-        ).fetchall()
-        price_map = {row.sku: row.price for row in potion_prices}
-
-        potion_inventory = connection.execute(
-            sqlalchemy.text("SELECT sku, quantity FROM potion_inventory")
-        ).fetchall()
-        inventory_map = {row.sku: row.quantity for row in potion_inventory}
-
-        total_gold_paid = 0
-        total_potions_bought = 0
-
-        for item in cart_items:
-            sku = item.potion_sku
-            qty = item.quantity
-
-            if sku not in price_map:
-                raise HTTPException(status_code=400, detail=f"Missing price for {sku}")
-
-            if (inventory_map.get(sku) or 0) < qty:
-                raise HTTPException(
-                    status_code=400, detail=f"Not enough of {sku} in stock"
-                )
-
-            total_gold_paid += qty * price_map[sku]
-            total_potions_bought += qty
-
-        # subtract potion inventory and log potion ledger entries
-        for item in cart_items:
-            connection.execute(
-                sqlalchemy.text("""
-                    INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
-                    VALUES ('potion', :sku, :quantity, :order_id, 'checkout')
-                """),
-                {
-                    "sku": item.potion_sku,
-                    "quantity": -item.quantity,
-                    "order_id": order_id,
-                },
+                UPDATE potion_inventory
+                SET quantity = quantity - :qty
+                WHERE sku = :sku AND quantity >= :qty
+                RETURNING quantity
+            """),
+            {"qty": item.quantity, "sku": item.potion_sku},
+        ).first()
+
+        if remaining is None:
+            raise CheckoutFailed(
+                item.potion_sku,
+                rollups.OUT_OF_STOCK,
+                f"Not enough of {item.potion_sku} in stock",
             )
-            connection.execute(
-                sqlalchemy.text("""
-                    UPDATE potion_inventory
-                    SET quantity = quantity - :qty
-                    WHERE sku = :sku
-                """),
-                {"qty": item.quantity, "sku": item.potion_sku},
+
+    # log potion and gold ledger entries, written when the checkout commits
+    ledger.writer(connection).extend(
+        [
+            ledger.LedgerEntry(
+                "potion", item.potion_sku, -item.quantity, order_id, "checkout"
             )
+            for item in cart_items
+        ]
+        + [ledger.LedgerEntry("gold", None, total_gold_paid, order_id, "checkout")],
+    )
 
-        # add gold to shop and log to ledger
-        connection.execute(
-            sqlalchemy.text("""
-                UPDATE gold_inventory
-                SET amount = amount + :amount
-            """),
-            {"amount": total_gold_paid},
-        )
-        connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO ledger_entries (category, quantity, order_id, source)
-                VALUES ('gold', :amount, :order_id, 'checkout')
-            """),
-            {"amount": total_gold_paid, "order_id": order_id},
-        )
+    # add gold to shop
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE gold_inventory
+            SET amount = amount + :amount
+        """),
+        {"amount": total_gold_paid},
+    )
 
-        # mark cart as checked out
-        connection.execute(
-            sqlalchemy.text("UPDATE carts SET checked_out = TRUE WHERE id = :cart_id"),
-            {"cart_id": cart_id},
-        )
+    # mark cart as checked out; a cart swept as abandoned that its customer
+    # came back to is a completed cart, not an abandoned one
+    character_class = connection.execute(
+        sqlalchemy.text("""
+            UPDATE carts
+            SET checked_out = TRUE, checked_out_at = now(), abandoned_at = NULL
+            WHERE id = :cart_id
+            RETURNING character_class
+        """),
+        {"cart_id": cart_id},
+    ).scalar()
+
+    rollups.record_sales(
+        connection,
+        character_class or "",
+        cart_items,
+        {item.potion_sku: catalog[item.potion_sku].price for item in cart_items},
+    )
 
     return CheckoutResponse(
         total_potions_bought=total_potions_bought,
@@ -1,11 +1,22 @@
-from fastapi import APIRouter
-from pydantic import BaseModel, Field
-from typing import List, Annotated
+from dataclasses import dataclass
+from fastapi import APIRouter, Request, Response, status
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Awaitable, Callable, List, Annotated, Optional
 from src import database as db
+from src.catalog_registry import registry as catalog_registry
+import asyncio
+import hashlib
+import time
 import sqlalchemy
+from sqlalchemy.engine import Connection
 
 router = APIRouter()
 
+# How long (seconds) a rendered catalog is served before it is rebuilt.
+# Bottler deliveries, checkouts and resets in this process invalidate it
+# immediately; the TTL bounds staleness from changes made anywhere else.
+CATALOG_TTL = 2.0
+
 
 class CatalogItem(BaseModel):
     sku: Annotated[str, Field(pattern=r"^[a-zA-Z0-9_]{1,20}$")]
@@ -20,36 +31,124 @@ class CatalogItem(BaseModel):
     )
 
 
+catalog_adapter = TypeAdapter(List[CatalogItem])
+
+
+@dataclass(frozen=True)
+class CachedCatalog:
+    body: bytes
+    etag: str
+    built_at: float
+
+
+class CatalogCache:
+    """
+    Rendered /catalog/ response plus its ETag. A miss is rebuilt by exactly
+    one request; requests arriving meanwhile wait on the lock and then reuse
+    the fresh copy instead of querying again.
+    """
+
+    def __init__(self, build: Callable[[], Awaitable[List[CatalogItem]]]) -> None:
+        self._build = build
+        self._lock = asyncio.Lock()
+        self._cached: Optional[CachedCatalog] = None
+        self._generation = 0
+
+    async def get(self) -> CachedCatalog:
+        cached = self._cached
+        if cached is not None and time.monotonic() - cached.built_at < CATALOG_TTL:
+            return cached
+
+        async with self._lock:
+            cached = self._cached
+            if cached is not None and time.monotonic() - cached.built_at < CATALOG_TTL:
+                return cached
+
+            generation = self._generation
+            body = catalog_adapter.dump_json(await self._build())
+            cached = CachedCatalog(
+                body=body,
+                etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+                built_at=time.monotonic(),
+            )
+            # an invalidate() that raced the build means the rows we read may
+            # already be stale, so answer this request but don't keep it
+            if generation == self._generation:
+                self._cached = cached
+            return cached
+
+    def invalidate(self) -> None:
+        """Drop the rendered catalog so the next get() rebuilds it."""
+        self._generation += 1
+        self._cached = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def build_catalog() -> List[CatalogItem]:
+    return await db.run(read_catalog)
+
+
+def read_catalog(connection: Connection) -> List[CatalogItem]:
+    """
+    Only potions marked as active and with quantity > 0 are listed, at most
+    6 of them, in sku order.
+    """
+    potions = catalog_registry.get(connection).by_sku
+    in_stock = connection.execute(
+        sqlalchemy.text("""
+            SELECT sku, quantity
+            FROM potion_inventory
+            WHERE quantity > 0
+            ORDER BY sku
+        """)
+    ).fetchall()
+
+    catalog = []
+    for row in in_stock:
+        potion = potions.get(row.sku)
+        if potion is None or potion.listed is not True:
+            continue
+        catalog.append(
+            {
+                "sku": potion.sku,
+                "name": potion.name,
+                "price": potion.price,
+                "quantity": row.quantity,
+                "potion_type": list(potion.potion_type),
+            }
+        )
+        if len(catalog) == 6:
+            break
+
+    return catalog_adapter.validate_python(catalog)
+
+
+cache = CatalogCache(build_catalog)
+
+
 @router.get("/catalog/", tags=["catalog"], response_model=List[CatalogItem])
-def get_catalog() -> List[CatalogItem]:
+async def get_catalog(request: Request) -> Response:
     """
     Retrieves the catalog of items from the potions and potion_catalog tables.
     Only potions marked as active and with quantity > 0 will be shown.
     Limit of 6 potion SKUs at a time.
+
+    Responses carry a strong ETag; send it back in If-None-Match to get a
+    304 Not Modified while the catalog is unchanged.
     """
-    with db.engine.begin() as connection:
-        result = connection.execute(
-            sqlalchemy.text("""
-                SELECT 
-                    pc.sku, pc.name, pc.price, pc.r, pc.g, pc.b, pc.d,
-                    pi.quantity
-                FROM potion_catalog pc
-                JOIN potion_inventory pi ON pc.sku = pi.sku
-                JOIN potions p ON pc.sku = p.sku
-                WHERE p.active IS TRUE AND pi.quantity > 0
-                LIMIT 6;
-            """)
-        ).fetchall()
-
-    catalog = [
-        CatalogItem(
-            sku=row.sku,
-            name=row.name,
-            price=row.price,
-            quantity=row.quantity,
-            potion_type=[row.r, row.g, row.b, row.d],
-        )
-        for row in result
-    ]
+    cached = await cache.get()
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return catalog
+    return Response(content=cached.body, media_type="application/json", headers=headers)
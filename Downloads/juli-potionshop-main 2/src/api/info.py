@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status
 from pydantic import BaseModel
 from src.api import auth
+from src import plan_cache
 
 router = APIRouter(
     prefix="/info",
@@ -15,9 +16,8 @@ class Timestamp(BaseModel):
 
 
 @router.post("/current_time", status_code=status.HTTP_204_NO_CONTENT)
-def post_time(timestamp: Timestamp):
+async def post_time(timestamp: Timestamp):
     """
     Shares what the latest time (in game time) is.
     """
-    # TODO: Record day and time of the current tick to associate with later calls
-    pass
+    plan_cache.record_tick(timestamp.day, timestamp.hour)
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
 import sqlalchemy
+from sqlalchemy.engine import Connection
 from src.api import auth
 from src import database as db
+from src import inventory_summary
+from src import ledger
+from src.idempotency import IdempotencyKey, order_key
 
 router = APIRouter(
     prefix="/inventory",
@@ -25,66 +29,60 @@ class CapacityPlan(BaseModel):
 
 
 @router.get("/audit", response_model=InventoryAudit)
-def get_inventory():
+async def get_inventory():
     try:
-        with db.engine.begin() as connection:
-            # Liquid ML totals
-            liquid = (
-                connection.execute(
-                    sqlalchemy.text(
-                        "SELECT red_ml, green_ml, blue_ml, dark_ml FROM liquid_inventory LIMIT 1"
-                    )
-                )
-                .mappings()
-                .first()
-            )
-            if not liquid:
-                raise HTTPException(
-                    status_code=500, detail="Liquid inventory not initialized"
-                )
-
-            total_ml = (
-                (liquid.get("red_ml") or 0)
-                + (liquid.get("green_ml") or 0)
-                + (liquid.get("blue_ml") or 0)
-                + (liquid.get("dark_ml") or 0)
-            )
-
-            # Potions total
-            potions_total = (
-                connection.execute(
-                    sqlalchemy.text("SELECT SUM(quantity) FROM potion_inventory")
-                ).scalar()
-                or 0
-            )
-
-            # Gold total
-            gold = (
-                connection.execute(
-                    sqlalchemy.text("SELECT amount FROM gold_inventory LIMIT 1")
-                ).scalar()
-                or 0
-            )
-
+        return await db.run(audit_inventory)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inventory query failed: {e}")
 
+
+def audit_inventory(connection: Connection) -> InventoryAudit:
+    # triggers on the liquid, potion and gold inventory tables append deltas
+    # that are folded into inventory_summary in the background, so the audit
+    # is one read of the summary row and the few deltas since the last fold
+    summary = inventory_summary.read_totals(connection)
+    if summary is None:
+        raise HTTPException(status_code=500, detail="Inventory summary not initialized")
+
+    return InventoryAudit(
+        number_of_potions=summary.total_potions,
+        ml_in_barrels=summary.total_ml,
+        gold=summary.gold,
+    )
+
+
+def recompute_inventory(connection: Connection) -> InventoryAudit:
+    """The audit totals summed from the raw inventory tables."""
+    totals = connection.execute(
+        sqlalchemy.text("""
+            SELECT
+                (SELECT COALESCE(SUM(red_ml + green_ml + blue_ml + dark_ml), 0)
+                 FROM liquid_inventory) AS total_ml,
+                (SELECT COALESCE(SUM(quantity), 0)
+                 FROM potion_inventory) AS total_potions,
+                (SELECT COALESCE(SUM(amount), 0) FROM gold_inventory) AS gold
+        """)
+    ).one()
+
     return InventoryAudit(
-        number_of_potions=potions_total,
-        ml_in_barrels=total_ml,
-        gold=gold,
+        number_of_potions=totals.total_potions,
+        ml_in_barrels=totals.total_ml,
+        gold=totals.gold,
     )
 
 
 @router.post("/plan", response_model=CapacityPlan)
-def get_capacity_plan():
-    with db.engine.begin() as connection:
-        gold = (
-            connection.execute(
-                sqlalchemy.text("SELECT amount FROM gold_inventory LIMIT 1")
-            ).scalar()
-            or 0
-        )
+async def get_capacity_plan():
+    return await db.run(plan_capacity)
+
+
+def plan_capacity(connection: Connection) -> CapacityPlan:
+    gold = (
+        connection.execute(
+            sqlalchemy.text("SELECT amount FROM gold_inventory LIMIT 1")
+        ).scalar()
+        or 0
+    )
 
     max_units = min(gold // 1000, 10)
     return CapacityPlan(
@@ -94,60 +92,53 @@ def get_capacity_plan():
 
 
 @router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
-def deliver_capacity_plan(capacity_purchase: CapacityPlan, order_id: str):
-    cost = 1000 * (capacity_purchase.potion_capacity + capacity_purchase.ml_capacity)
+async def deliver_capacity_plan(
+    capacity_purchase: CapacityPlan,
+    order_id: str,
+    key: IdempotencyKey = Depends(order_key),
+):
+    await key.run(record_capacity_purchase, capacity_purchase, order_id)
 
-    with db.engine.begin() as connection:
-        # Idempotency check
-        try:
-            connection.execute(
-                sqlalchemy.text("""
-                    INSERT INTO processed_requests (order_id)
-                    VALUES (:order_id)
-                """),
-                {"order_id": order_id},
-            )
-        except sqlalchemy.exc.IntegrityError:
-            return  # already processed
-
-        current_gold = connection.execute(
-            sqlalchemy.text("SELECT amount FROM gold_inventory LIMIT 1")
-        ).scalar()
 
-        if current_gold is None or current_gold < cost:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Not enough gold: required {cost}, available {current_gold}",
-            )
+def record_capacity_purchase(
+    connection: Connection, capacity_purchase: CapacityPlan, order_id: str
+) -> None:
+    cost = 1000 * (capacity_purchase.potion_capacity + capacity_purchase.ml_capacity)
 
-        # Deduct gold
-        connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO ledger_entries (category, quantity, order_id, source)
-                VALUES ('gold', :amount, :order_id, 'capacity-upgrade')
-            """),
-            {"amount": -cost, "order_id": order_id},
-        )
+    current_gold = connection.execute(
+        sqlalchemy.text("SELECT amount FROM gold_inventory LIMIT 1")
+    ).scalar()
 
-        connection.execute(
-            sqlalchemy.text("""
-                UPDATE gold_inventory SET amount = amount - :amount
-            """),
-            {"amount": cost},
+    if current_gold is None or current_gold < cost:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Not enough gold: required {cost}, available {current_gold}",
         )
 
-        # Update capacity_inventory
-        connection.execute(
-            sqlalchemy.text("""
-                INSERT INTO capacity_inventory (id, potion_capacity, ml_capacity)
-                VALUES (1, :potion, :ml)
-                ON CONFLICT (id)
-                DO UPDATE SET
-                    potion_capacity = capacity_inventory.potion_capacity + EXCLUDED.potion_capacity,
-                    ml_capacity = capacity_inventory.ml_capacity + EXCLUDED.ml_capacity
-            """),
-            {
-                "potion": capacity_purchase.potion_capacity,
-                "ml": capacity_purchase.ml_capacity,
-            },
-        )
+    # Deduct gold
+    ledger.writer(connection).append(
+        ledger.LedgerEntry("gold", None, -cost, order_id, "capacity-upgrade")
+    )
+
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE gold_inventory SET amount = amount - :amount
+        """),
+        {"amount": cost},
+    )
+
+    # Update capacity_inventory
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO capacity_inventory (id, potion_capacity, ml_capacity)
+            VALUES (1, :potion, :ml)
+            ON CONFLICT (id)
+            DO UPDATE SET
+                potion_capacity = capacity_inventory.potion_capacity + EXCLUDED.potion_capacity,
+                ml_capacity = capacity_inventory.ml_capacity + EXCLUDED.ml_capacity
+        """),
+        {
+            "potion": capacity_purchase.potion_capacity,
+            "ml": capacity_purchase.ml_capacity,
+        },
+    )
@@ -1,7 +1,22 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from src.api import carts, catalog, bottler, barrels, admin, info, inventory
+from fastapi.responses import PlainTextResponse
+import asyncio
+from src import (
+    abandoned_carts,
+    idempotency,
+    inventory_summary,
+    ledger,
+    log,
+    metrics,
+    rollups,
+    visits,
+)
+from src.api import carts, catalog, bottler, barrels, admin, info, inventory, analytics
 from starlette.middleware.cors import CORSMiddleware
 
+log.configure()
+
 description = """
 Central Coast Cauldrons is the premier ecommerce site for all your alchemical desires.
 """
@@ -19,8 +34,32 @@ tags_metadata = [
         "name": "inventory",
         "description": "Get the current inventory of shop and buying capacity.",
     },
+    {
+        "name": "analytics",
+        "description": "Hourly sales, failed checkout and cart rollups.",
+    },
 ]
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pruner = asyncio.create_task(idempotency.prune_forever())
+    compactor = asyncio.create_task(ledger.compact_forever())
+    visit_flusher = asyncio.create_task(visits.flush_forever())
+    aggregator = asyncio.create_task(rollups.aggregate_forever())
+    sweeper = asyncio.create_task(abandoned_carts.sweep_forever())
+    summary_folder = asyncio.create_task(inventory_summary.fold_forever())
+    yield
+    pruner.cancel()
+    compactor.cancel()
+    aggregator.cancel()
+    sweeper.cancel()
+    summary_folder.cancel()
+    # wait for it to write the visits it still holds
+    visit_flusher.cancel()
+    await asyncio.gather(visit_flusher, return_exceptions=True)
+
+
 app = FastAPI(
     title="Central Coast Cauldrons",
     description=description,
@@ -31,6 +70,7 @@ app = FastAPI(
         "email": "lupierce@calpoly.edu",
     },
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
 )
 
 origins = ["https://potion-exchange.vercel.app"]
@@ -42,6 +82,7 @@ app.add_middleware(
     allow_methods=["GET", "OPTIONS"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(inventory.router)
 app.include_router(carts.router)
@@ -50,8 +91,17 @@ app.include_router(bottler.router)
 app.include_router(barrels.router)
 app.include_router(admin.router)
 app.include_router(info.router)
+app.include_router(analytics.router)
 
 
 @app.get("/")
 async def root():
     return {"message": "Shop is open for business!"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, SQL and connection pool metrics in Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
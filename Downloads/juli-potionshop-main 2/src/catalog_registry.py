@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+import threading
+import time
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from src import database as db
+
+# How often (seconds) a cached catalog re-checks catalog_version. Changes
+# committed through this process are seen by the next get(); edits made
+# elsewhere (another worker, a SQL console) are picked up within this window.
+VERSION_CHECK_INTERVAL = 2.0
+
+
+@dataclass(frozen=True)
+class CatalogPotion:
+    sku: str
+    name: str
+    r: int
+    g: int
+    b: int
+    d: int
+    price: int
+    active: Optional[bool]  # potion_catalog.active
+    listed: Optional[bool]  # potions.active, None when there is no potions row
+
+    @property
+    def potion_type(self) -> tuple[int, int, int, int]:
+        return (self.r, self.g, self.b, self.d)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    by_type: Dict[tuple[int, int, int, int], CatalogPotion]
+    by_sku: Dict[str, CatalogPotion]
+
+
+class CatalogRegistry:
+    """
+    Process-wide copy of potion_catalog (joined with potions.active), indexed
+    by (r, g, b, d) and by sku. Reloaded whenever catalog_version moves.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._generation = 0
+        # newest catalog_version committed through this process
+        self._committed_version = 0
+
+    def get(self, connection: Connection) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and snapshot.version >= self._committed_version
+            and time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL
+        ):
+            return snapshot
+
+        # no lock around the queries: under the async engine they yield the
+        # event loop, and a thread lock held across that would block it
+        generation = self._generation
+        version = _read_version(connection)
+        if snapshot is None or snapshot.version != version:
+            snapshot = _load(connection, version)
+        with self._lock:
+            # a load that raced invalidate() may predate the change behind it
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._checked_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self) -> None:
+        """Drop the cached catalog so the next get() reloads it."""
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def wrote(self, connection: Connection) -> None:
+        """
+        Marks connection's transaction as one that moves catalog_version (see
+        its triggers), so its commit is seen by the next get(). Callers mark
+        only the writes that change the catalog, not every write to potions.
+        """
+        connection.info["catalog_written"] = True
+
+    def committed(self, version: int) -> None:
+        """
+        Called as a catalog write commits: no snapshot older than version is
+        served again. A get() that races the commit and still reads the old
+        version caches nothing that outlives it.
+        """
+        with self._lock:
+            self._committed_version = max(self._committed_version, version)
+
+
+def _read_version(connection: Connection) -> int:
+    return (
+        connection.execute(
+            sqlalchemy.text("SELECT version FROM catalog_version WHERE id = 1")
+        ).scalar()
+        or 0
+    )
+
+
+def _load(connection: Connection, version: int) -> CatalogSnapshot:
+    rows = connection.execute(
+        sqlalchemy.text("""
+            SELECT pc.sku, pc.name, pc.r, pc.g, pc.b, pc.d, pc.price, pc.active,
+                   p.active AS listed
+            FROM potion_catalog pc
+            LEFT JOIN potions p ON p.sku = pc.sku
+            ORDER BY pc.sku
+        """).columns(active=sqlalchemy.Boolean, listed=sqlalchemy.Boolean)
+    ).fetchall()
+
+    by_type: Dict[tuple[int, int, int, int], CatalogPotion] = {}
+    by_sku: Dict[str, CatalogPotion] = {}
+    for row in rows:
+        potion = CatalogPotion(
+            sku=row.sku,
+            name=row.name,
+            r=row.r,
+            g=row.g,
+            b=row.b,
+            d=row.d,
+            price=row.price,
+            active=row.active,
+            listed=row.listed,
+        )
+        by_sku[potion.sku] = potion
+        by_type.setdefault(potion.potion_type, potion)
+
+    return CatalogSnapshot(version=version, by_type=by_type, by_sku=by_sku)
+
+
+registry = CatalogRegistry()
+
+
+def on_commit(connection: Connection) -> None:
+    # runs just before the DBAPI commit, so this reads the version the
+    # transaction's own writes moved catalog_version to
+    if connection.info.pop("catalog_written", False):
+        registry.committed(_read_version(connection))
+
+
+def on_rollback(connection: Connection) -> None:
+    connection.info.pop("catalog_written", None)
+
+
+for engine in (db.engine, db.async_engine and db.async_engine.sync_engine):
+    if engine is not None:
+        event.listen(engine, "commit", on_commit)
+        event.listen(engine, "rollback", on_rollback)
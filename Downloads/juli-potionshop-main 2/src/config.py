@@ -12,12 +12,28 @@ load_dotenv(dotenv_path=find_dotenv(".env"), override=True)
 class Settings:
     API_KEY: str | None = os.getenv("API_KEY")
     POSTGRES_URI: str | None = os.getenv("POSTGRES_URI")
+    # run on SQLite instead of Postgres: a file path, or ":memory:"
+    SQLITE_PATH: str | None = os.getenv("SQLITE_PATH") or None
+    # serve database work from the async engine instead of the threadpool
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+    # level for all src.* loggers, plus per-module overrides such as
+    # "src.api.barrels=DEBUG,src.api.bottler=WARNING"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    # "greedy" buys one pure barrel for the lowest color; "optimal" plans a
+    # mix of barrels against target color ratios
+    BARREL_PLANNER: str = os.getenv("BARREL_PLANNER", "greedy").lower()
+    # "greedy" fills recipes with the most colors first; "revenue" picks
+    # quantities to maximize price * quantity
+    BOTTLE_PLANNER: str = os.getenv("BOTTLE_PLANNER", "greedy").lower()
 
     def __init__(self):
         if not self.API_KEY:
             raise ValueError("API_KEY is missing in the environment variables.")
-        if not self.POSTGRES_URI:
+        if not self.POSTGRES_URI and not self.SQLITE_PATH:
             raise ValueError("POSTGRES_URI is missing in the environment variables.")
+        if self.SQLITE_PATH and self.DB_ASYNC:
+            raise ValueError("DB_ASYNC is not supported with SQLITE_PATH.")
 
 
 @lru_cache()
@@ -1,7 +1,68 @@
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Any, Callable, ContextManager, TypeVar
+import threading
 from src import config
+from src import metrics
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import declarative_base
+from starlette.concurrency import run_in_threadpool
+
+T = TypeVar("T")
 
 Base = declarative_base()
-connection_url = config.get_settings().POSTGRES_URI
-engine = create_engine(connection_url, pool_pre_ping=True)
+settings = config.get_settings()
+connection_url = settings.POSTGRES_URI
+
+_serialized: ContextManager[Any]
+if settings.SQLITE_PATH:
+    from src import sqlite_backend
+
+    engine = sqlite_backend.make_engine(settings.SQLITE_PATH)
+    # SQLite has one writer and no row locks, so FOR UPDATE is dropped and
+    # whole transactions take turns instead
+    _serialized = threading.Lock()
+else:
+    engine = create_engine(connection_url, pool_pre_ping=True)
+    _serialized = nullcontext()
+
+# psycopg 3 serves both engines; the async one only exists when DB_ASYNC is on
+async_engine = (
+    create_async_engine(
+        make_url(connection_url).set(drivername="postgresql+psycopg"),
+        pool_pre_ping=True,
+    )
+    if settings.DB_ASYNC
+    else None
+)
+
+metrics.instrument_engine(engine, "sync")
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+
+
+def _run_blocking(fn: Callable[..., T], *args) -> T:
+    start = perf_counter()
+    with _serialized, engine.begin() as connection:
+        metrics.observe_pool_wait("sync", perf_counter() - start)
+        return fn(connection, *args)
+
+
+async def run(fn: Callable[..., T], *args) -> T:
+    """
+    Run fn(connection, *args) in one transaction and return its result.
+
+    With DB_ASYNC the statements go through the async engine, so waiting on
+    Postgres yields the event loop instead of holding a worker thread;
+    otherwise fn runs on the blocking engine in the threadpool. Either way fn
+    is ordinary sync code taking a Connection, and an exception rolls back.
+    """
+    if async_engine is None:
+        return await run_in_threadpool(_run_blocking, fn, *args)
+
+    start = perf_counter()
+    async with async_engine.begin() as connection:
+        metrics.observe_pool_wait("async", perf_counter() - start)
+        return await connection.run_sync(fn, *args)
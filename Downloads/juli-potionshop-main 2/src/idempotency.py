@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from typing import Any, Callable, Tuple, TypeVar
+import asyncio
+import json
+import logging
+import threading
+import sqlalchemy
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.engine import Connection
+from src import database as db
+from src import schema
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# order ids the game retries are seconds to minutes old; a week is plenty
+RETENTION = "7 days"
+PRUNE_INTERVAL = 3600.0
+PRUNE_BATCH = 5000
+
+# most retries arrive right after the original, so a small in-process map of
+# recently finished keys answers them without touching the database
+RECENT_KEYS = 4096
+
+
+class RecentKeys:
+    """Bounded LRU of order_id -> stored response for keys known to be done."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._responses: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, order_id: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if order_id not in self._responses:
+                return False, None
+            self._responses.move_to_end(order_id)
+            return True, self._responses[order_id]
+
+    def put(self, order_id: str, response: Any) -> None:
+        with self._lock:
+            self._responses[order_id] = response
+            self._responses.move_to_end(order_id)
+            if len(self._responses) > self.capacity:
+                self._responses.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._responses.clear()
+
+
+recent = RecentKeys(RECENT_KEYS)
+
+
+def claim(connection: Connection, order_id: str) -> Tuple[bool, Any]:
+    """
+    Try to take order_id for this transaction. Returns (True, None) if it is
+    ours, or (False, stored response) if it was already processed. A key held
+    by an in-flight transaction makes the INSERT wait for it to finish.
+    """
+    claimed = connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO processed_requests (order_id)
+            VALUES (:order_id)
+            ON CONFLICT (order_id) DO NOTHING
+            RETURNING order_id
+        """),
+        {"order_id": order_id},
+    ).first()
+    if claimed is not None:
+        return True, None
+
+    # the INSERT's snapshot predates the row it collided with; read it fresh
+    response = connection.execute(
+        sqlalchemy.text(
+            "SELECT response FROM processed_requests WHERE order_id = :order_id"
+        ).columns(response=schema.processed_requests.c.response.type),
+        {"order_id": order_id},
+    ).scalar()
+    return False, response
+
+
+def store(connection: Connection, order_id: str, response: Any) -> None:
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE processed_requests
+            SET response = CAST(:response AS JSONB)
+            WHERE order_id = :order_id
+        """),
+        {"order_id": order_id, "response": json.dumps(response)},
+    )
+
+
+class IdempotencyKey:
+    """
+    One request's idempotency key. run() does the work at most once per key
+    and hands back the original response to every retry.
+    """
+
+    def __init__(self, order_id: str) -> None:
+        self.order_id = order_id
+        self.replayed = False
+        self._response: Any = None
+
+    async def run(
+        self,
+        fn: Callable[..., T],
+        *args,
+        respond: Callable[[T], Any] = jsonable_encoder,
+    ) -> Any:
+        """
+        Run fn(connection, *args) in one transaction with the key claim and
+        return its result. respond(result) is what gets stored and replayed.
+        On a retry fn is not called; the stored response is returned and
+        self.replayed is set. If fn raises, the claim rolls back with it.
+        """
+        done, response = recent.get(self.order_id)
+        if done:
+            self.replayed = True
+            return response
+
+        result = await db.run(self._claim_and_run, fn, respond, *args)
+        recent.put(self.order_id, result if self.replayed else self._response)
+        return result
+
+    def _claim_and_run(
+        self,
+        connection: Connection,
+        fn: Callable[..., T],
+        respond: Callable[[T], Any],
+        *args,
+    ) -> Any:
+        claimed, response = claim(connection, self.order_id)
+        if not claimed:
+            self.replayed = True
+            return response
+
+        result = fn(connection, *args)
+        self._response = respond(result)
+        store(connection, self.order_id, self._response)
+        return result
+
+
+def order_key(order_id: str) -> IdempotencyKey:
+    """Dependency for endpoints whose path carries the game's order_id."""
+    return IdempotencyKey(order_id)
+
+
+def prune(connection: Connection) -> int:
+    """Delete up to PRUNE_BATCH keys older than RETENTION, oldest first."""
+    return connection.execute(
+        sqlalchemy.text("""
+            DELETE FROM processed_requests
+            WHERE order_id IN (
+                SELECT order_id FROM processed_requests
+                WHERE created_at < now() - CAST(:retention AS INTERVAL)
+                ORDER BY created_at
+                LIMIT :batch
+            )
+        """),
+        {"retention": RETENTION, "batch": PRUNE_BATCH},
+    ).rowcount
+
+
+async def prune_forever() -> None:
+    """Background task: prune expired keys every PRUNE_INTERVAL seconds."""
+    while True:
+        try:
+            deleted = PRUNE_BATCH
+            total = 0
+            # short batches so the DELETE never holds many row locks at once
+            while deleted == PRUNE_BATCH:
+                deleted = await db.run(prune)
+                total += deleted
+            if total:
+                logger.info("pruned idempotency keys", extra={"deleted": total})
+        except Exception:
+            logger.exception("pruning idempotency keys failed")
+        await asyncio.sleep(PRUNE_INTERVAL)
@@ -0,0 +1,84 @@
+from typing import Any, Optional
+import asyncio
+import logging
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+FOLD_INTERVAL = 1.0
+
+# inventory_summary plus every delta not yet folded into it, as one
+# statement and so one snapshot; the fold moves deltas across atomically
+TOTALS = """
+    SELECT
+        s.total_ml + d.total_ml AS total_ml,
+        s.total_potions + d.total_potions AS total_potions,
+        s.gold + d.gold AS gold,
+        s.version + d.deltas AS version
+    FROM inventory_summary s
+    CROSS JOIN (
+        SELECT
+            COALESCE(SUM(total_ml), 0) AS total_ml,
+            COALESCE(SUM(total_potions), 0) AS total_potions,
+            COALESCE(SUM(gold), 0) AS gold,
+            COUNT(*) AS deltas
+        FROM inventory_summary_deltas
+    ) d
+    WHERE s.id = 1
+"""
+
+
+def read_totals(connection: Connection) -> Optional[sqlalchemy.Row[Any]]:
+    """
+    Current total_ml, total_potions, gold and version, or None before the
+    summary row is seeded. version counts every committed inventory change:
+    the set of committed deltas only grows and a fold keeps the count, so
+    two reads see the same version only if they see the same inventory.
+    """
+    return connection.execute(sqlalchemy.text(TOTALS)).first()
+
+
+def fold(connection: Connection) -> int:
+    """
+    Moves the committed deltas into inventory_summary. Only this takes the
+    summary row's lock, and it holds no inventory row locks while it does.
+    Returns the number of deltas folded.
+    """
+    deltas = connection.execute(
+        sqlalchemy.text("""
+            DELETE FROM inventory_summary_deltas
+            RETURNING total_ml, total_potions, gold
+        """)
+    ).fetchall()
+    if not deltas:
+        return 0
+
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE inventory_summary SET
+                total_ml = total_ml + :total_ml,
+                total_potions = total_potions + :total_potions,
+                gold = gold + :gold,
+                version = version + :deltas
+            WHERE id = 1
+        """),
+        {
+            "total_ml": sum(d.total_ml for d in deltas),
+            "total_potions": sum(d.total_potions for d in deltas),
+            "gold": sum(d.gold for d in deltas),
+            "deltas": len(deltas),
+        },
+    )
+    return len(deltas)
+
+
+async def fold_forever() -> None:
+    """Background task: fold inventory deltas every FOLD_INTERVAL seconds."""
+    while True:
+        try:
+            await db.run(fold)
+        except Exception:
+            logger.exception("folding inventory summary failed")
+        await asyncio.sleep(FOLD_INTERVAL)
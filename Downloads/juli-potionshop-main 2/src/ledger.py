@@ -0,0 +1,510 @@
+from dataclasses import astuple, dataclass
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+LIQUID_TYPES = ["red_ml", "green_ml", "blue_ml", "dark_ml"]
+
+# entries younger than this stay in ledger_entries as the live tail; older
+# ones are folded into ledger_checkpoints and moved to ledger_entries_archive
+COMPACT_AFTER = "1 hour"
+COMPACT_INTERVAL = 600.0
+COMPACT_BATCH = 10000
+
+# batches at least this big go through COPY on the blocking psycopg engine
+COPY_THRESHOLD = 500
+
+
+@dataclass
+class LedgerEntry:
+    category: str
+    sub_type: Optional[str]
+    quantity: int
+    order_id: str
+    source: str
+
+
+def insert_entries(connection: Connection, entries: List[LedgerEntry]) -> None:
+    """
+    Writes all entries to ledger_entries as a single multi-row INSERT.
+    """
+    if not entries:
+        return
+
+    values = []
+    params: Dict[str, Any] = {}
+    for i, entry in enumerate(entries):
+        values.append(
+            f"(:category_{i}, :sub_type_{i}, :quantity_{i}, :order_id_{i}, :source_{i})"
+        )
+        params[f"category_{i}"] = entry.category
+        params[f"sub_type_{i}"] = entry.sub_type
+        params[f"quantity_{i}"] = entry.quantity
+        params[f"order_id_{i}"] = entry.order_id
+        params[f"source_{i}"] = entry.source
+
+    connection.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
+            VALUES {", ".join(values)}
+        """),
+        params,
+    )
+
+
+def copy_entries(connection: Connection, entries: List[LedgerEntry]) -> None:
+    """Streams entries into ledger_entries with COPY, in this transaction."""
+    cursor = connection.connection.cursor()
+    try:
+        with cursor.copy(
+            "COPY ledger_entries (category, sub_type, quantity, order_id, source)"
+            " FROM STDIN"
+        ) as copy:
+            for entry in entries:
+                copy.write_row(astuple(entry))
+    finally:
+        cursor.close()
+
+
+def write_entries(connection: Connection, entries: List[LedgerEntry]) -> None:
+    """One multi-row INSERT, or a COPY for big batches where the driver has it."""
+    if (
+        len(entries) >= COPY_THRESHOLD
+        and connection.dialect.driver == "psycopg"
+        and not connection.dialect.is_async
+    ):
+        copy_entries(connection, entries)
+    else:
+        insert_entries(connection, entries)
+
+
+class LedgerWriter:
+    """
+    Ledger entries appended by one transaction. They are written together
+    when the transaction commits, or earlier when something in it reads the
+    ledger; a rollback drops them.
+    """
+
+    def __init__(self) -> None:
+        self.entries: List[LedgerEntry] = []
+
+    def append(self, entry: LedgerEntry) -> None:
+        self.entries.append(entry)
+
+    def extend(self, entries: List[LedgerEntry]) -> None:
+        self.entries.extend(entries)
+
+    def flush(self, connection: Connection) -> None:
+        entries, self.entries = self.entries, []
+        if entries:
+            write_entries(connection, entries)
+
+
+def writer(connection: Connection) -> LedgerWriter:
+    """The LedgerWriter of connection's current transaction."""
+    return connection.info.setdefault("ledger_writer", LedgerWriter())
+
+
+def flush_pending(connection: Connection) -> None:
+    """Writes whatever this transaction has appended so far."""
+    pending = connection.info.get("ledger_writer")
+    if pending is not None:
+        pending.flush(connection)
+
+
+def on_commit(connection: Connection) -> None:
+    # runs just before the DBAPI commit, so the entries land in the same
+    # transaction as the rest of the request's changes
+    pending = connection.info.pop("ledger_writer", None)
+    if pending is not None:
+        pending.flush(connection)
+
+
+def on_rollback(connection: Connection) -> None:
+    connection.info.pop("ledger_writer", None)
+
+
+for engine in (db.engine, db.async_engine and db.async_engine.sync_engine):
+    if engine is not None:
+        event.listen(engine, "commit", on_commit)
+        event.listen(engine, "rollback", on_rollback)
+
+
+def record_liquid(
+    connection: Connection, ml_changes: Dict[str, int], order_id: str, source: str
+) -> None:
+    """
+    Writes one liquid ledger row per non-zero color, together with anything
+    else the transaction has appended, and folds them into
+    liquid_balance_snapshot in the same transaction. Liquid rows never wait
+    for commit: the fold needs their ids now.
+
+    The snapshot row is locked first so liquid writers are serialized and
+    ledger ids are handed out in the order they are folded.
+    """
+    entries = [
+        LedgerEntry("liquid", color, ml_changes[color], order_id, source)
+        for color in LIQUID_TYPES
+        if ml_changes.get(color, 0) != 0
+    ]
+    if not entries:
+        return
+
+    connection.execute(
+        sqlalchemy.text("""
+            SELECT 1 FROM liquid_balance_snapshot WHERE id = 1 FOR UPDATE
+        """)
+    )
+    pending = writer(connection)
+    pending.extend(entries)
+    pending.flush(connection)
+    fold_liquid_snapshot(connection)
+
+
+def fold_liquid_snapshot(connection: Connection) -> None:
+    """
+    Adds every liquid ledger row written after the snapshot into it and moves
+    last_ledger_id forward. Does nothing when there is no tail.
+    """
+    connection.execute(
+        sqlalchemy.text("""
+            UPDATE liquid_balance_snapshot
+            SET red_ml = liquid_balance_snapshot.red_ml + tail.red_ml,
+                green_ml = liquid_balance_snapshot.green_ml + tail.green_ml,
+                blue_ml = liquid_balance_snapshot.blue_ml + tail.blue_ml,
+                dark_ml = liquid_balance_snapshot.dark_ml + tail.dark_ml,
+                last_ledger_id = tail.last_id
+            FROM (
+                SELECT
+                    COALESCE(SUM(CASE WHEN sub_type = 'red_ml' THEN quantity END), 0) AS red_ml,
+                    COALESCE(SUM(CASE WHEN sub_type = 'green_ml' THEN quantity END), 0) AS green_ml,
+                    COALESCE(SUM(CASE WHEN sub_type = 'blue_ml' THEN quantity END), 0) AS blue_ml,
+                    COALESCE(SUM(CASE WHEN sub_type = 'dark_ml' THEN quantity END), 0) AS dark_ml,
+                    MAX(id) AS last_id
+                FROM ledger_entries
+                WHERE category = 'liquid'
+                  AND id > (SELECT last_ledger_id FROM liquid_balance_snapshot WHERE id = 1)
+            ) AS tail
+            WHERE liquid_balance_snapshot.id = 1 AND tail.last_id IS NOT NULL
+        """)
+    )
+
+
+def get_liquid_balances(connection: Connection) -> Dict[str, int]:
+    """
+    Current ml per color: the snapshot plus any liquid rows written after it.
+    """
+    result = (
+        connection.execute(
+            sqlalchemy.text("""
+                SELECT
+                    s.red_ml + COALESCE(SUM(CASE WHEN l.sub_type = 'red_ml' THEN l.quantity END), 0) AS red_ml,
+                    s.green_ml + COALESCE(SUM(CASE WHEN l.sub_type = 'green_ml' THEN l.quantity END), 0) AS green_ml,
+                    s.blue_ml + COALESCE(SUM(CASE WHEN l.sub_type = 'blue_ml' THEN l.quantity END), 0) AS blue_ml,
+                    s.dark_ml + COALESCE(SUM(CASE WHEN l.sub_type = 'dark_ml' THEN l.quantity END), 0) AS dark_ml
+                FROM liquid_balance_snapshot s
+                LEFT JOIN ledger_entries l
+                    ON l.category = 'liquid' AND l.id > s.last_ledger_id
+                WHERE s.id = 1
+                GROUP BY s.red_ml, s.green_ml, s.blue_ml, s.dark_ml
+            """)
+        )
+        .mappings()
+        .first()
+    )
+    if result is None:
+        return {color: 0 for color in LIQUID_TYPES}
+    return {color: int(result[color] or 0) for color in LIQUID_TYPES}
+
+
+def recompute_liquid_balances(connection: Connection) -> Dict[str, int]:
+    """
+    Full recompute of ml per color from every live liquid ledger row plus
+    the liquid checkpoints that compaction folded the older rows into.
+    """
+    result = (
+        connection.execute(
+            sqlalchemy.text("""
+                SELECT
+                    SUM(CASE WHEN sub_type = 'red_ml' THEN quantity ELSE 0 END) AS red_ml,
+                    SUM(CASE WHEN sub_type = 'green_ml' THEN quantity ELSE 0 END) AS green_ml,
+                    SUM(CASE WHEN sub_type = 'blue_ml' THEN quantity ELSE 0 END) AS blue_ml,
+                    SUM(CASE WHEN sub_type = 'dark_ml' THEN quantity ELSE 0 END) AS dark_ml
+                FROM (
+                    SELECT sub_type, quantity FROM ledger_entries
+                    WHERE category = 'liquid'
+                    UNION ALL
+                    SELECT sub_type, quantity FROM ledger_checkpoints
+                    WHERE category = 'liquid'
+                ) AS liquid
+            """)
+        )
+        .mappings()
+        .first()
+    )
+    if result is None:
+        return {color: 0 for color in LIQUID_TYPES}
+    return {color: int(result[color] or 0) for color in LIQUID_TYPES}
+
+
+def reset_liquid_snapshot(connection: Connection) -> None:
+    """
+    Zeroes the snapshot. Call after clearing ledger_entries and
+    ledger_checkpoints.
+    """
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO liquid_balance_snapshot
+                (id, red_ml, green_ml, blue_ml, dark_ml, last_ledger_id)
+            VALUES (1, 0, 0, 0, 0, 0)
+            ON CONFLICT (id) DO UPDATE
+            SET red_ml = 0, green_ml = 0, blue_ml = 0, dark_ml = 0, last_ledger_id = 0
+        """)
+    )
+
+
+def get_balance(connection: Connection, category: str) -> int:
+    """
+    Sum of quantity over every entry ever written for category: its
+    checkpoints plus the live tail. One statement, so a compaction committing
+    meanwhile is seen either entirely or not at all.
+    """
+    flush_pending(connection)
+    return int(
+        connection.execute(
+            sqlalchemy.text("""
+                SELECT
+                    COALESCE((
+                        SELECT SUM(quantity) FROM ledger_checkpoints
+                        WHERE category = :category
+                    ), 0)
+                    + COALESCE((
+                        SELECT SUM(quantity) FROM ledger_entries
+                        WHERE category = :category
+                    ), 0)
+            """),
+            {"category": category},
+        ).scalar()
+        or 0
+    )
+
+
+# ids of the entries a compaction batch may take: old enough, and for
+# liquid, already folded into the liquid snapshot
+COMPACTABLE_IDS = """
+    SELECT id FROM ledger_entries
+    WHERE "timestamp" < now() - CAST(:older_than AS INTERVAL)
+      AND category IS NOT NULL
+      AND (
+          category <> 'liquid'
+          OR id <= (
+              SELECT last_ledger_id FROM liquid_balance_snapshot WHERE id = 1
+          )
+      )
+    ORDER BY id
+    LIMIT :batch
+"""
+
+FOLD_INTO_CHECKPOINTS = """
+    ON CONFLICT (category, sub_type) DO UPDATE
+    SET quantity = ledger_checkpoints.quantity + EXCLUDED.quantity,
+        entries = ledger_checkpoints.entries + EXCLUDED.entries,
+        last_ledger_id = GREATEST(
+            ledger_checkpoints.last_ledger_id, EXCLUDED.last_ledger_id
+        ),
+        compacted_at = now()
+"""
+
+
+def compact(connection: Connection, older_than: str = COMPACT_AFTER) -> int:
+    """
+    Moves up to COMPACT_BATCH entries older than older_than out of
+    ledger_entries into ledger_entries_archive and adds them to their
+    (category, sub_type) checkpoint, all in one statement. Returns how many
+    entries were moved.
+
+    Every balance is checkpoint + live rows, and a row leaves the live table
+    in the same transaction that adds it to a checkpoint, so a crash rolls
+    back both and a second run finds nothing left to fold. Rows locked by
+    another compaction are skipped rather than waited on.
+
+    Liquid rows past the liquid snapshot's last_ledger_id are left alone:
+    the snapshot still has to find them in ledger_entries as its tail.
+    """
+    params = {"older_than": older_than, "batch": COMPACT_BATCH}
+    if connection.dialect.name == "sqlite":
+        return compact_in_steps(connection, params)
+
+    return connection.execute(
+        sqlalchemy.text(f"""
+            WITH moved AS (
+                DELETE FROM ledger_entries
+                WHERE id IN ({COMPACTABLE_IDS} FOR UPDATE SKIP LOCKED)
+                RETURNING *
+            ),
+            archived AS (
+                INSERT INTO ledger_entries_archive
+                SELECT * FROM moved
+            ),
+            folded AS (
+                INSERT INTO ledger_checkpoints
+                    (category, sub_type, quantity, entries, last_ledger_id)
+                SELECT
+                    category,
+                    COALESCE(sub_type, ''),
+                    COALESCE(SUM(quantity), 0),
+                    COUNT(*),
+                    MAX(id)
+                FROM moved
+                GROUP BY category, COALESCE(sub_type, '')
+                {FOLD_INTO_CHECKPOINTS}
+            )
+            SELECT COUNT(*) FROM moved
+        """),
+        params,
+    ).scalar_one()
+
+
+def compact_in_steps(connection: Connection, params: Dict[str, Any]) -> int:
+    """
+    compact() for SQLite, which has no data-modifying CTEs: the same batch
+    is picked, archived, folded and deleted in separate statements of one
+    transaction.
+    """
+    ids = connection.execute(sqlalchemy.text(COMPACTABLE_IDS), params).scalars().all()
+    if not ids:
+        return 0
+
+    batch = {"ids": ids}
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO ledger_entries_archive
+            SELECT * FROM ledger_entries WHERE id IN :ids
+        """).bindparams(sqlalchemy.bindparam("ids", expanding=True)),
+        batch,
+    )
+    connection.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO ledger_checkpoints
+                (category, sub_type, quantity, entries, last_ledger_id)
+            SELECT
+                category,
+                COALESCE(sub_type, ''),
+                COALESCE(SUM(quantity), 0),
+                COUNT(*),
+                MAX(id)
+            FROM ledger_entries
+            WHERE id IN :ids
+            GROUP BY category, COALESCE(sub_type, '')
+            {FOLD_INTO_CHECKPOINTS}
+        """).bindparams(sqlalchemy.bindparam("ids", expanding=True)),
+        batch,
+    )
+    connection.execute(
+        sqlalchemy.text("DELETE FROM ledger_entries WHERE id IN :ids").bindparams(
+            sqlalchemy.bindparam("ids", expanding=True)
+        ),
+        batch,
+    )
+    return len(ids)
+
+
+@dataclass
+class CheckpointCheck:
+    category: str
+    sub_type: str
+    checkpoint_quantity: int
+    archived_quantity: int
+    checkpoint_entries: int
+    archived_entries: int
+
+    @property
+    def matches(self) -> bool:
+        return (
+            self.checkpoint_quantity == self.archived_quantity
+            and self.checkpoint_entries == self.archived_entries
+        )
+
+
+def verify_checkpoints(connection: Connection) -> List[CheckpointCheck]:
+    """
+    Recomputes every checkpoint from the archived rows it was folded from.
+    A checkpoint with no archived rows, or archived rows with no checkpoint,
+    shows up with zeros on the missing side.
+    """
+    rows = connection.execute(
+        sqlalchemy.text("""
+            SELECT
+                COALESCE(c.category, a.category) AS category,
+                COALESCE(c.sub_type, a.sub_type) AS sub_type,
+                COALESCE(c.quantity, 0) AS checkpoint_quantity,
+                COALESCE(a.quantity, 0) AS archived_quantity,
+                COALESCE(c.entries, 0) AS checkpoint_entries,
+                COALESCE(a.entries, 0) AS archived_entries
+            FROM ledger_checkpoints c
+            FULL JOIN (
+                SELECT
+                    category,
+                    COALESCE(sub_type, '') AS sub_type,
+                    SUM(quantity) AS quantity,
+                    COUNT(*) AS entries
+                FROM ledger_entries_archive
+                GROUP BY category, COALESCE(sub_type, '')
+            ) a ON a.category = c.category AND a.sub_type = c.sub_type
+            ORDER BY 1, 2
+        """)
+    ).fetchall()
+    return [
+        CheckpointCheck(
+            category=row.category,
+            sub_type=row.sub_type,
+            checkpoint_quantity=int(row.checkpoint_quantity),
+            archived_quantity=int(row.archived_quantity),
+            checkpoint_entries=int(row.checkpoint_entries),
+            archived_entries=int(row.archived_entries),
+        )
+        for row in rows
+    ]
+
+
+def count_double_entries(connection: Connection) -> int:
+    """Entries present both live and archived, i.e. counted twice."""
+    return connection.execute(
+        sqlalchemy.text("""
+            SELECT COUNT(*)
+            FROM ledger_entries l
+            JOIN ledger_entries_archive a ON a.id = l.id
+        """)
+    ).scalar_one()
+
+
+def reset_checkpoints(connection: Connection) -> None:
+    """
+    Drops all checkpoints and archived entries. Call alongside clearing
+    ledger_entries.
+    """
+    connection.execute(sqlalchemy.text("DELETE FROM ledger_checkpoints"))
+    connection.execute(sqlalchemy.text("DELETE FROM ledger_entries_archive"))
+
+
+async def compact_forever() -> None:
+    """Background task: compact the ledger every COMPACT_INTERVAL seconds."""
+    while True:
+        try:
+            moved = COMPACT_BATCH
+            total = 0
+            # one batch per transaction keeps each one's row locks bounded
+            while moved == COMPACT_BATCH:
+                moved = await db.run(compact)
+                total += moved
+            if total:
+                logger.info("compacted ledger", extra={"moved": total})
+        except Exception:
+            logger.exception("ledger compaction failed")
+        await asyncio.sleep(COMPACT_INTERVAL)
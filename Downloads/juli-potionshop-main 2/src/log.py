@@ -0,0 +1,130 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.engine import make_url
+from src import config
+
+# keys whose values are always masked when passed through `extra=`
+SECRET_KEYS = ("api_key", "access_token", "password", "token", "secret")
+REDACTED = "***"
+
+# attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in N records from a call site that passes
+    extra={"sample_every": N}, counting per (logger, message template). Runs
+    in the caller's thread before the record is queued, so dropped records
+    cost a dict update and nothing else.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._seen: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", 1)
+        if every <= 1:
+            return True
+        key = (record.name, str(record.msg))
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % every:
+            return False
+        record.sampled = f"1/{every}"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and any `extra=`
+    fields. Known secret values and secret-looking keys are masked. Runs on
+    the listener thread.
+    """
+
+    def __init__(self, secrets: Iterable[str]) -> None:
+        super().__init__()
+        self.secrets = [secret for secret in secrets if secret]
+
+    def redact(self, text: str) -> str:
+        for secret in self.secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": self.redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key in _RECORD_ATTRS or key == "sample_every":
+                continue
+            if any(secret in key.lower() for secret in SECRET_KEYS):
+                entry[key] = REDACTED
+            else:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+
+        return self.redact(json.dumps(entry, default=str))
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'src.api.barrels=DEBUG,src.api.bottler=WARNING' -> {logger: level}"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def known_secrets(settings: config.Settings) -> List[str]:
+    secrets = [settings.API_KEY or ""]
+    if settings.POSTGRES_URI:
+        secrets.append(make_url(settings.POSTGRES_URI).password or "")
+    return secrets
+
+
+def configure() -> None:
+    """
+    Route the `src` loggers through a QueueHandler. Request threads only
+    enqueue; a QueueListener thread formats and writes to stdout. Safe to call
+    more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    settings = config.get_settings()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter(known_secrets(settings)))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger("src")
+    root.setLevel(settings.LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+    for name, level in parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
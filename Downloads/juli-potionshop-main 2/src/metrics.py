@@ -0,0 +1,288 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+# Updates below take no locks: each is a dict lookup plus a couple of in-place
+# adds under the GIL. A rare lost increment between threads is the price of
+# keeping the per-request cost to a few microseconds.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def new_series(buckets: Tuple[float, ...]) -> List[float]:
+    # [count per bucket..., count above the last bucket, sum]
+    return [0] * (len(buckets) + 2)
+
+
+def add_to_series(series: List[float], buckets: Tuple[float, ...], value: float):
+    series[bisect_left(buckets, value)] += 1
+    series[-1] += value
+
+
+def render_histogram(
+    name: str,
+    help: str,
+    buckets: Tuple[float, ...],
+    series_by_labels: List[Tuple[Labels, List[float]]],
+) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for labels, series in sorted(series_by_labels):
+        cumulative: float = 0.0
+        for bound, count in zip(buckets, series):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} "
+                f"{cumulative:g}"
+            )
+        cumulative += series[-2]
+        lines.append(
+            f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {cumulative:g}"
+        )
+        lines.append(f"{name}_sum{format_labels(labels)} {series[-1]:g}")
+        lines.append(f"{name}_count{format_labels(labels)} {cumulative:g}")
+    return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, new_series(self.buckets))
+        add_to_series(series, self.buckets, value)
+
+    def render(self) -> List[str]:
+        return render_histogram(
+            self.name, self.help, self.buckets, list(self._series.items())
+        )
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {value:g}")
+        return lines
+
+
+class RouteMetrics:
+    """Everything recorded for one (method, route), found with one lookup."""
+
+    __slots__ = ("labels", "duration", "statements", "db_seconds", "statuses")
+
+    def __init__(self, method: str, route: str) -> None:
+        self.labels: Labels = (("method", method), ("route", route))
+        self.duration = new_series(LATENCY_BUCKETS)
+        self.statements = new_series(STATEMENT_BUCKETS)
+        self.db_seconds = new_series(LATENCY_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+
+    def record(self, status: int, elapsed: float, stats: "RequestStats") -> None:
+        add_to_series(self.duration, LATENCY_BUCKETS, elapsed)
+        add_to_series(self.statements, STATEMENT_BUCKETS, stats.statements)
+        add_to_series(self.db_seconds, LATENCY_BUCKETS, stats.db_seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape_label(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+routes: Dict[Tuple[str, str], RouteMetrics] = {}
+statements_total = Counter(
+    "db_statements_total", "SQL statements executed, per engine."
+)
+pool_wait = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of the pool (including pre-ping), per engine.",
+    POOL_WAIT_BUCKETS,
+)
+carts_swept = Counter(
+    "carts_abandoned_swept_total", "Carts the sweeper marked as abandoned."
+)
+plan_lookups = Counter(
+    "plan_cache_lookups_total", "Planning requests, per planner and cache result."
+)
+sweep_batch = Histogram(
+    "cart_sweep_batch_seconds",
+    "Time per abandoned cart sweep batch, including its commit.",
+    LATENCY_BUCKETS,
+)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self) -> None:
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# set by MetricsMiddleware for the duration of a request; the cursor hooks add
+# to whatever stats object is current. Copied into threadpool workers and
+# run_sync greenlets along with the rest of the context.
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+_pools: Dict[str, Pool] = {}
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Count and time every statement run on engine, and report its pool."""
+    labels: Labels = (("engine", name),)
+    _pools[name] = engine.pool
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context._metrics_start = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = perf_counter() - context._metrics_start
+        statements_total.inc(labels)
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+
+def observe_pool_wait(name: str, seconds: float) -> None:
+    pool_wait.observe((("engine", name),), seconds)
+
+
+def render_pool_gauges() -> List[str]:
+    gauges: Dict[str, Tuple[str, List[str]]] = {
+        "db_pool_size": ("Configured pool size.", []),
+        "db_pool_open": ("Connections currently open.", []),
+        "db_pool_checked_out": ("Connections currently checked out.", []),
+    }
+    for name, pool in sorted(_pools.items()):
+        if not isinstance(pool, QueuePool):
+            continue
+        labels = format_labels((("engine", name),))
+        # overflow() counts up from -size, so size + overflow is what's open
+        gauges["db_pool_size"][1].append(f"db_pool_size{labels} {pool.size()}")
+        gauges["db_pool_open"][1].append(
+            f"db_pool_open{labels} {pool.size() + pool.overflow()}"
+        )
+        gauges["db_pool_checked_out"][1].append(
+            f"db_pool_checked_out{labels} {pool.checkedout()}"
+        )
+
+    lines = []
+    for metric, (help, samples) in gauges.items():
+        lines.append(f"# HELP {metric} {help}")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(samples)
+    return lines
+
+
+def render_routes() -> List[str]:
+    by_route = sorted(routes.values(), key=lambda r: r.labels)
+    lines = render_histogram(
+        "http_request_duration_seconds",
+        "Time from request start to the last response byte, per route.",
+        LATENCY_BUCKETS,
+        [(r.labels, r.duration) for r in by_route],
+    )
+    lines += render_histogram(
+        "http_request_db_statements",
+        "SQL statements executed while handling a request, per route.",
+        STATEMENT_BUCKETS,
+        [(r.labels, r.statements) for r in by_route],
+    )
+    lines += render_histogram(
+        "http_request_db_seconds",
+        "Time spent inside SQL statements while handling a request, per route.",
+        LATENCY_BUCKETS,
+        [(r.labels, r.db_seconds) for r in by_route],
+    )
+    lines += [
+        "# HELP http_requests_total Requests handled, per route and status code.",
+        "# TYPE http_requests_total counter",
+    ]
+    for r in by_route:
+        for status, count in sorted(r.statuses.items()):
+            labels = format_labels(r.labels + (("status", str(status)),))
+            lines.append(f"http_requests_total{labels} {count}")
+    return lines
+
+
+def render() -> str:
+    lines = render_routes()
+    lines += statements_total.render()
+    lines += pool_wait.render()
+    lines += carts_swept.render()
+    lines += sweep_batch.render()
+    lines += plan_lookups.render()
+    lines += render_pool_gauges()
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task and queue per request)
+    that times each HTTP request and files it under its route template, e.g.
+    /carts/{cart_id}/checkout, so ids don't explode the label set.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        start = perf_counter()
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            current_request.reset(token)
+
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else "unmatched")
+            route_metrics = routes.get(key)
+            if route_metrics is None:
+                route_metrics = routes.setdefault(key, RouteMetrics(*key))
+            route_metrics.record(status_code, elapsed, stats)
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+import hashlib
+import logging
+import threading
+from sqlalchemy.engine import Connection
+from src import inventory_summary
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# a handful of wholesale catalogs per tick is typical; the bound only guards
+# against a caller varying the catalog on every request
+PLAN_CACHE_SIZE = 256
+
+
+class PlanCache:
+    """
+    Bounded LRU of computed plans. Keys carry the inventory version (and
+    whatever else the plan depends on) the plan was computed at, so a stale entry is never looked up
+    again; it just ages out.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._plans: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key: Hashable, plan: Any) -> None:
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            if len(self._plans) > self.capacity:
+                self._plans.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+
+
+plans = PlanCache(PLAN_CACHE_SIZE)
+
+_tick_lock = threading.Lock()
+current_tick: Optional[Tuple[str, int]] = None
+ticks_seen = 0
+
+
+def record_tick(day: str, hour: int) -> None:
+    """
+    Notes the game time from /info/current_time. A new tick starts the plan
+    cache over, so each tick's plans are computed at least once.
+    """
+    global current_tick, ticks_seen
+    with _tick_lock:
+        if current_tick == (day, hour):
+            return
+        current_tick = (day, hour)
+        ticks_seen += 1
+    plans.clear()
+    logger.debug("tick", extra={"day": day, "hour": hour, "ticks": ticks_seen})
+
+
+def read_version(connection: Connection) -> int:
+    """
+    The inventory state version, moved by every change to gold, liquid or
+    potion inventory. Read it before the state a plan is computed from: a
+    write committing in between then files the plan under a version that is
+    already behind, never ahead.
+    """
+    totals = inventory_summary.read_totals(connection)
+    return totals.version if totals is not None else 0
+
+
+def digest(*parts: Any) -> bytes:
+    """Short fingerprint of plan inputs that aren't in the database."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).digest()
+
+
+def lookup(planner: str, key: Hashable) -> Optional[Any]:
+    plan = plans.get(key)
+    metrics.plan_lookups.inc(
+        (("planner", planner), ("result", "miss" if plan is None else "hit"))
+    )
+    return plan
@@ -0,0 +1,168 @@
+from typing import Any, Dict, List, Sequence
+import asyncio
+import logging
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+# strategy.md calls a cart abandoned once it has sat unchecked-out this long;
+# the aggregator keeps re-counting hours this recent, so a checkout within
+# the window still moves its cart's hour from created to checked out
+CART_WINDOW = "6 hours"
+AGGREGATE_INTERVAL = 60.0
+
+OUT_OF_STOCK = "out_of_stock"
+MISSING_PRICE = "missing_price"
+
+
+def record_sales(
+    connection: Connection,
+    character_class: str,
+    lines: Sequence[Any],
+    prices: Dict[str, int],
+) -> None:
+    """
+    Adds one checkout's lines (potion_sku, quantity) to this hour's
+    sales_hourly rows in one statement. Lines come in sku order, the same
+    order checkout locks potion_inventory in, so concurrent upserts of
+    the same rows can't deadlock.
+    """
+    values = []
+    params: Dict[str, Any] = {"character_class": character_class}
+    for i, line in enumerate(lines):
+        values.append(
+            f"(date_trunc('hour', now()), :character_class, :sku_{i}, "
+            f":potions_{i}, :gold_{i}, 1)"
+        )
+        params[f"sku_{i}"] = line.potion_sku
+        params[f"potions_{i}"] = line.quantity
+        params[f"gold_{i}"] = line.quantity * prices[line.potion_sku]
+
+    connection.execute(
+        sqlalchemy.text(f"""
+            INSERT INTO sales_hourly
+                (hour, character_class, potion_sku, potions, gold, orders)
+            VALUES {", ".join(values)}
+            ON CONFLICT (hour, character_class, potion_sku) DO UPDATE SET
+                potions = sales_hourly.potions + EXCLUDED.potions,
+                gold = sales_hourly.gold + EXCLUDED.gold,
+                orders = sales_hourly.orders + EXCLUDED.orders
+        """),
+        params,
+    )
+
+
+def record_failed_checkout(
+    connection: Connection, cart_id: int, potion_sku: str, reason: str
+) -> None:
+    """Logs the sku that stopped a checkout and counts it for this hour."""
+    params = {"cart_id": cart_id, "potion_sku": potion_sku, "reason": reason}
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO failed_checkouts (cart_id, potion_sku, reason)
+            VALUES (:cart_id, :potion_sku, :reason)
+        """),
+        params,
+    )
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO failed_checkouts_hourly (hour, potion_sku, reason, failures)
+            VALUES (date_trunc('hour', now()), :potion_sku, :reason, 1)
+            ON CONFLICT (hour, potion_sku, reason) DO UPDATE SET
+                failures = failed_checkouts_hourly.failures + 1
+        """),
+        params,
+    )
+
+
+def aggregate_cart_activity(connection: Connection, window: str = CART_WINDOW) -> int:
+    """
+    Recounts carts created and checked out for every hour inside window,
+    replacing those hours' cart_activity_hourly rows. Cart creation stays a
+    single INSERT instead of bumping one shared counter row per hour. Returns
+    the number of rows written.
+    """
+    params = {"window": window}
+    connection.execute(
+        sqlalchemy.text("""
+            DELETE FROM cart_activity_hourly
+            WHERE hour >= date_trunc('hour', now() - CAST(:window AS INTERVAL))
+        """),
+        params,
+    )
+    return connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_activity_hourly
+                (hour, character_class, carts_created, carts_checked_out)
+            SELECT
+                date_trunc('hour', "timestamp"),
+                COALESCE(character_class, ''),
+                COUNT(*),
+                COUNT(checked_out_at)
+            FROM carts
+            WHERE "timestamp" >= date_trunc('hour', now() - CAST(:window AS INTERVAL))
+            GROUP BY date_trunc('hour', "timestamp"), COALESCE(character_class, '')
+        """),
+        params,
+    ).rowcount
+
+
+async def aggregate_forever() -> None:
+    """Background task: refresh recent cart activity every AGGREGATE_INTERVAL."""
+    while True:
+        try:
+            await db.run(aggregate_cart_activity)
+        except Exception:
+            logger.exception("aggregating cart activity failed")
+        await asyncio.sleep(AGGREGATE_INTERVAL)
+
+
+def sales_by_class(connection: Connection, since: str) -> List[Dict[str, Any]]:
+    return [
+        dict(row)
+        for row in connection.execute(
+            sqlalchemy.text("""
+                SELECT character_class, potion_sku,
+                       SUM(potions) AS potions, SUM(gold) AS gold,
+                       SUM(orders) AS orders
+                FROM sales_hourly
+                WHERE hour >= date_trunc('hour', now() - CAST(:since AS INTERVAL))
+                GROUP BY character_class, potion_sku
+                ORDER BY character_class, SUM(potions) DESC, potion_sku
+            """),
+            {"since": since},
+        ).mappings()
+    ]
+
+
+def failed_checkouts_by_sku(connection: Connection, since: str) -> List[Dict[str, Any]]:
+    return [
+        dict(row)
+        for row in connection.execute(
+            sqlalchemy.text("""
+                SELECT potion_sku, reason, SUM(failures) AS failures
+                FROM failed_checkouts_hourly
+                WHERE hour >= date_trunc('hour', now() - CAST(:since AS INTERVAL))
+                GROUP BY potion_sku, reason
+                ORDER BY SUM(failures) DESC, potion_sku, reason
+            """),
+            {"since": since},
+        ).mappings()
+    ]
+
+
+def cart_activity(connection: Connection, since: str) -> List[Dict[str, Any]]:
+    return [
+        dict(row)
+        for row in connection.execute(
+            sqlalchemy.text("""
+                SELECT hour, character_class, carts_created, carts_checked_out
+                FROM cart_activity_hourly
+                WHERE hour >= date_trunc('hour', now() - CAST(:since AS INTERVAL))
+                ORDER BY hour, character_class
+            """),
+            {"since": since},
+        ).mappings()
+    ]
@@ -0,0 +1,374 @@
+"""
+The shop's schema at the current alembic head, as SQLAlchemy Core tables.
+
+Postgres is still built and migrated by alembic; this copy is what the SQLite
+backend (SQLITE_PATH) creates from, and test_schema checks it against a live
+Postgres so the two can't drift apart silently. When a migration changes a
+table, change it here too.
+"""
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+metadata = sa.MetaData()
+
+now = sa.func.now()
+
+carts = sa.Table(
+    "carts",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("customer_name", sa.Text),
+    sa.Column("checked_out", sa.Boolean, server_default=sa.false()),
+    sa.Column("timestamp", sa.DateTime, server_default=now),
+    sa.Column("character_class", sa.Text),
+    sa.Column("checked_out_at", sa.DateTime),
+    sa.Column("abandoned_at", sa.DateTime),
+    sa.Index("ix_carts_customer_name_id", "customer_name", "id"),
+    sa.Index("ix_carts_timestamp_id", "timestamp", "id"),
+    sa.Index(
+        "ix_carts_open_timestamp",
+        "timestamp",
+        postgresql_where=sa.text("checked_out = FALSE AND abandoned_at IS NULL"),
+        sqlite_where=sa.text("checked_out = FALSE AND abandoned_at IS NULL"),
+    ),
+)
+
+cart_items = sa.Table(
+    "cart_items",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("cart_id", sa.Integer, nullable=False),
+    sa.Column("potion_sku", sa.Text, nullable=False),
+    sa.Column("quantity", sa.Integer, nullable=False),
+    sa.Column("created_at", sa.DateTime, server_default=now),
+    sa.UniqueConstraint("cart_id", "potion_sku", name="cart_items_cartid_sku_unique"),
+    sa.Index("ix_cart_items_cart_id_id", "cart_id", "id"),
+    sa.Index("ix_cart_items_potion_sku_id", "potion_sku", "id"),
+)
+
+potion_catalog = sa.Table(
+    "potion_catalog",
+    metadata,
+    sa.Column("sku", sa.String, primary_key=True),
+    sa.Column("name", sa.String),
+    sa.Column("r", sa.Integer),
+    sa.Column("g", sa.Integer),
+    sa.Column("b", sa.Integer),
+    sa.Column("d", sa.Integer),
+    sa.Column("price", sa.Integer),
+    sa.Column("active", sa.Boolean),
+)
+
+potions = sa.Table(
+    "potions",
+    metadata,
+    sa.Column("sku", sa.String, primary_key=True),
+    sa.Column("name", sa.String, nullable=False),
+    sa.Column("price", sa.Integer, nullable=False),
+    sa.Column("quantity", sa.Integer, nullable=False),
+    sa.Column("active", sa.Boolean, server_default=sa.true()),
+    sa.Column("r", sa.Integer),
+    sa.Column("g", sa.Integer),
+    sa.Column("b", sa.Integer),
+    sa.Column("d", sa.Integer),
+)
+
+potion_inventory = sa.Table(
+    "potion_inventory",
+    metadata,
+    sa.Column("sku", sa.Text, primary_key=True),
+    sa.Column("quantity", sa.Integer, nullable=False, server_default="0"),
+)
+
+liquid_inventory = sa.Table(
+    "liquid_inventory",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("red_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("green_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("blue_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("dark_ml", sa.Integer, nullable=False, server_default="0"),
+)
+
+gold_inventory = sa.Table(
+    "gold_inventory",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("amount", sa.Integer, nullable=False, server_default="0"),
+)
+
+capacity_inventory = sa.Table(
+    "capacity_inventory",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("ml_capacity", sa.Integer, nullable=False, server_default="1"),
+    sa.Column("potion_capacity", sa.Integer, nullable=False, server_default="1"),
+)
+
+global_inventory = sa.Table(
+    "global_inventory",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("gold", sa.Integer),
+    sa.Column("red_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("green_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("blue_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("dark_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("red_potions", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("green_potions", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("blue_potions", sa.Integer, nullable=False, server_default="0"),
+)
+
+audit_log = sa.Table(
+    "audit_log",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("cart_id", sa.Integer, sa.ForeignKey("carts.id")),
+    sa.Column("potion_sku", sa.Text, sa.ForeignKey("potions.sku")),
+    sa.Column("quantity", sa.Integer),
+    sa.Column("timestamp", sa.DateTime),
+    sa.Column("alembic_version", sa.String),
+)
+
+catalog_version = sa.Table(
+    "catalog_version",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("version", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+ledger_columns = [
+    ("type", sa.String),
+    ("sku", sa.String),
+    ("quantity", sa.Integer),
+    ("order_id", sa.Text),
+    ("source", sa.String),
+    ("category", sa.String),
+    ("sub_type", sa.String),
+]
+
+ledger_entries = sa.Table(
+    "ledger_entries",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    *(sa.Column(name, type_) for name, type_ in ledger_columns),
+    sa.Column("created_at", sa.DateTime, server_default=now),
+    sa.Column("timestamp", sa.DateTime, nullable=False, server_default=now),
+    sa.Column("amount", sa.Integer),
+)
+
+# same columns in the same order, so compaction can INSERT ... SELECT *
+ledger_entries_archive = sa.Table(
+    "ledger_entries_archive",
+    metadata,
+    sa.Column("id", sa.Integer, nullable=False),
+    *(sa.Column(name, type_) for name, type_ in ledger_columns),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("timestamp", sa.DateTime, nullable=False),
+    sa.Column("amount", sa.Integer),
+    sa.Index("ix_ledger_entries_archive_id", "id", unique=True),
+)
+
+ledger_checkpoints = sa.Table(
+    "ledger_checkpoints",
+    metadata,
+    sa.Column("category", sa.Text, primary_key=True),
+    sa.Column("sub_type", sa.Text, primary_key=True, server_default=""),
+    sa.Column("quantity", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("entries", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("last_ledger_id", sa.Integer, nullable=False, server_default="0"),
+    sa.Column(
+        "compacted_at", sa.DateTime(timezone=True), nullable=False, server_default=now
+    ),
+)
+
+liquid_balance_snapshot = sa.Table(
+    "liquid_balance_snapshot",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("red_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("green_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("blue_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("dark_ml", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("last_ledger_id", sa.Integer, nullable=False, server_default="0"),
+)
+
+processed_requests = sa.Table(
+    "processed_requests",
+    metadata,
+    sa.Column("order_id", sa.Text, primary_key=True),
+    sa.Column("response", sa.JSON().with_variant(postgresql.JSONB(), "postgresql")),
+    sa.Column(
+        "created_at", sa.DateTime(timezone=True), nullable=False, server_default=now
+    ),
+    sa.Index("ix_processed_requests_created_at", "created_at"),
+)
+
+inventory_summary = sa.Table(
+    "inventory_summary",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("total_ml", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("total_potions", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("gold", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("version", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+inventory_summary_deltas = sa.Table(
+    "inventory_summary_deltas",
+    metadata,
+    sa.Column(
+        "id", sa.BigInteger().with_variant(sa.Integer, "sqlite"), primary_key=True
+    ),
+    sa.Column("total_ml", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("total_potions", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("gold", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+customer_visits = sa.Table(
+    "customer_visits",
+    metadata,
+    sa.Column("visit_id", sa.BigInteger, primary_key=True),
+    sa.Column("position", sa.Integer, primary_key=True),
+    sa.Column("customer_id", sa.Text, nullable=False),
+    sa.Column("customer_name", sa.Text, nullable=False),
+    sa.Column("character_class", sa.Text, nullable=False),
+    sa.Column("level", sa.Integer, nullable=False),
+    sa.Column("visited_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Index("ix_customer_visits_class_visited_at", "character_class", "visited_at"),
+)
+
+failed_checkouts = sa.Table(
+    "failed_checkouts",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("cart_id", sa.Integer),
+    sa.Column("potion_sku", sa.Text, nullable=False),
+    sa.Column("reason", sa.Text, nullable=False),
+    sa.Column("timestamp", sa.DateTime, nullable=False, server_default=now),
+)
+
+sales_hourly = sa.Table(
+    "sales_hourly",
+    metadata,
+    sa.Column("hour", sa.DateTime, primary_key=True),
+    sa.Column("character_class", sa.Text, primary_key=True),
+    sa.Column("potion_sku", sa.Text, primary_key=True),
+    sa.Column("potions", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("gold", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("orders", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+failed_checkouts_hourly = sa.Table(
+    "failed_checkouts_hourly",
+    metadata,
+    sa.Column("hour", sa.DateTime, primary_key=True),
+    sa.Column("potion_sku", sa.Text, primary_key=True),
+    sa.Column("reason", sa.Text, primary_key=True),
+    sa.Column("failures", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+cart_activity_hourly = sa.Table(
+    "cart_activity_hourly",
+    metadata,
+    sa.Column("hour", sa.DateTime, primary_key=True),
+    sa.Column("character_class", sa.Text, primary_key=True),
+    sa.Column("carts_created", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("carts_checked_out", sa.BigInteger, nullable=False, server_default="0"),
+)
+
+# single-row tables every endpoint expects to find, in their starting state
+SEED_ROWS = {
+    catalog_version: {"id": 1, "version": 0},
+    gold_inventory: {"id": 1, "amount": 100},
+    liquid_inventory: {"id": 1},
+    liquid_balance_snapshot: {"id": 1},
+    capacity_inventory: {"id": 1},
+}
+
+
+def seed(table: sa.Table, connection, **kw) -> None:
+    connection.execute(table.insert().values(**SEED_ROWS[table]))
+
+
+# only when the table is created, so a reused SQLite file keeps its state
+for table in SEED_ROWS:
+    event.listen(table, "after_create", seed)
+
+
+# catalog_version moves whenever a recipe changes, or a potions row appears,
+# disappears or is (de)activated. SQLite triggers are per row and per event,
+# so the one Postgres trigger function becomes six small triggers.
+SQLITE_CATALOG_TRIGGERS = [
+    ("potion_catalog", "INSERT"),
+    ("potion_catalog", "UPDATE"),
+    ("potion_catalog", "DELETE"),
+    ("potions", "INSERT"),
+    ("potions", "UPDATE OF active"),
+    ("potions", "DELETE"),
+]
+
+for table_name, trigger_event in SQLITE_CATALOG_TRIGGERS:
+    event.listen(
+        metadata.tables[table_name],
+        "after_create",
+        sa.DDL(f"""
+            CREATE TRIGGER {table_name}_version_{trigger_event.split()[0].lower()}
+            AFTER {trigger_event} ON {table_name}
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        """).execute_if(dialect="sqlite"),
+    )
+
+
+# every change to liquid, potion or gold inventory appends a row to
+# inventory_summary_deltas, folded into inventory_summary by
+# src.inventory_summary. The summary row is seeded from those tables and
+# its triggers are created once every table exists, so the seed rows above are
+# counted and no trigger fires into a table that isn't there yet. Both
+# statements are no-ops on a reused file.
+SUMMARIZED = {
+    "liquid_inventory": (
+        "total_ml",
+        "{row}.red_ml + {row}.green_ml + {row}.blue_ml + {row}.dark_ml",
+    ),
+    "potion_inventory": ("total_potions", "{row}.quantity"),
+    "gold_inventory": ("gold", "{row}.amount"),
+}
+
+SEED_INVENTORY_SUMMARY = sa.DDL("""
+    INSERT INTO inventory_summary (id, total_ml, total_potions, gold)
+    SELECT
+        1,
+        (SELECT COALESCE(SUM(red_ml + green_ml + blue_ml + dark_ml), 0)
+         FROM liquid_inventory),
+        (SELECT COALESCE(SUM(quantity), 0) FROM potion_inventory),
+        (SELECT COALESCE(SUM(amount), 0) FROM gold_inventory)
+    WHERE NOT EXISTS (SELECT 1 FROM inventory_summary)
+""").execute_if(dialect="sqlite")
+
+event.listen(metadata, "after_create", SEED_INVENTORY_SUMMARY)
+
+for table_name, (column, value) in SUMMARIZED.items():
+    new, old = value.format(row="NEW"), value.format(row="OLD")
+    for trigger_event, change in (
+        ("INSERT", f"+ ({new})"),
+        ("UPDATE", f"+ ({new}) - ({old})"),
+        ("DELETE", f"- ({old})"),
+    ):
+        event.listen(
+            metadata,
+            "after_create",
+            sa.DDL(f"""
+                CREATE TRIGGER IF NOT EXISTS
+                    {table_name}_summary_{trigger_event.lower()}
+                AFTER {trigger_event} ON {table_name}
+                BEGIN
+                    INSERT INTO inventory_summary_deltas ({column})
+                    VALUES (0 {change});
+                END
+            """).execute_if(dialect="sqlite"),
+        )
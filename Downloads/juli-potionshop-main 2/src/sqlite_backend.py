@@ -0,0 +1,127 @@
+"""
+SQLite backend for running the shop, its tests and benchmarks without
+Postgres. The schema comes from src.schema; the handful of Postgres-only
+constructs the queries use are rewritten or provided as functions:
+
+    ILIKE                          LIKE (case-insensitive for ASCII in SQLite)
+    ... FOR UPDATE [SKIP LOCKED]   dropped; transactions are serialized instead
+    CAST(:x AS JSONB)              :x, stored as text
+    now() - CAST(:x AS INTERVAL)   now_minus(:x), e.g. '7 days', '1 hour'
+    now(), GREATEST(...),          Python functions
+    date_trunc('hour', ...)
+
+ON CONFLICT, RETURNING, FULL JOIN and expanding IN parameters work natively
+(SQLite >= 3.39). Statements SQLite can't express at all, such as
+data-modifying CTEs, need a dialect branch where they are used.
+"""
+
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from src import schema
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+REWRITES = [
+    (re.compile(r"\bILIKE\b"), "LIKE"),
+    (re.compile(r"\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b"), ""),
+    (re.compile(r"CAST\(\s*(\?|:\w+)\s+AS\s+JSONB\s*\)"), r"\1"),
+    (
+        re.compile(r"now\(\)\s*-\s*CAST\(\s*(\?|:\w+)\s+AS\s+INTERVAL\s*\)"),
+        r"now_minus(\1)",
+    ),
+]
+
+INTERVAL_UNITS = {
+    "second": "seconds",
+    "minute": "minutes",
+    "hour": "hours",
+    "day": "days",
+    "week": "weeks",
+}
+
+# the default datetime adapter is deprecated; store the same text now() makes
+sqlite3.register_adapter(datetime, lambda value: value.strftime(TIMESTAMP_FORMAT))
+
+
+@lru_cache(maxsize=1024)
+def translate(statement: str) -> str:
+    for pattern, replacement in REWRITES:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def now() -> str:
+    return utc_now().strftime(TIMESTAMP_FORMAT)
+
+
+def now_minus(interval: str) -> str:
+    """now() minus a Postgres-style interval such as '7 days' or '1 hour'."""
+    amount, unit = interval.split()
+    unit = INTERVAL_UNITS[unit.lower().rstrip("s")]
+    return (utc_now() - timedelta(**{unit: float(amount)})).strftime(TIMESTAMP_FORMAT)
+
+
+def date_trunc(unit: str, value: str) -> str:
+    """date_trunc for 'hour' and 'day' on the text timestamps stored here."""
+    moment = datetime.fromisoformat(value)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        moment = moment.replace(hour=0)
+    elif unit != "hour":
+        raise ValueError(f"unsupported date_trunc unit: {unit}")
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def greatest(*values):
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+def make_engine(path: str) -> Engine:
+    """
+    Engine on a SQLite file, or on one shared in-memory database for
+    ':memory:', with the schema created if it isn't there yet.
+    """
+    if path == ":memory:":
+        # every checkout must see the same in-memory database
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(
+            f"sqlite:///{path}", connect_args={"check_same_thread": False}
+        )
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # let SQLAlchemy's begin event below own transactions, so a SELECT
+        # is inside the transaction too
+        dbapi_connection.isolation_level = None
+        dbapi_connection.create_function("now", 0, now)
+        dbapi_connection.create_function("now_minus", 1, now_minus)
+        dbapi_connection.create_function("greatest", -1, greatest)
+        dbapi_connection.create_function("date_trunc", 2, date_trunc)
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        # straight to the driver so it isn't counted as one of the request's
+        # statements, matching Postgres where BEGIN is implicit
+        connection.connection.dbapi_connection.execute("BEGIN")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def rewrite(conn, cursor, statement, parameters, context, executemany):
+        return translate(statement), parameters
+
+    schema.metadata.create_all(engine)
+    return engine
@@ -0,0 +1,227 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+import asyncio
+import logging
+import threading
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.5
+# visits held in memory before /carts/visits starts answering 503; the game
+# retries, and a replayed visit_id is ignored once its first copy is stored
+MAX_PENDING = 100_000
+# rows per multi-row INSERT, well under Postgres's 65535 bind parameters
+INSERT_CHUNK = 1000
+# flushes at least this big are COPYed into a staging table on the blocking
+# psycopg engine, then moved across with the same ON CONFLICT as the INSERT
+COPY_THRESHOLD = 2000
+# customer_visits.visit_id is a BIGINT
+MAX_VISIT_ID = 2**63 - 1
+# a batch failing with one of these fails the same way every time, so it is
+# logged and dropped rather than retried; SQLite's driver raises a bare
+# OverflowError for an integer it can't bind
+REJECTED = (sqlalchemy.exc.DataError, sqlalchemy.exc.IntegrityError, OverflowError)
+
+COLUMNS = (
+    "visit_id",
+    "position",
+    "customer_id",
+    "customer_name",
+    "character_class",
+    "level",
+    "visited_at",
+)
+
+
+@dataclass
+class Visit:
+    visit_id: int
+    position: int
+    customer_id: str
+    customer_name: str
+    character_class: str
+    level: int
+    visited_at: datetime
+
+    def row(self) -> Tuple[Any, ...]:
+        return (
+            self.visit_id,
+            self.position,
+            self.customer_id,
+            self.customer_name,
+            self.character_class,
+            self.level,
+            self.visited_at,
+        )
+
+
+class VisitQueue:
+    """Visits accepted by the endpoint and not yet written."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._visits: List[Visit] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._visits)
+
+    def put(self, visits: List[Visit]) -> bool:
+        """Queues the whole batch, or none of it if that would overflow."""
+        with self._lock:
+            if len(self._visits) + len(visits) > self.capacity:
+                return False
+            self._visits.extend(visits)
+            return True
+
+    def take(self) -> List[Visit]:
+        with self._lock:
+            visits, self._visits = self._visits, []
+        return visits
+
+    def put_back(self, visits: List[Visit]) -> None:
+        # ahead of anything queued since, and past capacity if need be: these
+        # were already accepted
+        with self._lock:
+            self._visits[:0] = visits
+
+
+pending = VisitQueue(MAX_PENDING)
+
+
+def enqueue(visit_id: int, customers: List[Any]) -> bool:
+    """
+    Queues one visit batch for the flusher; customers are Customer models.
+    Returns False when the queue is full.
+    """
+    visited_at = datetime.now(timezone.utc)
+    return pending.put(
+        [
+            Visit(
+                visit_id,
+                position,
+                customer.customer_id,
+                customer.customer_name,
+                customer.character_class,
+                customer.level,
+                visited_at,
+            )
+            for position, customer in enumerate(customers)
+        ]
+    )
+
+
+def insert_visits(connection: Connection, visits: List[Visit]) -> None:
+    """Multi-row INSERTs of INSERT_CHUNK visits, skipping stored ones."""
+    for start in range(0, len(visits), INSERT_CHUNK):
+        values = []
+        params: Dict[str, Any] = {}
+        for i, visit in enumerate(visits[start : start + INSERT_CHUNK]):
+            values.append("(" + ", ".join(f":{c}_{i}" for c in COLUMNS) + ")")
+            params.update({f"{c}_{i}": value for c, value in zip(COLUMNS, visit.row())})
+
+        connection.execute(
+            sqlalchemy.text(f"""
+                INSERT INTO customer_visits ({", ".join(COLUMNS)})
+                VALUES {", ".join(values)}
+                ON CONFLICT (visit_id, position) DO NOTHING
+            """),
+            params,
+        )
+
+
+def copy_visits(connection: Connection, visits: List[Visit]) -> None:
+    """COPY into a transaction-scoped staging table, then insert from it."""
+    connection.execute(
+        sqlalchemy.text("""
+            CREATE TEMP TABLE customer_visits_staging
+            (LIKE customer_visits) ON COMMIT DROP
+        """)
+    )
+    statement = f"COPY customer_visits_staging ({', '.join(COLUMNS)}) FROM STDIN"
+    dbapi = connection.dialect.loaded_dbapi
+    cursor = connection.connection.cursor()
+    try:
+        with cursor.copy(statement) as copy:
+            for visit in visits:
+                copy.write_row(visit.row())
+    except dbapi.Error as error:
+        # the raw cursor bypasses SQLAlchemy, so wrap the driver's error the
+        # way an execute() would have (psycopg DataError -> exc.DataError)
+        raise sqlalchemy.exc.DBAPIError.instance(
+            statement, None, error, dbapi.Error
+        ) from error
+    finally:
+        cursor.close()
+
+    connection.execute(
+        sqlalchemy.text("""
+            INSERT INTO customer_visits
+            SELECT * FROM customer_visits_staging
+            ON CONFLICT (visit_id, position) DO NOTHING
+        """)
+    )
+
+
+def write_visits(connection: Connection, visits: List[Visit]) -> None:
+    if (
+        len(visits) >= COPY_THRESHOLD
+        and connection.dialect.driver == "psycopg"
+        and not connection.dialect.is_async
+    ):
+        copy_visits(connection, visits)
+    else:
+        insert_visits(connection, visits)
+
+
+async def flush() -> int:
+    """
+    Writes every queued visit, one transaction per visit_id, and returns how
+    many were written. A batch the database rejects is logged and dropped so
+    it can't hold up the ones behind it; any other error (a lost connection,
+    cancellation) puts the unwritten batches back and re-raises.
+    """
+    batches: Dict[int, List[Visit]] = {}
+    for visit in pending.take():
+        batches.setdefault(visit.visit_id, []).append(visit)
+
+    remaining = list(batches.values())
+    written = 0
+    try:
+        while remaining:
+            batch = remaining[0]
+            try:
+                await db.run(write_visits, batch)
+                written += len(batch)
+            except REJECTED:
+                logger.exception(
+                    "dropping rejected visit batch",
+                    extra={"visit_id": batch[0].visit_id, "visits": len(batch)},
+                )
+            remaining.pop(0)
+    except BaseException:
+        pending.put_back([visit for batch in remaining for visit in batch])
+        raise
+    return written
+
+
+async def flush_forever() -> None:
+    """Background task: write queued visits every FLUSH_INTERVAL seconds."""
+    try:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                written = await flush()
+                if written:
+                    logger.debug(
+                        "flushed visits", extra={"visits": written, "sample_every": 20}
+                    )
+            except Exception:
+                logger.exception("flushing visits failed")
+    finally:
+        # what is still queued at shutdown
+        await flush()
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import pytest
+import sqlalchemy
+from src import abandoned_carts
+from src import database as db
+from src import metrics
+from src.api.carts import checkout_cart
+from src.catalog_registry import registry as catalog_registry
+from test.api.test_endpoints import db_is_available
+
+SKU = "SWEEP_POTION"
+
+
+def add_cart(conn, age: str, checked_out: bool = False) -> int:
+    return conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO carts (customer_name, checked_out, "timestamp")
+            VALUES ('sweep', :checked_out, now() - CAST(:age AS INTERVAL))
+            RETURNING id
+        """),
+        {"checked_out": checked_out, "age": age},
+    ).scalar_one()
+
+
+def add_item(conn, cart_id: int) -> None:
+    conn.execute(
+        sqlalchemy.text("""
+            INSERT INTO cart_items (cart_id, potion_sku, quantity)
+            VALUES (:cart_id, :sku, 1)
+        """),
+        {"cart_id": cart_id, "sku": SKU},
+    )
+
+
+def abandoned(cart_ids) -> set:
+    with db.engine.connect() as conn:
+        return set(
+            conn.execute(
+                sqlalchemy.text("""
+                    SELECT id FROM carts
+                    WHERE id IN :ids AND abandoned_at IS NOT NULL
+                """).bindparams(sqlalchemy.bindparam("ids", expanding=True)),
+                {"ids": list(cart_ids)},
+            ).scalars()
+        )
+
+
+@pytest.fixture
+def no_open_old_carts():
+    # carts left open by other tests would be swept along with ours
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                UPDATE carts SET abandoned_at = now()
+                WHERE checked_out = FALSE AND abandoned_at IS NULL
+            """)
+        )
+    yield
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                DELETE FROM cart_items WHERE cart_id IN (
+                    SELECT id FROM carts WHERE customer_name = 'sweep'
+                )
+            """)
+        )
+        conn.execute(sqlalchemy.text("DELETE FROM carts WHERE customer_name = 'sweep'"))
+
+
+@pytest.fixture
+def sweep_potion():
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_catalog (sku, name, price, r, g, b, d, active)
+                VALUES (:sku, 'Sweep Potion', 10, 0, 100, 0, 0, TRUE)
+            """),
+            {"sku": SKU},
+        )
+        conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO potion_inventory (sku, quantity) VALUES (:sku, 10)"
+            ),
+            {"sku": SKU},
+        )
+    catalog_registry.invalidate()
+    yield
+    with db.engine.begin() as conn:
+        for table, column in (("potion_inventory", "sku"), ("potion_catalog", "sku")):
+            conn.execute(
+                sqlalchemy.text(f"DELETE FROM {table} WHERE {column} = :sku"),
+                {"sku": SKU},
+            )
+    catalog_registry.invalidate()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_sweep_marks_only_old_open_carts(no_open_old_carts, monkeypatch) -> None:
+    monkeypatch.setattr(abandoned_carts, "SWEEP_BATCH", 2)
+    with db.engine.begin() as conn:
+        old = {add_cart(conn, "7 hours") for _ in range(3)}
+        kept = {add_cart(conn, "7 hours", checked_out=True), add_cart(conn, "1 hour")}
+
+    swept_before = metrics.carts_swept._values.get((), 0)
+
+    async def sweep_all() -> list:
+        batches = [await abandoned_carts.sweep_batch()]
+        while batches[-1] == abandoned_carts.SWEEP_BATCH:
+            batches.append(await abandoned_carts.sweep_batch())
+        return batches
+
+    assert asyncio.run(sweep_all()) == [2, 1]
+    assert abandoned(old | kept) == old
+    assert metrics.carts_swept._values[()] - swept_before == 3
+    assert "cart_sweep_batch_seconds_count" in metrics.render()
+
+    # swept carts left the index, so nothing is found twice
+    assert asyncio.run(abandoned_carts.sweep_batch()) == 0
+
+
+@pytest.mark.skipif(
+    not db_is_available() or db.engine.dialect.name != "postgresql",
+    reason="Postgres not available",
+)
+def test_sweep_skips_carts_a_checkout_holds(
+    no_open_old_carts, sweep_potion, monkeypatch
+) -> None:
+    with db.engine.begin() as conn:
+        held, free = add_cart(conn, "7 hours"), add_cart(conn, "7 hours")
+        add_item(conn, held)
+
+    # checkout_cart reads the catalog right after taking its row locks and
+    # before it updates the cart; hold it there while the sweep runs
+    locked, resume = threading.Event(), threading.Event()
+    get = catalog_registry.get
+
+    def paused_get(connection):
+        locked.set()
+        resume.wait(5)
+        return get(connection)
+
+    monkeypatch.setattr(catalog_registry, "get", paused_get)
+
+    def run_checkout() -> None:
+        with db.engine.connect() as checkout:
+            checkout_cart(checkout, held)
+            checkout.rollback()
+
+    thread = threading.Thread(target=run_checkout)
+    thread.start()
+    try:
+        assert locked.wait(5)
+        with db.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("SET LOCAL lock_timeout = '1s'"))
+            assert abandoned_carts.sweep(conn) == 1
+    finally:
+        resume.set()
+        thread.join()
+
+    assert abandoned({held, free}) == {free}
+
+    with db.engine.begin() as conn:
+        conn.execute(sqlalchemy.text("SET LOCAL enable_seqscan = off"))
+        plan = conn.execute(
+            sqlalchemy.text("""
+                EXPLAIN SELECT id FROM carts
+                WHERE checked_out = FALSE AND abandoned_at IS NULL
+                  AND "timestamp" < now() - CAST('6 hours' AS INTERVAL)
+                ORDER BY "timestamp"
+                LIMIT 500
+            """)
+        ).scalars()
+        assert "ix_carts_open_timestamp" in "\n".join(plan)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_checkout_completes_a_swept_cart(no_open_old_carts, sweep_potion) -> None:
+    with db.engine.begin() as conn:
+        cart_id = add_cart(conn, "7 hours")
+        add_item(conn, cart_id)
+        assert abandoned_carts.sweep(conn) == 1
+
+    with db.engine.connect() as checkout:
+        checkout_cart(checkout, cart_id)
+        cart = checkout.execute(
+            sqlalchemy.text(
+                "SELECT checked_out, abandoned_at FROM carts WHERE id = :id"
+            ),
+            {"id": cart_id},
+        ).one()
+        checkout.rollback()
+
+    assert cart.checked_out
+    assert cart.abandoned_at is None
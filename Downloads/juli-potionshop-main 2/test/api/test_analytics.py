@@ -0,0 +1,102 @@
+import uuid
+import pytest
+import sqlalchemy
+from src import database as db
+from src import rollups
+from src.catalog_registry import registry as catalog_registry
+from test.api.test_endpoints import HEADERS, client, db_is_available
+
+SKU = "ANALYTICS_POTION"
+# classes unique to this run, so carts from earlier runs aren't counted
+WIZARD = f"Wizard_{uuid.uuid4().hex[:8]}"
+ROGUE = f"Rogue_{WIZARD[7:]}"
+ROLLUP_TABLES = (
+    "sales_hourly",
+    "failed_checkouts",
+    "failed_checkouts_hourly",
+    "cart_activity_hourly",
+)
+
+
+def open_cart(character_class: str, quantity: int) -> int:
+    cart_id = client.post(
+        "/carts/",
+        headers=HEADERS,
+        json={
+            "customer_id": "1",
+            "customer_name": "analytics",
+            "character_class": character_class,
+            "level": 3,
+        },
+    ).json()["cart_id"]
+    client.post(
+        f"/carts/{cart_id}/items/{SKU}", headers=HEADERS, json={"quantity": quantity}
+    )
+    return cart_id
+
+
+def check_out(cart_id: int) -> int:
+    return client.post(
+        f"/carts/{cart_id}/checkout", headers=HEADERS, json={"payment": "gold"}
+    ).status_code
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_checkouts_feed_the_hourly_rollups() -> None:
+    with db.engine.begin() as conn:
+        for table in ROLLUP_TABLES:
+            conn.execute(sqlalchemy.text(f"DELETE FROM {table}"))
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_catalog (sku, name, price, r, g, b, d, active)
+            VALUES (:sku, 'Analytics Potion', 7, 0, 0, 100, 0, TRUE)
+            ON CONFLICT (sku) DO UPDATE SET price = 7
+        """),
+            {"sku": SKU},
+        )
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_inventory (sku, quantity) VALUES (:sku, 3)
+            ON CONFLICT (sku) DO UPDATE SET quantity = 3
+        """),
+            {"sku": SKU},
+        )
+    catalog_registry.invalidate()
+
+    first, second, third = (
+        open_cart(WIZARD, 2),
+        open_cart(WIZARD, 2),
+        open_cart(ROGUE, 1),
+    )
+    open_cart(ROGUE, 1)  # never checked out
+
+    assert check_out(first) == 200
+    assert check_out(second) == 400
+    assert check_out(third) == 200
+
+    with db.engine.begin() as conn:
+        rollups.aggregate_cart_activity(conn)
+
+    sales = client.get("/analytics/sales", headers=HEADERS).json()
+    assert [(s["character_class"], s["potions"], s["gold"]) for s in sales] == [
+        (ROGUE, 1, 7),
+        (WIZARD, 2, 14),
+    ]
+
+    failed = client.get("/analytics/failed-checkouts", headers=HEADERS).json()
+    assert failed == [
+        {"potion_sku": SKU, "reason": rollups.OUT_OF_STOCK, "failures": 1}
+    ]
+
+    activity = client.get("/analytics/carts", headers=HEADERS).json()
+    by_class = {
+        row["character_class"]: (row["carts_created"], row["carts_checked_out"])
+        for row in activity
+        if row["character_class"] in (WIZARD, ROGUE)
+    }
+    assert by_class == {ROGUE: (2, 1), WIZARD: (2, 1)}
+
+    # re-aggregating replaces the recent hours rather than adding to them
+    with db.engine.begin() as conn:
+        rollups.aggregate_cart_activity(conn)
+    assert client.get("/analytics/carts", headers=HEADERS).json() == activity
@@ -1,10 +1,20 @@
+from fastapi.testclient import TestClient
 from src.api.barrels import (
+    RATIOS_CHECKED_IN_BULK,
+    barrel_list,
     calculate_barrel_summary,
     create_barrel_plan,
+    create_optimal_barrel_plan,
+    ratios_sum_to_one,
     Barrel,
     BarrelOrder,
 )
+from src.api.server import app
 from typing import List
+import json
+
+client = TestClient(app)
+HEADERS = {"access_token": "brat"}
 
 
 def test_barrel_delivery() -> None:
@@ -124,3 +134,111 @@ def test_cant_afford_barrel_plan() -> None:
     assert isinstance(barrel_orders, list)
     assert all(isinstance(order, BarrelOrder) for order in barrel_orders)
     assert len(barrel_orders) == 0  # Ensure at least one order is generated
+
+
+def test_optimal_plan_mixes_barrels_within_limits() -> None:
+    wholesale_catalog: List[Barrel] = [
+        Barrel(
+            sku="SMALL_RED_BARREL",
+            ml_per_barrel=500,
+            potion_type=[1.0, 0, 0, 0],
+            price=100,
+            quantity=10,
+        ),
+        Barrel(
+            sku="SMALL_GREEN_BARREL",
+            ml_per_barrel=500,
+            potion_type=[0, 1.0, 0, 0],
+            price=100,
+            quantity=10,
+        ),
+        Barrel(
+            sku="LARGE_RED_BARREL",
+            ml_per_barrel=10000,
+            potion_type=[1.0, 0, 0, 0],
+            price=400,
+            quantity=1,
+        ),
+    ]
+
+    barrel_orders = create_optimal_barrel_plan(
+        gold=400,
+        max_barrel_capacity=4000,
+        current_red_ml=0,
+        current_green_ml=0,
+        current_blue_ml=1000,
+        current_dark_ml=1000,
+        wholesale_catalog=wholesale_catalog,
+    )
+
+    # the large barrel would overflow capacity; red and green each need 1000
+    assert sorted((o.sku, o.quantity) for o in barrel_orders) == [
+        ("SMALL_GREEN_BARREL", 2),
+        ("SMALL_RED_BARREL", 2),
+    ]
+
+
+def test_optimal_plan_buys_nothing_when_colors_are_at_target() -> None:
+    wholesale_catalog: List[Barrel] = [
+        Barrel(
+            sku="SMALL_RED_BARREL",
+            ml_per_barrel=500,
+            potion_type=[1.0, 0, 0, 0],
+            price=100,
+            quantity=10,
+        ),
+    ]
+
+    assert (
+        create_optimal_barrel_plan(
+            1000, 4000, 1000, 1000, 1000, 1000, wholesale_catalog
+        )
+        == []
+    )
+
+
+def test_bulk_ratio_check_matches_validator() -> None:
+    catalog = [
+        {"sku": "RED", "ml_per_barrel": 500, "potion_type": [1, 0, 0, 0]},
+        {"sku": "MIX", "ml_per_barrel": 500, "potion_type": [0.1, 0.2, 0.3, 0.4]},
+        {"sku": "BAD", "ml_per_barrel": 500, "potion_type": [0.5, 0.4, 0, 0]},
+    ]
+    for barrel in catalog:
+        barrel.update(price=10, quantity=1)
+    body = json.dumps(catalog).encode()
+
+    barrels = barrel_list.validate_json(body, context={RATIOS_CHECKED_IN_BULK: True})
+
+    assert [b.sku for b in barrels] == ["RED", "MIX", "BAD"]
+    assert ratios_sum_to_one(barrels[:2])
+    assert not ratios_sum_to_one(barrels)
+    assert ratios_sum_to_one([])
+
+
+def test_bulk_parse_keeps_validation_errors() -> None:
+    good = {"sku": "RED", "ml_per_barrel": 500, "potion_type": [1, 0, 0, 0]}
+    good.update(price=10, quantity=1)
+    bad_sum = {**good, "potion_type": [0.5, 0.4, 0, 0]}
+    bad_price = {**good, "price": -1}
+
+    response = client.post(
+        "/barrels/plan", json=[good, bad_sum, bad_price], headers=HEADERS
+    )
+
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert [(e["loc"], e["msg"]) for e in detail] == [
+        (
+            ["body", 1, "potion_type"],
+            "Value error, Sum of potion_type values must be exactly 1.0",
+        ),
+        (["body", 2, "price"], "Input should be greater than or equal to 0"),
+    ]
+
+    response = client.post(
+        "/barrels/deliver/bulk-parse-missing",
+        content=b"",
+        headers={**HEADERS, "Content-Type": "application/json"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "missing"
@@ -1,4 +1,11 @@
-from src.api.bottler import create_bottle_plan
+from src.api.bottler import (
+    create_bottle_plan,
+    create_revenue_bottle_plan,
+    plan_bottle_delivery,
+    PotionMixes,
+)
+from src.catalog_registry import CatalogPotion
+from typing import Any, Dict
 
 
 def test_bottle_red_potions() -> None:
@@ -26,3 +33,75 @@ def test_bottle_red_potions() -> None:
     assert len(result) == 1
     assert result[0].potion_type == [100, 0, 0, 0]
     assert result[0].quantity == 5
+
+
+def test_bulk_delivery_skips_missing_recipe_and_short_liquid() -> None:
+    red = CatalogPotion(
+        sku="RED",
+        name="Red",
+        r=100,
+        g=0,
+        b=0,
+        d=0,
+        price=50,
+        active=True,
+        listed=True,
+    )
+    recipes = {(100, 0, 0, 0): red}
+    liquid = {"red_ml": 500, "green_ml": 0, "blue_ml": 0, "dark_ml": 0}
+
+    delivery = plan_bottle_delivery(
+        [
+            PotionMixes(potion_type=[100, 0, 0, 0], quantity=3),
+            PotionMixes(potion_type=[0, 100, 0, 0], quantity=1),  # no recipe
+            PotionMixes(potion_type=[100, 0, 0, 0], quantity=3),  # only 200ml left
+            PotionMixes(potion_type=[100, 0, 0, 0], quantity=2),
+        ],
+        recipes,
+        liquid,
+    )
+
+    assert delivery.potions == {"RED": 5}
+    assert delivery.ml_used == {
+        "red_ml": 500,
+        "green_ml": 0,
+        "blue_ml": 0,
+        "dark_ml": 0,
+    }
+
+
+def test_revenue_plan_prefers_price_over_color_count() -> None:
+    # greedy bottles the two-color potion first and strands the red
+    potion_catalog = [(50, 50, 0, 0, 10), (100, 0, 0, 0, 60), (0, 100, 0, 0, 60)]
+    kwargs: Dict[str, Any] = dict(
+        red_ml=200,
+        green_ml=200,
+        blue_ml=0,
+        dark_ml=0,
+        maximum_potion_capacity=100,
+        current_potion_count=0,
+        potion_catalog=potion_catalog,
+    )
+
+    greedy = create_bottle_plan(**kwargs)
+    assert [(m.potion_type, m.quantity) for m in greedy] == [([50, 50, 0, 0], 4)]
+
+    result = create_revenue_bottle_plan(**kwargs)
+    assert sorted((m.potion_type, m.quantity) for m in result) == [
+        ([0, 100, 0, 0], 2),
+        ([100, 0, 0, 0], 2),
+    ]
+
+
+def test_revenue_plan_respects_capacity() -> None:
+    result = create_revenue_bottle_plan(
+        red_ml=1000,
+        green_ml=0,
+        blue_ml=0,
+        dark_ml=0,
+        maximum_potion_capacity=10,
+        current_potion_count=7,
+        potion_catalog=[(100, 0, 0, 0, 5)],
+    )
+
+    assert [(m.potion_type, m.quantity) for m in result] == [([100, 0, 0, 0], 3)]
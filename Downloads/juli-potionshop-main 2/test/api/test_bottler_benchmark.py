@@ -0,0 +1,103 @@
+"""
+Revenue planner vs greedy bottle plan on random catalogs of up to 1,000
+recipes. Prints solve-time percentiles and revenue uplift per catalog size;
+run alone with
+
+    uv run pytest -m benchmark -q
+"""
+
+import random
+import time
+from typing import Dict, List, Tuple
+import pytest
+from src.api.bottler import (
+    PotionMixes,
+    create_bottle_plan,
+    create_revenue_bottle_plan,
+)
+
+SIZES = [10, 100, 1000]
+TRIALS = 20
+
+Recipe = Tuple[int, int, int, int]
+# a recipe and its price, as potion_catalog rows
+CatalogRow = Tuple[int, int, int, int, int]
+
+
+def random_recipe(rng: random.Random) -> Recipe:
+    colors = rng.sample(range(4), rng.randint(1, 4))
+    cuts = sorted(rng.sample(range(1, 20), len(colors) - 1))
+    parts = [(b - a) * 5 for a, b in zip([0] + cuts, cuts + [20])]
+    recipe = [0, 0, 0, 0]
+    for color, part in zip(colors, parts):
+        recipe[color] = part
+    return (recipe[0], recipe[1], recipe[2], recipe[3])
+
+
+def random_catalog(rng: random.Random, size: int) -> List[CatalogRow]:
+    unique = {random_recipe(rng) for _ in range(size * 2)}
+    recipes = rng.sample(sorted(unique), min(size, len(unique)))
+    return [(*recipe, rng.randint(10, 100)) for recipe in recipes]
+
+
+def revenue(plan: List[PotionMixes], catalog: List[CatalogRow]) -> int:
+    prices: Dict[tuple, int] = {}
+    for *recipe, price in catalog:
+        prices[tuple(recipe)] = max(price, prices.get(tuple(recipe), price))
+    return sum(prices[tuple(m.potion_type)] * m.quantity for m in plan)
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@pytest.mark.benchmark
+def test_revenue_planner_benchmark(capsys) -> None:
+    rng = random.Random(7)
+    lines = [
+        f"{'recipes':>7} {'planner':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'revenue':>9} {'uplift':>7}"
+    ]
+    for size in SIZES:
+        times: Dict[str, List[float]] = {"greedy": [], "revenue": []}
+        totals: Dict[str, int] = {"greedy": 0, "revenue": 0}
+        for _ in range(TRIALS):
+            catalog = random_catalog(rng, size)
+            liquid = [rng.randint(0, 20000) for _ in range(4)]
+            red, green, blue, dark = liquid
+            capacity = rng.choice([50, 500, 5000])
+            current = rng.randint(0, capacity // 2)
+
+            for name, planner in (
+                ("greedy", create_bottle_plan),
+                ("revenue", create_revenue_bottle_plan),
+            ):
+                start = time.perf_counter()
+                plan = planner(red, green, blue, dark, capacity, current, catalog)
+                times[name].append(time.perf_counter() - start)
+                totals[name] += revenue(plan, catalog)
+
+                # every plan must fit the liquid and the capacity
+                used = [
+                    sum(m.potion_type[c] * m.quantity for m in plan) for c in range(4)
+                ]
+                assert all(u <= have for u, have in zip(used, liquid))
+                assert sum(m.quantity for m in plan) <= capacity - current
+
+            assert revenue(plan, catalog) >= revenue(
+                create_bottle_plan(red, green, blue, dark, capacity, current, catalog),
+                catalog,
+            )
+
+        for name in ("greedy", "revenue"):
+            ms = [t * 1000 for t in times[name]]
+            uplift = totals[name] / totals["greedy"] - 1 if totals["greedy"] else 0
+            lines.append(
+                f"{size:>7} {name:>8} {percentile(ms, 0.5):>6.2f}ms "
+                f"{percentile(ms, 0.95):>6.2f}ms {percentile(ms, 0.99):>6.2f}ms "
+                f"{totals[name] / TRIALS:>9.0f} {uplift:>6.1%}"
+            )
+
+    with capsys.disabled():
+        print("\n" + "\n".join(lines))
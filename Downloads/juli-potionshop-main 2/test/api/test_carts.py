@@ -0,0 +1,214 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List
+import pytest
+import sqlalchemy
+from fastapi import HTTPException
+from src import database as db
+from src.api.admin import reset_game_state
+from src.api.carts import (
+    CartCheckout,
+    SearchCursor,
+    SearchResponse,
+    SearchSortOptions,
+    SearchSortOrder,
+    checkout,
+    checkout_key,
+    decode_cursor,
+    encode_cursor,
+    run_search,
+)
+from src.catalog_registry import registry as catalog_registry
+from test.api.test_endpoints import db_is_available
+
+STOCK = 50
+CARTS = 200
+WORKERS = 16
+
+
+def delete_potion_rows(conn, sku: str) -> None:
+    """Removes a test potion: its carts and their items, stock and rollups."""
+    cart_ids = list(
+        conn.execute(
+            sqlalchemy.text("SELECT cart_id FROM cart_items WHERE potion_sku = :sku"),
+            {"sku": sku},
+        ).scalars()
+    )
+    for table in ("cart_items", "carts"):
+        column = "cart_id" if table == "cart_items" else "id"
+        conn.execute(
+            sqlalchemy.text(f"DELETE FROM {table} WHERE {column} IN :ids").bindparams(
+                sqlalchemy.bindparam("ids", expanding=True)
+            ),
+            {"ids": cart_ids},
+        )
+    for table in ("failed_checkouts", "failed_checkouts_hourly", "sales_hourly"):
+        conn.execute(
+            sqlalchemy.text(f"DELETE FROM {table} WHERE potion_sku = :sku"),
+            {"sku": sku},
+        )
+    for table in ("potion_inventory", "potion_catalog"):
+        conn.execute(
+            sqlalchemy.text(f"DELETE FROM {table} WHERE sku = :sku"), {"sku": sku}
+        )
+
+
+@pytest.fixture
+def stress_potion():
+    yield
+    with db.engine.begin() as conn:
+        # the checkouts' ledger entries, gold and stored responses
+        reset_game_state(conn)
+        delete_potion_rows(conn, "STRESS_POTION")
+    catalog_registry.invalidate()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_parallel_checkouts_never_oversell(stress_potion) -> None:
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_catalog (sku, name, price, r, g, b, d, active)
+            VALUES ('STRESS_POTION', 'Stress Potion', 10, 100, 0, 0, 0, TRUE)
+            ON CONFLICT (sku) DO UPDATE SET price = 10
+        """)
+        )
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_inventory (sku, quantity)
+            VALUES ('STRESS_POTION', :stock)
+            ON CONFLICT (sku) DO UPDATE SET quantity = :stock
+        """),
+            {"stock": STOCK},
+        )
+        cart_ids = [
+            conn.execute(
+                sqlalchemy.text("""
+                INSERT INTO carts (customer_name) VALUES ('stress') RETURNING id
+            """)
+            ).scalar_one()
+            for _ in range(CARTS)
+        ]
+        for cart_id in cart_ids:
+            conn.execute(
+                sqlalchemy.text("""
+                INSERT INTO cart_items (cart_id, potion_sku, quantity)
+                VALUES (:cart_id, 'STRESS_POTION', 1)
+            """),
+                {"cart_id": cart_id},
+            )
+    catalog_registry.invalidate()
+
+    async def attempt(cart_id: int, slots: asyncio.Semaphore) -> bool:
+        async with slots:
+            try:
+                await checkout(
+                    cart_id, CartCheckout(payment="gold"), checkout_key(cart_id)
+                )
+                return True
+            except HTTPException as e:
+                assert e.detail == "Not enough of STRESS_POTION in stock"
+                return False
+
+    async def attempt_all() -> List[bool]:
+        slots = asyncio.Semaphore(WORKERS)
+        return await asyncio.gather(*(attempt(cart_id, slots) for cart_id in cart_ids))
+
+    start = time.perf_counter()
+    results = asyncio.run(attempt_all())
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{CARTS} checkouts, {WORKERS} at a time, in {elapsed:.2f}s "
+        f"({CARTS / elapsed:.0f} checkouts/s), {sum(results)} succeeded"
+    )
+
+    with db.engine.begin() as conn:
+        remaining = conn.execute(
+            sqlalchemy.text(
+                "SELECT quantity FROM potion_inventory WHERE sku = 'STRESS_POTION'"
+            )
+        ).scalar_one()
+
+    assert sum(results) == STOCK
+    assert remaining == 0
+
+
+def test_search_cursor_round_trip() -> None:
+    cursor = SearchCursor(
+        sort_col=SearchSortOptions.timestamp,
+        sort_order=SearchSortOrder.desc,
+        sort_key=datetime(2025, 5, 16, 11, 47, 5),
+        line_item_id=1234,
+        backwards=True,
+    )
+
+    token = encode_cursor(cursor)
+
+    assert not token.isdigit()
+    assert decode_cursor(token) == cursor
+
+
+def test_search_cursor_rejects_garbage() -> None:
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("not-a-cursor")
+    assert e.value.status_code == 400
+
+
+def search_null_paging(token: str, sort_order: SearchSortOrder) -> SearchResponse:
+    with db.engine.begin() as conn:
+        return run_search(
+            conn,
+            "",
+            "NULL_PAGING",
+            token,
+            SearchSortOptions.customer_name,
+            sort_order,
+        )
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+@pytest.mark.parametrize("sort_order", list(SearchSortOrder))
+def test_search_pages_across_null_sort_keys(sort_order: SearchSortOrder) -> None:
+    with db.engine.begin() as conn:
+        delete_potion_rows(conn, "NULL_PAGING")
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_catalog (sku, name, price, r, g, b, d, active)
+            VALUES ('NULL_PAGING', 'Null Paging', 10, 100, 0, 0, 0, FALSE)
+        """)
+        )
+        # 120 line items, every third on a cart without a customer name
+        for i in range(120):
+            cart_id = conn.execute(
+                sqlalchemy.text("""
+                INSERT INTO carts (customer_name) VALUES (:name) RETURNING id
+            """),
+                {"name": None if i % 3 == 0 else f"paging {i % 7}"},
+            ).scalar_one()
+            conn.execute(
+                sqlalchemy.text("""
+                INSERT INTO cart_items (cart_id, potion_sku, quantity)
+                VALUES (:cart_id, 'NULL_PAGING', 1)
+            """),
+                {"cart_id": cart_id},
+            )
+
+    try:
+        pages = [search_null_paging("", sort_order)]
+        while pages[-1].next is not None:
+            pages.append(search_null_paging(pages[-1].next, sort_order))
+        forwards = [item.line_item_id for page in pages for item in page.results]
+        assert len(forwards) == len(set(forwards)) == 120
+
+        # and back again from the last page
+        page = pages[-1]
+        backwards = [item.line_item_id for item in page.results]
+        while page.previous is not None:
+            page = search_null_paging(page.previous, sort_order)
+            backwards[:0] = [item.line_item_id for item in page.results]
+        assert backwards == forwards
+    finally:
+        with db.engine.begin() as conn:
+            delete_potion_rows(conn, "NULL_PAGING")
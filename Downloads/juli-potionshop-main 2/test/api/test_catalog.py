@@ -0,0 +1,135 @@
+import asyncio
+from typing import List
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from src import catalog_registry
+from src import database as db
+from src.api.catalog import CatalogCache, CatalogItem, etag_matches
+from src.api.server import app
+from test.api.test_endpoints import db_is_available
+
+client = TestClient(app)
+
+ITEM = CatalogItem(
+    sku="RED_POTION",
+    name="red potion",
+    quantity=3,
+    price=50,
+    potion_type=[100, 0, 0, 0],
+)
+
+
+def test_concurrent_misses_build_once() -> None:
+    builds = 0
+
+    async def build() -> List[CatalogItem]:
+        nonlocal builds
+        builds += 1
+        await asyncio.sleep(0.05)
+        return [ITEM]
+
+    async def fetch_concurrently():
+        cache = CatalogCache(build)
+        return await asyncio.gather(*(cache.get() for _ in range(8)))
+
+    results = asyncio.run(fetch_concurrently())
+
+    assert builds == 1
+    assert len({result.etag for result in results}) == 1
+
+
+def test_invalidate_during_build_is_not_cached() -> None:
+    builds = 0
+
+    async def build() -> List[CatalogItem]:
+        nonlocal builds
+        builds += 1
+        if builds == 1:
+            cache.invalidate()
+        return [ITEM]
+
+    async def fetch_twice():
+        await cache.get()
+        await cache.get()
+
+    cache = CatalogCache(build)
+    asyncio.run(fetch_twice())
+
+    assert builds == 2
+
+
+def test_etag_matches() -> None:
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"xyz"', etag)
+    assert not etag_matches(None, etag)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_catalog_not_modified() -> None:
+    first = client.get("/catalog/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = client.get("/catalog/", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert second.content == b""
+
+
+REGISTRY_SKU = "REGISTRY_TEST"
+
+
+def registry_skus() -> set:
+    with db.engine.connect() as conn:
+        return set(catalog_registry.registry.get(conn).by_sku)
+
+
+@pytest.fixture
+def registry_potion():
+    catalog_registry.registry.invalidate()
+    registry_skus()  # a cached, freshly checked snapshot
+    yield
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("DELETE FROM potion_catalog WHERE sku = :sku"),
+            {"sku": REGISTRY_SKU},
+        )
+    catalog_registry.registry.invalidate()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_registry_sees_writes_from_this_process(registry_potion) -> None:
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_catalog (sku, name, r, g, b, d, price, active)
+                VALUES (:sku, 'Registry Test', 0, 0, 0, 100, 10, TRUE)
+            """),
+            {"sku": REGISTRY_SKU},
+        )
+        catalog_registry.registry.wrote(conn)
+    assert REGISTRY_SKU in registry_skus()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_registry_sees_other_writers_within_the_check_interval(
+    registry_potion, monkeypatch
+) -> None:
+    # an unmarked write, as another worker or a SQL console makes
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+                INSERT INTO potion_catalog (sku, name, r, g, b, d, price, active)
+                VALUES (:sku, 'Registry Test', 0, 0, 0, 100, 10, TRUE)
+            """),
+            {"sku": REGISTRY_SKU},
+        )
+
+    # stale until the version is checked again, at most VERSION_CHECK_INTERVAL
+    assert REGISTRY_SKU not in registry_skus()
+    monkeypatch.setattr(catalog_registry, "VERSION_CHECK_INTERVAL", 0.0)
+    assert REGISTRY_SKU in registry_skus()
@@ -154,3 +154,36 @@ def test_inventory_values_after_delivery():
     assert isinstance(audit["ml_in_barrels"], int)
     assert isinstance(audit["gold"], int)
     assert isinstance(audit["number_of_potions"], int)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_liquid_snapshot_matches_ledger():
+    client.post("/admin/reset", headers=HEADERS)
+
+    barrel = [
+        {
+            "sku": "SMALL_RED_BARREL",
+            "ml_per_barrel": 500,
+            "potion_type": [0.5, 0.5, 0.0, 0.0],
+            "price": 10,
+            "quantity": 2,
+        }
+    ]
+    order_id = "33333333-3333-3333-3333-333333333333"
+    response = client.post(f"/barrels/deliver/{order_id}", json=barrel, headers=HEADERS)
+    assert response.status_code == 204
+
+    # a liquid row written outside of the snapshot is picked up as tail
+    with db.engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
+            VALUES ('liquid', 'blue_ml', 40, 'manual', 'test')
+        """)
+        )
+
+    response = client.get("/admin/reconcile/liquid", headers=HEADERS)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["matches"] is True
+    assert result["snapshot"]["blue_ml"] == result["recomputed"]["blue_ml"]
@@ -0,0 +1,57 @@
+import asyncio
+import uuid
+import pytest
+from src import idempotency
+from src.idempotency import IdempotencyKey, RecentKeys
+from test.api.test_endpoints import db_is_available
+
+
+def test_recent_keys_evicts_least_recently_used() -> None:
+    recent = RecentKeys(capacity=2)
+    recent.put("a", 1)
+    recent.put("b", 2)
+    recent.get("a")
+    recent.put("c", 3)
+
+    assert recent.get("a") == (True, 1)
+    assert recent.get("b") == (False, None)
+    assert recent.get("c") == (True, 3)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_retry_replays_stored_response_without_rerunning() -> None:
+    order_id = f"test-{uuid.uuid4()}"
+    calls = []
+
+    def work(connection, amount: int) -> dict:
+        calls.append(amount)
+        return {"paid": amount}
+
+    first = IdempotencyKey(order_id)
+    assert asyncio.run(first.run(work, 7)) == {"paid": 7}
+    assert not first.replayed
+
+    # once from the in-process cache, once from the stored row
+    for clear_cache in (False, True):
+        if clear_cache:
+            idempotency.recent.clear()
+        retry = IdempotencyKey(order_id)
+        assert asyncio.run(retry.run(work, 99)) == {"paid": 7}
+        assert retry.replayed
+
+    assert calls == [7]
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_failed_attempt_releases_the_key() -> None:
+    order_id = f"test-{uuid.uuid4()}"
+
+    def fail(connection) -> None:
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(IdempotencyKey(order_id).run(fail))
+
+    retry = IdempotencyKey(order_id)
+    assert asyncio.run(retry.run(lambda connection: "ok")) == "ok"
+    assert not retry.replayed
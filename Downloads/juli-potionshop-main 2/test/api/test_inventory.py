@@ -0,0 +1,117 @@
+import pytest
+import sqlalchemy
+from src import database as db
+from src import inventory_summary
+from src import metrics
+from src.api.admin import reconcile_inventory_summary, reset_game_state
+from src.api.inventory import audit_inventory
+from test.api.test_endpoints import db_is_available
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_summary_follows_inventory_writes() -> None:
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        conn.execute(
+            sqlalchemy.text("""
+            UPDATE liquid_inventory SET red_ml = red_ml + 500, dark_ml = 20
+        """)
+        )
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_inventory (sku, quantity)
+            VALUES ('SUMMARY_A', 4), ('SUMMARY_B', 7)
+        """)
+        )
+        conn.execute(
+            sqlalchemy.text("""
+            UPDATE potion_inventory SET quantity = quantity - 1
+            WHERE sku = 'SUMMARY_B'
+        """)
+        )
+        conn.execute(
+            sqlalchemy.text("DELETE FROM potion_inventory WHERE sku = 'SUMMARY_A'")
+        )
+        conn.execute(sqlalchemy.text("UPDATE gold_inventory SET amount = amount - 30"))
+
+    with db.engine.begin() as conn:
+        reconciliation = reconcile_inventory_summary(conn)
+    assert reconciliation.matches
+    assert reconciliation.summary.model_dump() == {
+        "number_of_potions": 6,
+        "ml_in_barrels": 520,
+        "gold": 70,
+    }
+
+    with db.engine.begin() as conn:
+        before = inventory_summary.read_totals(conn)
+        assert inventory_summary.fold(conn) > 0
+        assert inventory_summary.read_totals(conn) == before
+        assert reconcile_inventory_summary(conn).matches
+
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        assert reconcile_inventory_summary(conn).matches
+
+
+@pytest.mark.skipif(
+    not db_is_available() or db.engine.dialect.name != "postgresql",
+    reason="Postgres not available",
+)
+def test_inventory_writes_dont_wait_on_the_summary() -> None:
+    # a bottler-style transaction holds liquid_inventory while a checkout
+    # takes a potion row the bottler wants next; neither may block on a
+    # summary lock the other holds
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO potion_inventory (sku, quantity) VALUES ('SUMMARY_LOCK', 5)
+        """)
+        )
+
+    bottler = db.engine.connect()
+    checkout = db.engine.connect()
+    try:
+        bottler.begin()
+        bottler.execute(
+            sqlalchemy.text("UPDATE liquid_inventory SET red_ml = red_ml + 100")
+        )
+
+        checkout.begin()
+        checkout.execute(sqlalchemy.text("SET LOCAL lock_timeout = '2s'"))
+        checkout.execute(
+            sqlalchemy.text("""
+            UPDATE potion_inventory SET quantity = quantity - 1
+            WHERE sku = 'SUMMARY_LOCK'
+        """)
+        )
+        checkout.commit()
+
+        bottler.execute(
+            sqlalchemy.text("""
+            UPDATE potion_inventory SET quantity = quantity + 2
+            WHERE sku = 'SUMMARY_LOCK'
+        """)
+        )
+        bottler.commit()
+    finally:
+        checkout.close()
+        bottler.close()
+
+    with db.engine.begin() as conn:
+        assert reconcile_inventory_summary(conn).matches
+        reset_game_state(conn)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_audit_is_one_statement() -> None:
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        with db.engine.begin() as conn:
+            audit_inventory(conn)
+    finally:
+        metrics.current_request.reset(token)
+
+    assert stats.statements == 1
@@ -0,0 +1,129 @@
+import pytest
+import sqlalchemy
+from src import database as db
+from src import ledger
+from src.api.admin import reconcile_ledger_checkpoints, reset_game_state
+from src.ledger import LedgerEntry
+from test.api.test_endpoints import db_is_available
+
+
+def balances(connection) -> dict:
+    return {
+        "gold": ledger.get_balance(connection, "gold"),
+        "potion": ledger.get_balance(connection, "potion"),
+        "liquid": ledger.get_liquid_balances(connection),
+        "recomputed": ledger.recompute_liquid_balances(connection),
+    }
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_compaction_twice_keeps_every_balance() -> None:
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        ledger.insert_entries(
+            conn,
+            [
+                LedgerEntry("potion", "RED", 5, "o1", "bottler"),
+                LedgerEntry("potion", "RED", -2, "o2", "checkout"),
+                LedgerEntry("potion", "GREEN", 3, "o1", "bottler"),
+                LedgerEntry("gold", None, -40, "o3", "barrels"),
+            ],
+        )
+        ledger.record_liquid(conn, {"red_ml": 500, "blue_ml": 100}, "o3", "barrels")
+    with db.engine.begin() as conn:
+        # written around the snapshot, so it must stay live as its tail
+        conn.execute(
+            sqlalchemy.text("""
+            INSERT INTO ledger_entries (category, sub_type, quantity, order_id, source)
+            VALUES ('liquid', 'blue_ml', 40, 'manual', 'test')
+        """)
+        )
+        before = balances(conn)
+
+    assert before["gold"] == 60
+    assert before["potion"] == 6
+    assert before["liquid"]["blue_ml"] == 140
+
+    moved = []
+    for _ in range(2):
+        with db.engine.begin() as conn:
+            moved.append(ledger.compact(conn, older_than="0 seconds"))
+        with db.engine.begin() as conn:
+            assert balances(conn) == before
+
+    # initial gold, 4 entries above and 2 liquid colors; the tail row stays
+    assert moved == [7, 0]
+    with db.engine.begin() as conn:
+        live = conn.execute(
+            sqlalchemy.text("SELECT order_id FROM ledger_entries")
+        ).scalars()
+        assert list(live) == ["manual"]
+
+        result = reconcile_ledger_checkpoints(conn)
+        assert result.matches
+        assert result.double_entries == 0
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_verifier_flags_a_tampered_checkpoint() -> None:
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+    with db.engine.begin() as conn:
+        ledger.compact(conn, older_than="0 seconds")
+        conn.execute(
+            sqlalchemy.text("""
+            UPDATE ledger_checkpoints SET quantity = quantity + 1
+            WHERE category = 'gold'
+        """)
+        )
+        result = reconcile_ledger_checkpoints(conn)
+
+    assert not result.matches
+    [gold] = [c for c in result.checkpoints if c.category == "gold"]
+    assert (gold.checkpoint_quantity, gold.archived_quantity) == (101, 100)
+
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+
+
+def count_entries(order_id: str) -> int:
+    with db.engine.connect() as conn:
+        return conn.execute(
+            sqlalchemy.text(
+                "SELECT COUNT(*) FROM ledger_entries WHERE order_id = :order_id"
+            ),
+            {"order_id": order_id},
+        ).scalar_one()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_writer_flushes_on_commit_and_drops_on_rollback() -> None:
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        ledger.writer(conn).append(LedgerEntry("gold", None, 5, "w1", "test"))
+        # the reset's starting gold and ours
+        assert len(ledger.writer(conn).entries) == 2
+        # reading the ledger in the same transaction writes it out first
+        assert ledger.get_balance(conn, "gold") == 105
+        assert ledger.writer(conn).entries == []
+    assert count_entries("w1") == 1
+
+    with pytest.raises(RuntimeError):
+        with db.engine.begin() as conn:
+            ledger.writer(conn).append(LedgerEntry("gold", None, 5, "w2", "test"))
+            raise RuntimeError
+    with db.engine.begin() as conn:
+        assert "ledger_writer" not in conn.info
+    assert count_entries("w2") == 0
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_big_batches_are_written_whole() -> None:
+    entries = [
+        LedgerEntry("potion", "RED", 1, "w3", "test")
+        for _ in range(ledger.COPY_THRESHOLD)
+    ]
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        ledger.writer(conn).extend(entries)
+    assert count_entries("w3") == ledger.COPY_THRESHOLD
@@ -0,0 +1,45 @@
+import json
+import logging
+from src.log import JsonFormatter, SamplingFilter, parse_levels
+
+
+def make_record(msg: str, **extra) -> logging.LogRecord:
+    record = logging.makeLogRecord({"name": "src.test", "msg": msg, "levelno": 10})
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_keeps_one_in_n_per_message() -> None:
+    sampler = SamplingFilter()
+
+    kept = [sampler.filter(make_record("hot loop", sample_every=10)) for _ in range(25)]
+    other = sampler.filter(make_record("other message", sample_every=10))
+
+    assert sum(kept) == 3
+    assert kept[0] and other
+
+
+def test_unsampled_records_always_pass() -> None:
+    sampler = SamplingFilter()
+    assert all(sampler.filter(make_record("plain")) for _ in range(5))
+
+
+def test_formatter_redacts_secret_values_and_keys() -> None:
+    formatter = JsonFormatter(["brat", ""])
+
+    line = formatter.format(
+        make_record("key was brat", access_token="whatever", order_id="abc")
+    )
+    entry = json.loads(line)
+
+    assert "brat" not in line
+    assert entry["msg"] == "key was ***"
+    assert entry["access_token"] == "***"
+    assert entry["order_id"] == "abc"
+
+
+def test_parse_levels() -> None:
+    assert parse_levels("src.api.barrels=debug, src.api.bottler=WARNING,") == {
+        "src.api.barrels": "DEBUG",
+        "src.api.bottler": "WARNING",
+    }
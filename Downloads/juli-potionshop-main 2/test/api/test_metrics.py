@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+from src import metrics
+from src.api.server import app
+from test.api.test_endpoints import HEADERS, db_is_available
+
+client = TestClient(app)
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    histogram = metrics.Histogram("demo_seconds", "Demo.", (0.1, 1))
+    labels = (("route", "/demo"),)
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(labels, value)
+
+    lines = histogram.render()
+
+    assert 'demo_seconds_bucket{route="/demo",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/demo",le="1"} 3' in lines
+    assert 'demo_seconds_bucket{route="/demo",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{route="/demo"} 4' in lines
+    assert 'demo_seconds_sum{route="/demo"} 4.05' in lines
+
+
+def test_requests_are_labelled_by_route_template() -> None:
+    client.get("/")
+    client.get("/no/such/path")
+
+    body = client.get("/metrics").text
+
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in body
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_statements_are_counted_per_request() -> None:
+    client.post("/inventory/plan", headers=HEADERS)
+
+    route = metrics.routes[("POST", "/inventory/plan")]
+
+    # one SELECT of gold_inventory; the sum is over every request so far
+    assert route.statements[-1] >= 1
+    assert route.db_seconds[-1] > 0
@@ -0,0 +1,96 @@
+import pytest
+import sqlalchemy
+from src import database as db
+from src import metrics
+from src import plan_cache
+from src.api.admin import reset_game_state
+from src.api.barrels import Barrel, plan_barrel_purchase
+from src.api.bottler import plan_bottles
+from test.api.test_endpoints import HEADERS, client, db_is_available
+
+CATALOG = [
+    Barrel(
+        sku="SMALL_RED_BARREL",
+        ml_per_barrel=500,
+        potion_type=[1.0, 0, 0, 0],
+        price=100,
+        quantity=10,
+    )
+]
+
+
+def count_statements(fn, *args):
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        with db.engine.begin() as conn:
+            result = fn(conn, *args)
+    finally:
+        metrics.current_request.reset(token)
+    return result, stats.statements
+
+
+def test_lru_keeps_the_most_recent_plans() -> None:
+    cache = plan_cache.PlanCache(2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]
+    cache.put("c", [3])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1] and cache.get("c") == [3]
+
+
+def test_a_new_tick_starts_the_cache_over() -> None:
+    plan_cache.record_tick("Hearthday", 2)
+    plan_cache.plans.put("plan", [1])
+
+    client.post(
+        "/info/current_time", headers=HEADERS, json={"day": "Hearthday", "hour": 2}
+    )
+    assert plan_cache.plans.get("plan") == [1]
+
+    client.post(
+        "/info/current_time", headers=HEADERS, json={"day": "Hearthday", "hour": 4}
+    )
+    assert len(plan_cache.plans) == 0
+    assert plan_cache.current_tick == ("Hearthday", 4)
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_plans_are_reused_until_inventory_changes() -> None:
+    with db.engine.begin() as conn:
+        reset_game_state(conn)
+        conn.execute(sqlalchemy.text("UPDATE gold_inventory SET amount = 1000"))
+    plan_cache.plans.clear()
+
+    first, _ = count_statements(plan_barrel_purchase, CATALOG)
+    again, statements = count_statements(plan_barrel_purchase, CATALOG)
+    assert again == first
+    # only the state version is read
+    assert statements == 1
+
+    # a different wholesale catalog is planned separately
+    cheaper = [CATALOG[0].model_copy(update={"price": 1})]
+    assert count_statements(plan_barrel_purchase, cheaper)[1] > 1
+
+    hits = metrics.plan_lookups._values.get(
+        (("planner", "bottler"), ("result", "hit")), 0
+    )
+    planned, _ = count_statements(plan_bottles)
+    assert count_statements(plan_bottles)[0] == planned
+    assert (
+        metrics.plan_lookups._values[(("planner", "bottler"), ("result", "hit"))]
+        == hits + 1
+    )
+
+    # a delivery moves the version, so both plans are computed afresh
+    with db.engine.begin() as conn:
+        conn.execute(sqlalchemy.text("UPDATE liquid_inventory SET red_ml = 500"))
+        conn.execute(
+            sqlalchemy.text("""
+            UPDATE liquid_balance_snapshot SET red_ml = 500 WHERE id = 1
+        """)
+        )
+    assert count_statements(plan_barrel_purchase, CATALOG)[1] > 1
+    assert count_statements(plan_bottles)[1] > 1
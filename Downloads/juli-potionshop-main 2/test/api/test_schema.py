@@ -0,0 +1,51 @@
+from typing import Dict
+import pytest
+import sqlalchemy
+from src import database as db
+from src import schema
+from src.sqlite_backend import now_minus, translate
+from test.api.test_endpoints import db_is_available
+
+
+def test_translate_rewrites_postgres_only_constructs() -> None:
+    statement = translate("""
+        SELECT response FROM t
+        WHERE name ILIKE ? ESCAPE '\\' AND created_at < now() - CAST(? AS INTERVAL)
+        FOR UPDATE SKIP LOCKED
+    """)
+    assert "ILIKE" not in statement and "LIKE ?" in statement
+    assert "now_minus(?)" in statement
+    assert "FOR UPDATE" not in statement
+
+    assert translate("SET response = CAST(? AS JSONB)") == "SET response = ?"
+
+
+def test_now_minus_understands_interval_units() -> None:
+    assert now_minus("1 hour") < now_minus("0 seconds")
+    assert now_minus("7 days") < now_minus("1 hour")
+
+
+@pytest.mark.skipif(
+    not db_is_available() or db.engine.dialect.name != "postgresql",
+    reason="Postgres not available",
+)
+def test_schema_matches_migrated_postgres() -> None:
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            sqlalchemy.text("""
+                SELECT table_name, column_name, is_nullable
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+            """)
+        ).fetchall()
+
+    migrated: Dict[str, Dict[str, bool]] = {}
+    for row in rows:
+        migrated.setdefault(row.table_name, {})[row.column_name] = (
+            row.is_nullable == "YES"
+        )
+
+    for table in schema.metadata.sorted_tables:
+        assert table.name in migrated, table.name
+        declared = {column.name: column.nullable for column in table.columns}
+        assert declared == migrated[table.name], table.name
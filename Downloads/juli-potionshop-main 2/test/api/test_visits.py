@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+import sqlalchemy
+from src import database as db
+from src import metrics
+from src import visits
+from test.api.test_endpoints import HEADERS, client, db_is_available
+
+
+def customers(n: int) -> list:
+    return [
+        {
+            "customer_id": str(i),
+            "customer_name": f"visitor_{i}",
+            "character_class": "Wizard" if i % 2 else "Rogue",
+            "level": 1 + i % 20,
+        }
+        for i in range(n)
+    ]
+
+
+def stored(visit_id: int) -> int:
+    with db.engine.connect() as conn:
+        return conn.execute(
+            sqlalchemy.text(
+                "SELECT COUNT(*) FROM customer_visits WHERE visit_id = :visit_id"
+            ),
+            {"visit_id": visit_id},
+        ).scalar_one()
+
+
+@pytest.fixture
+def clean_visits():
+    visits.pending.take()
+    with db.engine.begin() as conn:
+        conn.execute(sqlalchemy.text("DELETE FROM customer_visits"))
+    yield
+    visits.pending.take()
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_visits_are_queued_then_flushed_once(clean_visits) -> None:
+    for _ in range(2):
+        response = client.post("/carts/visits/7", headers=HEADERS, json=customers(300))
+        assert response.status_code == 204
+
+    # the request path never touches the database
+    route = metrics.routes[("POST", "/carts/visits/{visit_id}")]
+    assert route.statements[-1] == 0
+    assert stored(7) == 0
+
+    assert asyncio.run(visits.flush()) == 600
+    # the replayed batch collided with the first on (visit_id, position)
+    assert stored(7) == 300
+    assert len(visits.pending) == 0
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_big_flushes_are_stored_whole(clean_visits) -> None:
+    batch = customers(visits.COPY_THRESHOLD)
+    client.post("/carts/visits/8", headers=HEADERS, json=batch)
+    client.post("/carts/visits/8", headers=HEADERS, json=batch)
+    asyncio.run(visits.flush())
+
+    assert stored(8) == visits.COPY_THRESHOLD
+
+
+@pytest.mark.skipif(not db_is_available(), reason="DB not available")
+def test_rejected_batch_does_not_block_the_rest(clean_visits) -> None:
+    response = client.post(
+        f"/carts/visits/{visits.MAX_VISIT_ID + 1}", headers=HEADERS, json=customers(3)
+    )
+    assert response.status_code == 422
+
+    # queued past the endpoint's check, ahead of a good batch
+    bad = client.post("/carts/visits/1", headers=HEADERS, json=customers(3))
+    assert bad.status_code == 204
+    for visit in visits.pending._visits:
+        visit.visit_id = visits.MAX_VISIT_ID + 1
+    client.post("/carts/visits/5", headers=HEADERS, json=customers(3))
+
+    assert asyncio.run(visits.flush()) == 3
+    assert stored(5) == 3
+    assert len(visits.pending) == 0
+
+
+def test_full_queue_asks_the_game_to_retry(monkeypatch) -> None:
+    visits.pending.take()
+    monkeypatch.setattr(visits.pending, "capacity", 10)
+
+    response = client.post("/carts/visits/9", headers=HEADERS, json=customers(11))
+    assert response.status_code == 503
+    assert len(visits.pending) == 0